@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Iterable, Iterator
+from dotenv import load_dotenv
+from custom_types import ArtifactRef
+from metrics import external
+import clients
+
+load_dotenv()
+
+# --------------------------------------------------
+# Artifact store for large step results
+# --------------------------------------------------
+# Inngest stores every step's output and sends it back on each later call,
+# so big intermediate results are written here instead and the step returns
+# an ArtifactRef of constant size. Artifacts are gzipped JSON lines named by
+# the sha256 of their content; writing the same content twice is a no-op.
+
+ARTIFACT_BACKEND = os.getenv("ARTIFACT_BACKEND", "local")  # or "supabase" when workers don't share a disk
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", ".cache/artifacts")
+ARTIFACT_BUCKET = os.getenv("ARTIFACT_BUCKET", "artifacts")
+# Artifacts only need to outlive the function run that made them
+ARTIFACT_TTL_HOURS = float(os.getenv("ARTIFACT_TTL_HOURS", "24"))
+
+
+class LocalArtifacts:
+    def __init__(self, root=ARTIFACT_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.jsonl.gz")
+
+    def save(self, key: str, tmp_path: str):
+        os.replace(tmp_path, self._path(key))
+
+    def open(self, key: str):
+        return open(self._path(key), "rb")
+
+    def sweep(self, max_age_seconds: float) -> int:
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".jsonl.gz") and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        return removed
+
+
+class SupabaseArtifacts:
+    """
+    Artifacts in a Supabase Storage bucket, for workers on different machines.
+    """
+
+    def __init__(self, client, bucket=ARTIFACT_BUCKET):
+        self.client = client
+        self.bucket = bucket
+
+    def _name(self, key):
+        return f"{key}.jsonl.gz"
+
+    def save(self, key: str, tmp_path: str):
+        try:
+            with open(tmp_path, "rb") as f, external("supabase", "artifact_upload"):
+                self.client.storage.from_(self.bucket).upload(
+                    self._name(key), f.read(), {"content-type": "application/gzip", "upsert": "true"}
+                )
+        finally:
+            os.remove(tmp_path)
+
+    def open(self, key: str):
+        with external("supabase", "artifact_download"):
+            data = self.client.storage.from_(self.bucket).download(self._name(key))
+        f = tempfile.TemporaryFile()
+        f.write(data)
+        f.seek(0)
+        return f
+
+    def sweep(self, max_age_seconds: float) -> int:
+        bucket = self.client.storage.from_(self.bucket)
+        cutoff = time.time() - max_age_seconds
+        old = []
+        offset = 0
+        while True:
+            page = bucket.list("", {"limit": 1000, "offset": offset, "sortBy": {"column": "created_at", "order": "asc"}})
+            for item in page:
+                created = item.get("created_at")
+                if created and _timestamp(created) < cutoff:
+                    old.append(item["name"])
+            if len(page) < 1000:
+                break
+            offset += len(page)
+        for i in range(0, len(old), 1000):
+            bucket.remove(old[i:i + 1000])
+        return len(old)
+
+
+def _timestamp(iso: str) -> float:
+    return datetime.fromisoformat(iso.replace("Z", "+00:00")).timestamp()
+
+
+def get_store():
+    """
+    Process-wide artifact store for ARTIFACT_BACKEND.
+    """
+
+    def make():
+        if ARTIFACT_BACKEND == "supabase":
+            return SupabaseArtifacts(clients.supabase())
+        return LocalArtifacts()
+
+    return clients.shared("artifacts", make)
+
+
+def write_lines(store, items: Iterable) -> ArtifactRef:
+    """
+    Streams JSON-serialisable items into a new artifact, hashing as it
+    goes, so the items never have to be in memory at once.
+    """
+    digest = hashlib.sha256()
+    count = size = 0
+    fd, tmp_path = tempfile.mkstemp(suffix=".jsonl.gz")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as gz:
+            for item in items:
+                line = (json.dumps(item) + "\n").encode("utf-8")
+                digest.update(line)
+                gz.write(line)
+                count += 1
+                size += len(line)
+        stored = os.path.getsize(tmp_path)
+        key = digest.hexdigest()
+        store.save(key, tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return ArtifactRef(key=key, items=count, size=size, stored_size=stored)
+
+
+def read_lines(store, ref: ArtifactRef) -> Iterator:
+    """
+    Yields the items of an artifact one at a time.
+    """
+    with store.open(ref.key) as raw, gzip.GzipFile(fileobj=raw, mode="rb") as gz:
+        for line in gz:
+            yield json.loads(line)
+
@@ -0,0 +1,197 @@
+"""
+Built-in chunker vs. the llama-index SentenceSplitter it replaced:
+throughput, import cost and output parity on the same page texts.
+
+    python -m benchmarks.bench_chunker --pages 200
+    python -m benchmarks.bench_chunker --pdf manual.pdf report.pdf
+
+Pages come from generated PDFs (benchmarks.fakes.make_pdf) or --pdf files,
+extracted once with pypdf so both sides chunk identical text. The old side
+reproduces the previous data_loader.iter_chunks streaming exactly and needs
+llama-index-core installed; without it only the new chunker is measured.
+
+Parity: chunk counts and sizes (in the splitter's own tokens), how many
+chunks end at a sentence, how closely each old chunk is matched by some new
+chunk (best overlap / union of their character spans, averaged), and whether
+every (page, char_offset) points at the chunk's text.
+
+The run fails if the new chunks' p95 size is over CHUNK_SIZE tokens, or if
+its mean size is off the old one by more than --tolerance on a document
+the old splitter cut into at least --min-chunks chunks (fewer are too
+noisy to compare). Offline, point TIKTOKEN_CACHE_DIR at a copy of the
+cl100k_base file (llama-index ships one in llama_index/core/_static).
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from pypdf import PdfReader
+
+from chunker import CHUNK_OVERLAP, CHUNK_SIZE, chunk_pages
+
+# The old streaming window in data_loader
+LEGACY_WINDOW_CHARS = 32000
+
+
+def legacy_chunks(pages, splitter):
+    buffer = ""
+    for page_text in pages:
+        buffer = f"{buffer} {page_text}" if buffer else page_text
+        if len(buffer) < LEGACY_WINDOW_CHARS:
+            continue
+        chunks = splitter.split_text(buffer)
+        if len(chunks) > 1:
+            yield from chunks[:-1]
+            buffer = chunks[-1]
+    if buffer.strip():
+        yield from splitter.split_text(buffer)
+
+
+def iter_pages(path):
+    # As data_loader.iter_pages, without importing the Gemini client
+    for page in PdfReader(path).pages:
+        yield page.extract_text() or ""
+
+
+def import_seconds(module: str) -> float:
+    # Fresh interpreter, so nothing is already imported
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-W", "ignore", "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip())
+
+
+def timed(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def chunk_spans(doc: str, texts):
+    # Where each chunk sits in the joined document, found left to right
+    spans, cursor = [], 0
+    for text in texts:
+        i = doc.find(text, cursor)
+        if i == -1:
+            continue
+        spans.append((i, i + len(text)))
+        cursor = i + 1
+    return spans
+
+
+def mean_best_iou(old, new):
+    total, j = 0.0, 0
+    for start, end in old:
+        # Spans are sorted; skip new ones that end before this one starts
+        while j < len(new) and new[j][1] <= start:
+            j += 1
+        best, k = 0.0, j
+        while k < len(new) and new[k][0] < end:
+            inter = min(end, new[k][1]) - max(start, new[k][0])
+            best = max(best, inter / (max(end, new[k][1]) - min(start, new[k][0])))
+            k += 1
+        total += best
+    return total / max(len(old), 1)
+
+
+def offsets_ok(pages, records) -> float:
+    good = 0
+    for r in records:
+        page = pages[r["page"] - 1]
+        head = r["text"][: len(page) - r["char_offset"]][:200]
+        good += page.startswith(head, r["char_offset"])
+    return good / max(len(records), 1)
+
+
+def sizes(texts, count):
+    lengths = [count(t) for t in texts]
+    return {
+        "chunks": len(texts),
+        "mean": round(statistics.fmean(lengths), 1) if lengths else 0,
+        "p95": sorted(lengths)[int(0.95 * (len(lengths) - 1))] if lengths else 0,
+        "sentence_ends": round(sum(t.rstrip()[-1:] in ".?!" for t in texts) / max(len(texts), 1), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf", nargs="*", default=None, help="PDFs to chunk instead of generated ones")
+    parser.add_argument("--pages", type=int, default=200, help="pages of the generated PDF")
+    parser.add_argument("--words-per-page", type=int, default=450)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N timings")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative difference of mean sizes")
+    parser.add_argument("--min-chunks", type=int, default=10, help="old chunks needed to compare mean sizes")
+    args = parser.parse_args()
+
+    documents = []
+    if args.pdf:
+        for path in args.pdf:
+            documents.append((path, list(iter_pages(path))))
+    else:
+        import os
+        import tempfile
+        from benchmarks.fakes import make_pdf
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(make_pdf(args.pages, args.words_per_page))
+        try:
+            documents.append((f"generated-{args.pages}p", list(iter_pages(path))))
+        finally:
+            os.remove(path)
+
+    try:
+        from llama_index.core.node_parser import SentenceSplitter
+        from llama_index.core.utils import get_tokenizer
+        splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        tokenizer = get_tokenizer()
+        count = lambda t: len(tokenizer(t))
+        unit = "tokens"
+    except ImportError:
+        splitter = None
+        count, unit = len, "chars"
+        print("llama-index-core not installed: measuring the new chunker only\n")
+
+    print(f"import chunker: {import_seconds('chunker') * 1000:.0f} ms")
+    if splitter is not None:
+        print(f"import SentenceSplitter: {import_seconds('llama_index.core.node_parser') * 1000:.0f} ms")
+
+    failures = []
+    for name, pages in documents:
+        doc = " ".join(pages)
+        mb = len(doc.encode("utf-8")) / 2**20
+        print(f"\n{name}: {len(pages)} pages, {mb:.2f} MB of text, sizes in {unit}")
+
+        new_s, records = timed(lambda: list(chunk_pages(pages)), args.repeat)
+        new_texts = [r["text"] for r in records]
+        new_sizes = sizes(new_texts, count)
+        print(f"  new     {mb / new_s:8.2f} MB/s  {new_sizes}")
+        print(f"          page/char_offset correct for {offsets_ok(pages, records):.1%} of chunks")
+
+        if splitter is None:
+            continue
+        old_s, old_texts = timed(lambda: list(legacy_chunks(pages, splitter)), args.repeat)
+        old_sizes = sizes(old_texts, count)
+        print(f"  old     {mb / old_s:8.2f} MB/s  {old_sizes}")
+
+        iou = mean_best_iou(chunk_spans(doc, old_texts), chunk_spans(doc, new_texts))
+        print(f"  speedup {old_s / new_s:8.1f}x")
+        print(f"  mean best span overlap of old chunks with new ones: {iou:.1%}")
+
+        if new_sizes["p95"] > CHUNK_SIZE:
+            failures.append(f"{name}: new p95 {new_sizes['p95']} tokens is over CHUNK_SIZE={CHUNK_SIZE}")
+        if old_sizes["chunks"] >= args.min_chunks:
+            drift = new_sizes["mean"] / old_sizes["mean"] - 1
+            print(f"  mean size {drift:+.1%} vs old (tolerance {args.tolerance:.0%})")
+            if abs(drift) > args.tolerance:
+                failures.append(f"{name}: new mean {new_sizes['mean']} tokens vs old {old_sizes['mean']}")
+
+    if failures:
+        sys.exit("chunk sizes do not match the old splitter:\n  " + "\n  ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
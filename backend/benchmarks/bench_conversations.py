@@ -0,0 +1,166 @@
+"""
+Query count and latency of GET /conversations, before and after removing the
+N+1 queries.
+
+    python -m benchmarks.bench_conversations --conversations 2000
+    python -m benchmarks.bench_conversations --url postgresql://localhost/cortex_bench
+
+Seeds a throwaway database (SQLite file by default) and fails if the new
+listing issues more than a constant number of queries.
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+from conversations import list_conversations
+from models import Base, Conversation, Message, UploadedPDF, User, conversation_pdfs
+
+MAX_QUERIES = 3
+
+
+def seed(db, n_conversations: int, messages_per: int, pdfs_per: int) -> str:
+    user_id = str(uuid.uuid4())
+    db.execute(insert(User).values(id=user_id, email=f"{user_id}@bench", hashed_password="x"))
+
+    t0 = datetime(2024, 1, 1)
+    conversations, messages, pdfs, links = [], [], [], []
+    for i in range(n_conversations):
+        cid = str(uuid.uuid4())
+        created = t0 + timedelta(minutes=i)
+        conversations.append({"id": cid, "user_id": user_id, "created_at": created})
+        for j in range(messages_per):
+            messages.append({
+                "id": str(uuid.uuid4()),
+                "conversation_id": cid,
+                "role": "user" if j % 2 == 0 else "assistant",
+                "content": f"question {j} about document set {i}",
+                "created_at": created + timedelta(seconds=j),
+            })
+        for _ in range(pdfs_per):
+            pid = str(uuid.uuid4())
+            pdfs.append({"id": pid, "user_id": user_id, "filename": f"{pid}.pdf", "file_path": f"{user_id}/{pid}.pdf"})
+            links.append({"conversation_id": cid, "pdf_id": pid})
+
+    db.execute(insert(Conversation), conversations)
+    db.execute(insert(Message), messages)
+    db.execute(insert(UploadedPDF), pdfs)
+    db.execute(insert(conversation_pdfs), links)
+    db.commit()
+    return user_id
+
+
+def list_conversations_n_plus_one(db, user_id):
+    """
+    The original implementation, kept here as the baseline.
+    """
+    conversations = (
+        db.query(Conversation)
+        .filter(Conversation.user_id == user_id)
+        .order_by(Conversation.created_at.desc())
+        .all()
+    )
+
+    result = []
+    for c in conversations:
+        first_message = db.query(Message).filter(
+            Message.conversation_id == c.id,
+            Message.role == "user"
+        ).order_by(Message.created_at).first()
+
+        title = first_message.content[:40] + "..." if first_message else "New Chat"
+        result.append({
+            "id": c.id,
+            "title": title,
+            "pdfs": [{"id": p.id, "filename": p.filename} for p in c.pdfs],
+            "created_at": c.created_at,
+        })
+    return result
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def measure(Session, counter, fn):
+    db = Session()
+    try:
+        counter.count = 0
+        start = time.perf_counter()
+        result = fn(db)
+        return result, counter.count, time.perf_counter() - start
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="database URL; defaults to a temporary SQLite file")
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=6)
+    parser.add_argument("--pdfs", type=int, default=2)
+    parser.add_argument("--page", type=int, default=50)
+    args = parser.parse_args()
+
+    tmp = None
+    url = args.url
+    if url is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".sqlite3", delete=False)
+        tmp.close()
+        url = f"sqlite:///{tmp.name}"
+
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    counter = QueryCounter(engine)
+
+    try:
+        db = Session()
+        user_id = seed(db, args.conversations, args.messages, args.pdfs)
+        db.close()
+
+        old, old_queries, old_time = measure(Session, counter, lambda db: list_conversations_n_plus_one(db, user_id))
+        print({"impl": "n+1 (all)", "rows": len(old), "queries": old_queries, "seconds": round(old_time, 3)})
+
+        page, queries, elapsed = measure(
+            Session, counter, lambda db: list_conversations(db, user_id, limit=args.page)
+        )
+        print({"impl": "keyset page", "rows": len(page), "queries": queries, "seconds": round(elapsed, 4)})
+
+        # Walk every page to compare against the full listing
+        rows, pages, total_queries, total_time, cursor = [], 0, 0, 0.0, None
+        while True:
+            batch, q, t = measure(
+                Session, counter, lambda db: list_conversations(db, user_id, limit=args.page, before=cursor)
+            )
+            if not batch:
+                break
+            rows.extend(batch)
+            pages += 1
+            total_queries += q
+            total_time += t
+            assert q <= MAX_QUERIES, f"page {pages} issued {q} queries"
+            cursor = batch[-1]["cursor"]
+        print({"impl": "keyset (all pages)", "rows": len(rows), "pages": pages,
+               "queries": total_queries, "seconds": round(total_time, 3)})
+
+        assert queries <= MAX_QUERIES, f"expected <= {MAX_QUERIES} queries, got {queries}"
+        assert [(r["id"], r["title"]) for r in rows] == [(r["id"], r["title"]) for r in old]
+    finally:
+        engine.dispose()
+        if tmp is not None:
+            os.remove(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
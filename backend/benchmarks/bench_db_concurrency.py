@@ -0,0 +1,168 @@
+"""
+Latency of the real API routes under parallel load, and how responsive the
+event loop stays meanwhile.
+
+    python -m benchmarks.bench_db_concurrency --url postgresql://localhost/cortex_bench
+    python -m benchmarks.bench_db_concurrency            # temporary SQLite
+
+The app is main.app against the given database (DATABASE_URL is set from
+--url before main is imported). SQLite needs aiosqlite for the async
+engine; it is in the dev dependency group (uv sync --group dev).
+
+`--parallel` clients each log in through /login and then loop over the
+real routes: POST /query-pdf (writes the question on the async engine;
+the Inngest send is stubbed out), GET /messages/{id} (async engine) and
+GET /conversations (sync session, threadpool). A probe route the
+benchmark adds is timed every few milliseconds: any blocking database
+call on the event loop stalls it, and its latency shows that.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summary(values):
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "p50_ms": round(statistics.median(values) * 1000, 2),
+        "p95_ms": round(pct(values, 0.95) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2),
+    }
+
+
+def seed(conversations, messages):
+    """
+    One user with `conversations` conversations of `messages` messages.
+    Returns (email, password, conversation ids).
+    """
+    from auth import hash_password
+    from db import SessionLocal, engine
+    from models import Base, Conversation, Message, User
+
+    Base.metadata.create_all(engine)
+    email, password = f"{uuid.uuid4().hex[:8]}@bench", "bench"
+    with SessionLocal() as db:
+        user = User(email=email, hashed_password=hash_password(password))
+        db.add(user)
+        db.flush()
+        ids = []
+        for _ in range(conversations):
+            conv = Conversation(id=str(uuid.uuid4()), user_id=user.id)
+            db.add(conv)
+            ids.append(conv.id)
+            db.add_all(
+                Message(conversation_id=conv.id, role="user" if i % 2 == 0 else "assistant", content=f"message {i}")
+                for i in range(messages)
+            )
+        db.commit()
+    return email, password, ids
+
+
+async def run(app, email, password, conversation_ids, parallel, seconds, ping_every):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    latency = {"query-pdf": [], "messages": [], "conversations": [], "ping": []}
+
+    def client():
+        # https: the auth cookie is Secure
+        return httpx.AsyncClient(transport=transport, base_url="https://bench")
+
+    async def timed(name, request):
+        start = time.perf_counter()
+        r = await request
+        r.raise_for_status()
+        latency[name].append(time.perf_counter() - start)
+
+    async def login():
+        c = client()
+        (await c.post("/login", json={"email": email, "password": password})).raise_for_status()
+        return c
+
+    # Log everyone in first; password hashing isn't what's measured
+    clients = await asyncio.gather(*(login() for _ in range(parallel)))
+    deadline = time.perf_counter() + seconds
+
+    async def user(i):
+        c = clients[i]
+        conv_id = conversation_ids[i % len(conversation_ids)]
+        while time.perf_counter() < deadline:
+            await timed("query-pdf", c.post("/query-pdf", json={"question": "why?", "conversation_id": conv_id}))
+            await timed("messages", c.get(f"/messages/{conv_id}"))
+            await timed("conversations", c.get("/conversations"))
+
+    async def pinger():
+        async with client() as c:
+            while time.perf_counter() < deadline:
+                await timed("ping", c.get("/bench-ping"))
+                await asyncio.sleep(ping_every)
+
+    try:
+        await asyncio.gather(pinger(), *(user(i) for i in range(parallel)))
+    finally:
+        for c in clients:
+            await c.aclose()
+    return {name: summary(values) for name, values in latency.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="database URL; defaults to a temporary SQLite file")
+    parser.add_argument("--parallel", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=200, help="messages per seeded conversation")
+    parser.add_argument("--ping-every", type=float, default=0.005)
+    args = parser.parse_args()
+
+    tmp = None
+    url = args.url
+    if url is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".sqlite3", delete=False)
+        tmp.close()
+        url = f"sqlite:///{tmp.name}"
+
+    # db.py builds its engines from these at import time
+    os.environ["DATABASE_URL"] = url
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ.setdefault("JWT_SECRET", "bench")
+
+    import main as api
+    from db import async_engine, engine
+
+    async def _no_send(events):
+        return []
+
+    api.inngest_client.send = _no_send
+
+    @api.app.get("/bench-ping")
+    async def bench_ping():
+        return {"ok": True}
+
+    try:
+        email, password, ids = seed(args.conversations, args.messages)
+        print({
+            "url": url.split("@")[-1],
+            "parallel": args.parallel,
+            **asyncio.run(run(api.app, email, password, ids, args.parallel, args.seconds, args.ping_every)),
+        })
+    finally:
+        engine.dispose()
+        asyncio.run(async_engine.dispose())
+        if tmp is not None:
+            os.remove(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Document routing: recall and latency of searching only the top-N
+documents picked by their summary vectors, against searching every
+document of the conversation.
+
+    python -m benchmarks.bench_doc_routing
+    python -m benchmarks.bench_doc_routing --docs 100 --top-n 4 8 16 --clusters 0 4
+
+The corpus is synthetic: topics shared across documents, each document
+covering a few of them with its own offset, chunks scattered around those
+points. Chunks go into a NumPy store and summaries are built with the same
+SummaryBuilder/save_summary ingestion uses; queries are drawn near a
+random document's topic.
+
+Ground truth is the exhaustive search the query path did before routing
+(same candidate limit and per-PDF grouping). Recall is the share of those
+candidates the routed search also returns; latency includes ranking the
+summaries.
+"""
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+import routing
+from context import CONTEXT_CANDIDATES, CONTEXT_PER_DOCUMENT
+from numpy_store import NumpyStorage
+from routing import SummaryBuilder, save_summary
+
+
+def normalize(x):
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def synthetic_corpus(docs, chunks, topics, dim, n_queries, seed):
+    rng = np.random.default_rng(seed)
+    pool = normalize(rng.normal(size=(max(docs * topics // 2, topics), dim)))
+    corpus, queries = {}, []
+    for d in range(docs):
+        own = pool[rng.choice(len(pool), size=topics, replace=False)]
+        bias = 0.5 * normalize(rng.normal(size=dim))
+        labels = rng.integers(0, topics, size=chunks)
+        noise = 0.9 * normalize(rng.normal(size=(chunks, dim)))
+        corpus[f"doc-{d:04d}"] = (normalize(own[labels] + bias + noise), own, bias)
+
+    names = list(corpus)
+    for _ in range(n_queries):
+        _, own, bias = corpus[names[rng.integers(len(names))]]
+        topic = own[rng.integers(len(own))]
+        queries.append(normalize(topic + bias + 1.2 * normalize(rng.normal(size=dim))))
+    return {name: x for name, (x, _, _) in corpus.items()}, np.stack(queries)
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def search(store, query, pdf_ids, limit, per_document):
+    hits = store.search_candidates(query, limit=limit, allowed_pdf_ids=pdf_ids, per_document=per_document)
+    return {h["text"] for h in hits}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=48, help="documents in the conversation")
+    parser.add_argument("--chunks", type=int, default=200, help="chunks per document")
+    parser.add_argument("--topics", type=int, default=4, help="topics per document")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-n", type=int, nargs="+", default=[4, 8, routing.DOC_ROUTING_TOP_N, 16])
+    parser.add_argument("--clusters", type=int, nargs="+", default=[0, routing.DOC_SUMMARY_CLUSTERS])
+    parser.add_argument("--limit", type=int, default=CONTEXT_CANDIDATES, help="candidates per search")
+    parser.add_argument("--per-document", type=int, default=CONTEXT_PER_DOCUMENT, help="0 = no grouping")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="cortex-routing-")
+    try:
+        corpus, queries = synthetic_corpus(args.docs, args.chunks, args.topics, args.dim, args.queries, args.seed)
+        pdf_ids = list(corpus)
+
+        chunks = NumpyStorage(path=f"{tmp}/chunks", dim=args.dim)
+        for name, x in corpus.items():
+            chunks.upsert(
+                ids=[f"{name}-{i}" for i in range(len(x))],
+                vectors=x,
+                payloads=[{"pdf_id": name, "text": f"{name}:{i}"} for i in range(len(x))],
+            )
+        chunks.compact()
+        per_document = args.per_document or None
+
+        exhaustive, full_times = [], []
+        for q in queries:
+            start = time.perf_counter()
+            exhaustive.append(search(chunks, q, pdf_ids, args.limit, per_document))
+            full_times.append(time.perf_counter() - start)
+
+        print(
+            f"{args.docs} documents x {args.chunks} chunks, dim {args.dim}, {args.queries} queries, "
+            f"limit {args.limit}, per_document {per_document}"
+        )
+        print(f"  exhaustive              p50 {ms(statistics.median(full_times)):7.2f} ms  p95 {ms(pct(full_times, 0.95)):7.2f} ms")
+
+        # route() sizes its summary search by this
+        routing.DOC_SUMMARY_CLUSTERS = max(args.clusters)
+        for clusters in args.clusters:
+            summaries = NumpyStorage(path=f"{tmp}/summaries-{clusters}", dim=args.dim)
+            start = time.perf_counter()
+            for name, x in corpus.items():
+                builder = SummaryBuilder()
+                for i in range(0, len(x), 100):
+                    builder.add(x[i:i + 100])
+                save_summary(summaries, builder, pdf_id=name, source_id=name, clusters=clusters)
+            built = time.perf_counter() - start
+
+            print(f"\n  summaries: centroid + {clusters} cluster centroid(s), built in {ms(built / args.docs):.2f} ms/document")
+            for top_n in args.top_n:
+                if top_n >= args.docs:
+                    continue
+                recalls, times = [], []
+                for q, truth in zip(queries, exhaustive):
+                    start = time.perf_counter()
+                    routed, _ = routing.route(q, pdf_ids, [], store=summaries, top_n=top_n)
+                    found = search(chunks, q, routed, args.limit, per_document)
+                    times.append(time.perf_counter() - start)
+                    recalls.append(len(found & truth) / max(len(truth), 1))
+                print(
+                    f"  routed top-{top_n:<3}  recall@{args.limit} {statistics.fmean(recalls):6.1%}"
+                    f" (p5 {pct(recalls, 0.05):5.1%})"
+                    f"  p50 {ms(statistics.median(times)):7.2f} ms  p95 {ms(pct(times, 0.95)):7.2f} ms"
+                )
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
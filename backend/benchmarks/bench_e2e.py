@@ -0,0 +1,264 @@
+"""
+Offline end-to-end benchmark: the real ingest_pdf and query_pdf_ai handlers
+from main.py, driven step by step against local stand-ins.
+
+    python -m benchmarks.bench_e2e --pages 1 10 50 --repeat 2 --queries 200 --out e2e.json
+    python -m benchmarks.bench_e2e --backend qdrant --compare e2e.json
+
+Stand-ins: FakeGeminiClient embeddings and FakeGenerateClient answers with
+configurable latency, the NumPy vector store (or an in-memory Qdrant), a
+directory acting as the Supabase bucket, a temporary SQLite database, and
+FakeContext running each Inngest step inline. Everything lives in a temp
+directory; no environment or network service is touched.
+
+Reports pages/s and chunks/s for ingestion, p50/p95/p99 latency of whole
+queries, per-step medians and peak RSS. --out saves the report as JSON;
+--compare prints the change against an earlier report.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+
+def configure_env(tmp, backend):
+    """
+    Points every service main.py reaches for at the temp directory. Must
+    run before main (and its dependencies) are imported.
+    """
+    db_url = f"sqlite:///{os.path.join(tmp, 'bench.sqlite3')}"
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["ASYNC_DATABASE_URL"] = db_url
+    os.environ["EMBED_CACHE_DIR"] = os.path.join(tmp, "embed-cache")
+    os.environ["NUMPY_STORE_DIR"] = os.path.join(tmp, "vectors")
+    os.environ["ARTIFACT_DIR"] = os.path.join(tmp, "artifacts")
+    os.environ["VECTOR_BACKEND"] = "numpy" if backend == "numpy" else "qdrant"
+    os.environ["MESSAGE_NOTIFIER"] = "local"
+    # Clients are built lazily and replaced by fakes; these only need to parse
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.bench")
+    os.environ.setdefault("INNGEST_SIGNING_KEY", "signkey-prod-" + "0" * 64)
+    os.environ.setdefault("JWT_SECRET", "bench")
+    os.environ.setdefault("INTERNAL_API_TOKEN", "bench")
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+async def run(args, tmp):
+    import clients
+    import data_loader
+    import main
+    import vector_db
+    from benchmarks.fakes import FakeContext, FakeGeminiClient, FakeGenerateClient, FakeSupabase, make_pdf
+    from db import SessionLocal, engine
+    from models import Base, Conversation, User
+
+    Base.metadata.create_all(engine)
+
+    embedder = FakeGeminiClient(
+        dim=data_loader.EMBED_DIM,
+        base_latency=args.embed_latency,
+        per_item_latency=args.embed_item_latency,
+    )
+    # Generation takes the shared Gemini client; the embedding engine gets its own fake
+    clients.override("gemini", FakeGenerateClient(
+        tokens=args.answer_tokens,
+        first_token_latency=args.generate_latency,
+        per_token_latency=0,
+    ))
+    data_loader.get_engine().client = embedder
+    clients.override("supabase", FakeSupabase(os.path.join(tmp, "bucket")))
+    if args.backend == "qdrant":
+        from qdrant_client import QdrantClient
+        vector_db._storage = vector_db.QdrantStorage(client=QdrantClient(":memory:"))
+        # The query step searches through the async store; a second in-memory
+        # client wouldn't see these points, so wrap the same one on a thread
+        from numpy_store import AsyncNumpyStorage
+        vector_db._async_storage = AsyncNumpyStorage(vector_db._storage)
+
+    user_id, conversation_id = str(uuid.uuid4()), str(uuid.uuid4())
+    with SessionLocal() as db:
+        db.add(User(id=user_id, email="bench@local", hashed_password="x"))
+        db.add(Conversation(id=conversation_id, user_id=user_id))
+        db.commit()
+
+    # ---------------- ingestion ----------------
+    bucket = clients.supabase().storage.from_("pdfs")
+    rng = random.Random(args.seed)
+    documents, by_size, ingest_steps = [], {}, {}
+    for pages in args.pages:
+        for r in range(args.repeat):
+            pdf_id = str(uuid.uuid4())
+            data = make_pdf(pages, args.words_per_page, seed=rng.randrange(2**32))
+            path = f"{user_id}/{pdf_id}.pdf"
+            bucket.upload(path, data)
+            documents.append({
+                "pdf_id": pdf_id,
+                "storage_path": path,
+                "source_id": f"bench-{pages}p-{r}.pdf",
+                "conversation_id": conversation_id,
+                "content_hash": hashlib.sha256(data).hexdigest(),
+                "pages": pages,
+            })
+
+    ingest_start = time.perf_counter()
+    for doc in documents:
+        start = time.perf_counter()
+        result = await main.ingest_pdf(FakeContext(doc, ingest_steps))
+        elapsed = time.perf_counter() - start
+
+        chunks = result["ingested"] + result["skipped"]
+        row = by_size.setdefault(doc["pages"], {"pages": doc["pages"], "pdfs": 0, "chunks": 0, "seconds": 0.0})
+        row["pdfs"] += 1
+        row["chunks"] += chunks
+        row["seconds"] += elapsed
+    ingest_seconds = time.perf_counter() - ingest_start
+    rss_after_ingest = peak_rss_mb()
+
+    total_pages = sum(d["pages"] for d in documents)
+    total_chunks = sum(row["chunks"] for row in by_size.values())
+
+    # ---------------- queries ----------------
+    vocab = ["pump", "valve", "pressure", "maintenance", "filter", "seal", "torque", "inspection"]
+    allowed = {
+        "allowed_pdf_ids": [d["pdf_id"] for d in documents],
+        "allowed_content_hashes": [d["content_hash"] for d in documents],
+    }
+    query_steps, latency = {}, []
+    for i in range(args.queries):
+        # Distinct wording each time so the embedding cache can't answer
+        question = f"{i}: what does the manual say about {rng.choice(vocab)} and PN-{rng.randint(10000, 99999)}?"
+        ctx = FakeContext({"question": question, "conversation_id": conversation_id, **allowed}, query_steps)
+        start = time.perf_counter()
+        await main.query_pdf_ai(ctx)
+        latency.append(time.perf_counter() - start)
+
+    steps = {**ingest_steps, **query_steps}
+    return {
+        "config": {
+            "backend": args.backend,
+            "pages": args.pages,
+            "repeat": args.repeat,
+            "words_per_page": args.words_per_page,
+            "queries": args.queries,
+            "embed_latency": args.embed_latency,
+            "embed_item_latency": args.embed_item_latency,
+            "generate_latency": args.generate_latency,
+            "embed_dim": data_loader.EMBED_DIM,
+        },
+        "ingest": {
+            "pdfs": len(documents),
+            "pages": total_pages,
+            "chunks": total_chunks,
+            "seconds": round(ingest_seconds, 3),
+            "pages_per_s": round(total_pages / ingest_seconds, 2),
+            "chunks_per_s": round(total_chunks / ingest_seconds, 2),
+            "embed_requests": embedder.calls,
+            "by_size": [
+                {**row, "seconds": round(row["seconds"], 3), "pages_per_s": round(row["pages"] * row["pdfs"] / row["seconds"], 2)}
+                for row in sorted(by_size.values(), key=lambda row: row["pages"])
+            ],
+        },
+        "query": {
+            "count": len(latency),
+            "mean_ms": ms(statistics.fmean(latency)),
+            "p50_ms": ms(pct(latency, 0.50)),
+            "p95_ms": ms(pct(latency, 0.95)),
+            "p99_ms": ms(pct(latency, 0.99)),
+        },
+        "steps_p50_ms": {step: ms(statistics.median(t)) for step, t in steps.items()},
+        "peak_rss_mb": {"after_ingest": rss_after_ingest, "end": peak_rss_mb()},
+    }
+
+
+# Metrics compared by --compare, and whether bigger is better
+COMPARED = [
+    (("ingest", "pages_per_s"), True),
+    (("ingest", "chunks_per_s"), True),
+    (("query", "p50_ms"), False),
+    (("query", "p95_ms"), False),
+    (("query", "p99_ms"), False),
+    (("peak_rss_mb", "end"), False),
+]
+
+
+def compare(baseline, report):
+    for (section, key), higher_is_better in COMPARED:
+        old, new = baseline.get(section, {}).get(key), report[section][key]
+        if not old:
+            continue
+        change = (new - old) / old * 100
+        better = change > 0 if higher_is_better else change < 0
+        name = f"{section}.{key}"
+        print(f"{name:<22} {old:>10} -> {new:>10}  {change:+6.1f}% {'better' if better else 'worse' if change else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["numpy", "qdrant"], default="numpy", help="qdrant = in-memory local mode")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50], help="PDF sizes to generate")
+    parser.add_argument("--repeat", type=int, default=2, help="PDFs per size")
+    parser.add_argument("--words-per-page", type=int, default=450)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--embed-item-latency", type=float, default=0.0005)
+    parser.add_argument("--generate-latency", type=float, default=0.0, help="fake answer generation time")
+    parser.add_argument("--answer-tokens", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="write the JSON report here")
+    parser.add_argument("--compare", default=None, help="earlier JSON report to diff against")
+    parser.add_argument("--keep", action="store_true", help="keep the temp directory")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    out = os.path.abspath(args.out) if args.out else None
+
+    tmp = tempfile.mkdtemp(prefix="cortex-bench-")
+    cwd = os.getcwd()
+    configure_env(tmp, args.backend)
+    # main.py writes temp PDFs relative to the working directory
+    os.chdir(tmp)
+    sys.path.insert(0, cwd)
+    try:
+        report = asyncio.run(run(args, tmp))
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+    if baseline:
+        compare(baseline, report)
+
+
+if __name__ == "__main__":
+    main()
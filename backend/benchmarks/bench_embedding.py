@@ -0,0 +1,68 @@
+"""
+Embedding throughput against a fake Gemini client.
+
+    python -m benchmarks.bench_embedding --chunks 2000 --concurrency 1 4 8
+"""
+import argparse
+import asyncio
+import time
+
+from embedder import EmbeddingEngine
+from benchmarks.fakes import FakeGeminiClient
+
+
+def make_chunks(n: int, size: int) -> list[str]:
+    base = "lorem ipsum dolor sit amet consectetur adipiscing elit "
+    text = (base * (size // len(base) + 1))[:size]
+    return [f"{i} {text}" for i in range(n)]
+
+
+def run(chunks, concurrency, mode, args):
+    client = FakeGeminiClient(
+        dim=args.dim,
+        base_latency=args.latency,
+        per_item_latency=args.per_item_latency,
+        failure_rate=args.failure_rate,
+    )
+    engine = EmbeddingEngine(client, "fake-embedding", concurrency=concurrency, backoff=0.05)
+
+    start = time.perf_counter()
+    if mode == "async":
+        vectors = asyncio.run(engine.embed(chunks))
+    else:
+        vectors = engine.embed_sync(chunks)
+    elapsed = time.perf_counter() - start
+
+    assert len(vectors) == len(chunks)
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "chunks_per_sec": round(len(chunks) / elapsed, 1),
+        "requests": client.calls,
+        "max_in_flight": client.max_in_flight,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--per-item-latency", type=float, default=0.002)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--mode", choices=["sync", "async", "both"], default="both")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks, args.chunk_chars)
+    modes = ["sync", "async"] if args.mode == "both" else [args.mode]
+
+    for mode in modes:
+        for c in args.concurrency:
+            print(run(chunks, c, mode, args))
+
+
+if __name__ == "__main__":
+    main()
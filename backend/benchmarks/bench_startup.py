@@ -0,0 +1,136 @@
+"""
+Cold start: how long `import main` takes, what it drags in, and how soon a
+freshly started uvicorn worker answers its first request.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 5 --max-import-ms 1500 --max-first-request-ms 3000
+
+Each run is a new interpreter. The import report comes from
+`python -X importtime`: total time, then the slowest top-level imports.
+Time to first request is measured from spawning uvicorn to the first 200
+from GET /metrics (with the INTERNAL_API_TOKEN bearer), which touches no
+database or external service.
+
+Fails (exit 1) if the median import or first-request time is over its
+threshold, or if importing main loads a library that should only load on
+first use (LAZY_MODULES), so CI catches a regression.
+"""
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.bench_e2e import configure_env
+
+# Loaded through clients.py when first needed, never by `import main`
+LAZY_MODULES = ("google.genai", "qdrant_client", "supabase", "pypdf", "langchain_community", "llama_index")
+
+
+def importtime(cwd):
+    code = (
+        "import sys, main; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-X", "importtime", "-c", code],
+        cwd=cwd, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # One space after the bar, then two per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    total = next(us for name, _, us, _ in rows if name == "main")
+    loaded = [m for m in out.stdout.strip().split(",") if m]
+    return total / 1000, rows, loaded
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def first_request(cwd, timeout):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/metrics"
+    request = urllib.request.Request(url, headers={"Authorization": f"Bearer {os.environ['INTERNAL_API_TOKEN']}"})
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited: {proc.stderr.read().decode()[-2000:]}")
+            try:
+                with urllib.request.urlopen(request, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"no response from {url} within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="slowest top-level imports to list")
+    parser.add_argument("--max-import-ms", type=float, default=2000)
+    parser.add_argument("--max-first-request-ms", type=float, default=4000)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    tmp = tempfile.mkdtemp(prefix="cortex-startup-")
+    # Default backend (qdrant) so the check proves qdrant_client stays unloaded
+    configure_env(tmp, "qdrant")
+
+    imports, requests = [], []
+    rows, loaded = [], []
+    try:
+        for _ in range(args.runs):
+            total, rows, loaded = importtime(cwd)
+            imports.append(total)
+            requests.append(first_request(cwd, args.timeout) * 1000)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"import main:        median {statistics.median(imports):7.0f} ms  (runs: {', '.join(f'{t:.0f}' for t in imports)})")
+    print(f"first request:      median {statistics.median(requests):7.0f} ms  (runs: {', '.join(f'{t:.0f}' for t in requests)})")
+
+    # Direct imports of main, by cumulative time (last run)
+    print("\nslowest imports under main (cumulative ms):")
+    children = sorted((r for r in rows if r[3] == 1), key=lambda r: r[2], reverse=True)
+    for name, _, cumulative, _ in children[: args.top]:
+        print(f"  {cumulative / 1000:8.1f}  {name}")
+
+    failures = []
+    if statistics.median(imports) > args.max_import_ms:
+        failures.append(f"import main took {statistics.median(imports):.0f} ms > {args.max_import_ms:.0f} ms")
+    if statistics.median(requests) > args.max_first_request_ms:
+        failures.append(f"first request took {statistics.median(requests):.0f} ms > {args.max_first_request_ms:.0f} ms")
+    if loaded:
+        failures.append(f"import main loaded {', '.join(loaded)}; these should load on first use")
+
+    if failures:
+        print("\n❌ " + "\n❌ ".join(failures))
+        sys.exit(1)
+    print("\n✅ within budget")
+
+
+if __name__ == "__main__":
+    main()
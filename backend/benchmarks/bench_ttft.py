@@ -0,0 +1,91 @@
+"""
+Time-to-first-token: Inngest + polling vs. the SSE streaming path, against a
+fake streaming model.
+
+    python -m benchmarks.bench_ttft --runs 20 --poll-interval 1.0
+
+The polling path can only show text once the whole answer is stored and the
+next poll lands, so its TTFT is generation time plus (on average) half a poll
+interval. The streaming path shows text as soon as the first piece arrives.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import clients
+import generation
+from benchmarks.fakes import FakeGenerateClient
+
+
+async def polling_ttft(poll_interval: float, rng: random.Random) -> float:
+    start = time.perf_counter()
+    # The poll timer is not aligned with the request
+    next_poll = start + rng.uniform(0, poll_interval)
+
+    done_at = None
+
+    async def generate():
+        nonlocal done_at
+        await asyncio.to_thread(generation.generate_answer, ["context"], "question")
+        done_at = time.perf_counter()
+
+    task = asyncio.create_task(generate())
+    while True:
+        await asyncio.sleep(max(0.0, next_poll - time.perf_counter()))
+        if done_at is not None:
+            await task
+            return time.perf_counter() - start
+        next_poll += poll_interval
+
+
+async def streaming_ttft() -> tuple[float, float]:
+    start = time.perf_counter()
+    first = None
+    async for _ in generation.generate_answer_stream(["context"], "question"):
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def main_async(args):
+    clients.override("gemini", FakeGenerateClient(
+        tokens=args.tokens,
+        first_token_latency=args.first_token_latency,
+        per_token_latency=args.per_token_latency,
+    ))
+    rng = random.Random(0)
+
+    polled = [await polling_ttft(args.poll_interval, rng) for _ in range(args.runs)]
+    streamed = [await streaming_ttft() for _ in range(args.runs)]
+    first = [f for f, _ in streamed]
+    total = [t for _, t in streamed]
+
+    print({"path": "poll", "ttft_p50": round(statistics.median(polled), 3), "ttft_p95": round(pct(polled, 0.95), 3)})
+    print({
+        "path": "sse",
+        "ttft_p50": round(statistics.median(first), 3),
+        "ttft_p95": round(pct(first, 0.95), 3),
+        "complete_p50": round(statistics.median(total), 3),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--first-token-latency", type=float, default=0.4)
+    parser.add_argument("--per-token-latency", type=float, default=0.01)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
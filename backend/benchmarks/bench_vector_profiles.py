@@ -0,0 +1,184 @@
+"""
+Recall, latency and memory of vector storage profiles (dimension,
+quantization, on-disk originals) on the same corpus.
+
+    python -m benchmarks.bench_vector_profiles --url http://localhost:6333
+    python -m benchmarks.bench_vector_profiles --url http://localhost:6333 --from-collection doc
+    python -m benchmarks.bench_vector_profiles --corpus vectors.npy --profiles 3072/none 768/scalar
+
+The corpus is, in order of preference: a .npy matrix of full 3072-dim
+embeddings, the vectors of an existing collection, or a synthetic clustered
+set whose energy sits in the leading dimensions like a Matryoshka-trained
+model. Truncated profiles take the first `dim` components and renormalize,
+which is what Gemini's output_dimensionality returns. Ground truth is exact
+top-k on the full vectors, so recall includes the cost of truncation.
+
+Quantization only exists in a Qdrant server; without --url the benchmark
+runs in local mode, which searches exact floats and only shows the effect
+of truncation.
+"""
+import argparse
+import json
+import statistics
+import time
+import uuid
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+from vector_db import DIM, StorageProfile, QdrantStorage, _client_kwargs
+
+DEFAULT_PROFILES = [
+    "3072/none",
+    "3072/scalar",
+    "3072/binary",
+    "1536/scalar",
+    "768/none",
+    "768/scalar",
+    "3072/scalar/disk",
+]
+
+
+def parse_profile(spec: str) -> StorageProfile:
+    parts = spec.split("/")
+    return StorageProfile(
+        dim=int(parts[0]),
+        quantization=parts[1] if len(parts) > 1 else "none",
+        on_disk="disk" in parts[2:],
+        hybrid=False,
+    )
+
+
+def normalize(x):
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def synthetic_corpus(n, n_queries, clusters, seed):
+    rng = np.random.default_rng(seed)
+    # Leading dimensions carry most of the variance, as in MRL embeddings
+    scale = (1.0 + np.arange(DIM) / 64.0) ** -0.75
+    centers = rng.normal(size=(clusters, DIM)) * scale
+    labels = rng.integers(0, clusters, size=n + n_queries)
+    x = centers[labels] + 0.6 * rng.normal(size=(n + n_queries, DIM)) * scale
+    x = normalize(x).astype(np.float32)
+    return x[:n], x[n:]
+
+
+def collection_corpus(client, collection, n, n_queries, seed):
+    vectors = []
+    offset = None
+    while len(vectors) < n + n_queries:
+        points, offset = client.scroll(collection, limit=256, offset=offset, with_vectors=True, with_payload=False)
+        # Hybrid collections return {"": dense, "bm25": sparse}
+        vectors.extend(p.vector[""] if isinstance(p.vector, dict) else p.vector for p in points)
+        if offset is None:
+            break
+    x = normalize(np.asarray(vectors, dtype=np.float32))
+    np.random.default_rng(seed).shuffle(x)
+    n_queries = min(n_queries, len(x) // 10 or 1)
+    return x[n_queries:], x[:n_queries]
+
+
+def file_corpus(path, n_queries, seed):
+    x = normalize(np.load(path).astype(np.float32))
+    np.random.default_rng(seed).shuffle(x)
+    return x[n_queries:], x[:n_queries]
+
+
+def exact_top_k(corpus, queries, k):
+    scores = queries @ corpus.T
+    top = np.argpartition(-scores, k, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_profile(client, profile, corpus, queries, truth, k, batch):
+    name = f"bench_{profile.dim}_{profile.quantization}{'_disk' if profile.on_disk else ''}"
+    if client.collection_exists(name):
+        client.delete_collection(name)
+
+    store = QdrantStorage(collection=name, client=client, profile=profile)
+    docs = normalize(corpus[:, :profile.dim])
+    qs = normalize(queries[:, :profile.dim])
+    ids = [str(uuid.UUID(int=i)) for i in range(len(docs))]
+
+    start = time.perf_counter()
+    for i in range(0, len(docs), batch):
+        store.upsert(ids[i:i + batch], docs[i:i + batch].tolist(), [{"pdf_id": "bench"}] * len(ids[i:i + batch]))
+    upsert_s = time.perf_counter() - start
+
+    latency, hits = [], 0
+    for q, expected in zip(qs, truth):
+        start = time.perf_counter()
+        result = client.query_points(
+            collection_name=name,
+            query=q.tolist(),
+            search_params=profile.search_params(),
+            limit=k,
+            with_payload=False,
+        )
+        latency.append(time.perf_counter() - start)
+        hits += len({uuid.UUID(str(p.id)).int for p in result.points} & expected)
+
+    client.delete_collection(name)
+    return {
+        "profile": f"{profile.dim}/{profile.quantization}{'/disk' if profile.on_disk else ''}",
+        f"recall@{k}": round(hits / (k * len(truth)), 4),
+        "p50_ms": round(statistics.median(latency) * 1000, 2),
+        "p95_ms": round(pct(latency, 0.95) * 1000, 2),
+        "upsert_s": round(upsert_s, 2),
+        "ram_bytes_per_vector": profile.ram_bytes_per_vector(),
+        "est_vector_ram_mb": round(profile.ram_bytes_per_vector() * len(docs) / 2**20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="Qdrant server; local in-memory mode if omitted")
+    parser.add_argument("--corpus", default=None, help=".npy matrix of 3072-dim embeddings")
+    parser.add_argument("--from-collection", default=None, help="sample vectors from this collection at --url")
+    parser.add_argument("--profiles", nargs="+", default=DEFAULT_PROFILES, help="dim/quantization[/disk]")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print one JSON document instead of rows")
+    args = parser.parse_args()
+
+    if args.url:
+        kwargs = _client_kwargs()
+        kwargs["url"] = args.url
+        client = QdrantClient(**kwargs)
+    else:
+        print("⚠️ No --url: local mode searches exact floats, so quantization has no effect")
+        client = QdrantClient(":memory:")
+
+    if args.corpus:
+        corpus, queries = file_corpus(args.corpus, args.queries, args.seed)
+    elif args.from_collection:
+        corpus, queries = collection_corpus(client, args.from_collection, args.docs, args.queries, args.seed)
+    else:
+        corpus, queries = synthetic_corpus(args.docs, args.queries, args.clusters, args.seed)
+
+    truth = exact_top_k(corpus, queries, args.top_k)
+    rows = [
+        run_profile(client, parse_profile(spec), corpus, queries, truth, args.top_k, args.batch)
+        for spec in args.profiles
+    ]
+
+    if args.json:
+        print(json.dumps({"docs": len(corpus), "queries": len(queries), "results": rows}, indent=2))
+    else:
+        print(f"{len(corpus)} docs, {len(queries)} queries")
+        for row in rows:
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
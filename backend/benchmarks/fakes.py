@@ -0,0 +1,281 @@
+"""
+Deterministic local stand-ins for external services, used by the benchmarks.
+"""
+import asyncio
+import hashlib
+import inspect
+import os
+import random
+import threading
+import time
+import types
+
+
+def fake_vector(text: str, dim: int) -> list[float]:
+    """
+    Stable pseudo-random unit vector for a text.
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    v = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = sum(x * x for x in v) ** 0.5 or 1.0
+    return [x / norm for x in v]
+
+
+class _Embedding:
+    def __init__(self, values):
+        self.values = values
+
+
+class _EmbedResponse:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+
+class _FakeModels:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def embed_content(self, model, contents, config=None):
+        self._owner._before_call(len(contents))
+        time.sleep(self._owner.latency(len(contents)))
+        return self._owner._respond(contents, config)
+
+
+class _FakeAsyncModels:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def embed_content(self, model, contents, config=None):
+        self._owner._before_call(len(contents))
+        await asyncio.sleep(self._owner.latency(len(contents)))
+        return self._owner._respond(contents, config)
+
+
+class _FakeAio:
+    def __init__(self, owner):
+        self.models = _FakeAsyncModels(owner)
+
+
+class FakeGeminiClient:
+    """
+    Mimics the subset of google.genai.Client used for embeddings.
+
+    Each request costs `base_latency + per_item_latency * len(batch)` seconds,
+    and fails with probability `failure_rate` to exercise retries.
+    """
+
+    def __init__(self, dim=3072, base_latency=0.15, per_item_latency=0.002, failure_rate=0.0, seed=0):
+        self.dim = dim
+        self.base_latency = base_latency
+        self.per_item_latency = per_item_latency
+        self.failure_rate = failure_rate
+        self.models = _FakeModels(self)
+        self.aio = _FakeAio(self)
+
+        self.calls = 0
+        self.items = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def latency(self, n: int) -> float:
+        return self.base_latency + self.per_item_latency * n
+
+    def _before_call(self, n: int):
+        with self._lock:
+            self.calls += 1
+            self.items += n
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self._rng.random() < self.failure_rate
+        if fail:
+            with self._lock:
+                self.in_flight -= 1
+            raise RuntimeError("fake 503: model overloaded")
+
+    def _respond(self, contents, config=None):
+        with self._lock:
+            self.in_flight -= 1
+        # Like the real model, a requested output_dimensionality truncates
+        # the full vector without renormalizing it
+        dim = getattr(config, "output_dimensionality", None) or self.dim
+        return _EmbedResponse([_Embedding(fake_vector(t, self.dim)[:dim]) for t in contents])
+
+
+class _GenerateResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeStreamModels:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self._owner.first_token_latency + self._owner.per_token_latency * self._owner.tokens)
+        return _GenerateResponse("".join(self._owner.pieces()))
+
+
+class _FakeAsyncStreamModels:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self._owner.first_token_latency + self._owner.per_token_latency * self._owner.tokens)
+        return _GenerateResponse("".join(self._owner.pieces()))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        owner = self._owner
+
+        async def stream():
+            await asyncio.sleep(owner.first_token_latency)
+            for piece in owner.pieces():
+                yield _GenerateResponse(piece)
+                await asyncio.sleep(owner.per_token_latency)
+
+        return stream()
+
+
+class _FakeStreamAio:
+    def __init__(self, owner):
+        self.models = _FakeAsyncStreamModels(owner)
+
+
+class FakeGenerateClient:
+    """
+    Mimics google.genai.Client text generation, streaming or not. The model
+    "thinks" for `first_token_latency` seconds, then emits `tokens` pieces
+    `per_token_latency` seconds apart.
+    """
+
+    def __init__(self, tokens=300, first_token_latency=0.4, per_token_latency=0.01):
+        self.tokens = tokens
+        self.first_token_latency = first_token_latency
+        self.per_token_latency = per_token_latency
+        self.models = _FakeStreamModels(self)
+        self.aio = _FakeStreamAio(self)
+
+    def pieces(self):
+        return [f"word{i} " for i in range(self.tokens)]
+
+
+def make_pdf(pages: int, words_per_page: int = 400, seed: int = 0) -> bytes:
+    """
+    A text-only PDF with `pages` pages of pseudo-random prose, sprinkled
+    with identifiers like part numbers so lexical search has something to find.
+    """
+    rng = random.Random(seed)
+    vocab = [
+        "pump", "valve", "pressure", "maintenance", "schedule", "filter", "seal",
+        "inspection", "torque", "assembly", "operator", "manual", "warning",
+        "temperature", "flow", "rate", "section", "procedure", "replace", "check",
+    ]
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for _ in range(pages):
+        words = []
+        for i in range(words_per_page):
+            if rng.random() < 0.02:
+                words.append(f"PN-{rng.randint(10000, 99999)}")
+            else:
+                words.append(rng.choice(vocab))
+            if rng.random() < 0.08:
+                words[-1] += "."
+        lines = [" ".join(words[i:i + 14]) for i in range(0, len(words), 14)]
+        text = " T* ".join(f"({line}) Tj" for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 40 800 Td {text} ET".encode("latin-1")
+
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        kids.append(len(objects))
+
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class _FakeBucket:
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, path):
+        return os.path.join(self.root, path)
+
+    def upload(self, path, file, file_options=None):
+        full = self._path(path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "wb") as f:
+            f.write(file)
+
+    def download(self, path):
+        with open(self._path(path), "rb") as f:
+            return f.read()
+
+    def remove(self, paths):
+        for path in paths:
+            try:
+                os.remove(self._path(path))
+            except FileNotFoundError:
+                pass
+
+
+class _FakeStorage:
+    def __init__(self, root):
+        self.root = root
+
+    def from_(self, bucket):
+        return _FakeBucket(os.path.join(self.root, bucket))
+
+
+class FakeSupabase:
+    """
+    Mimics `supabase.storage.from_(bucket)` on top of a local directory.
+    """
+
+    def __init__(self, root):
+        self.storage = _FakeStorage(root)
+
+
+class _StepRunner:
+    def __init__(self, timings):
+        self.timings = timings
+
+    async def run(self, step_id, handler, *args, output_type=None):
+        start = time.perf_counter()
+        result = handler(*args)
+        if inspect.isawaitable(result):
+            result = await result
+        self.timings.setdefault(step_id, []).append(time.perf_counter() - start)
+        return result
+
+
+class FakeContext:
+    """
+    Stand-in for inngest.Context: runs every step inline, once, and records
+    how long each step id took. Step outputs are not serialized, so pydantic
+    results reach the handler as objects, as Inngest's PydanticSerializer
+    would hand them back.
+    """
+
+    def __init__(self, data: dict, timings: dict | None = None):
+        self.event = types.SimpleNamespace(name="bench", data=data)
+        self.timings = timings if timings is not None else {}
+        self.step = _StepRunner(self.timings)
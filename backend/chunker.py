@@ -0,0 +1,208 @@
+import bisect
+import functools
+import math
+import os
+from typing import Iterable, Iterator
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --------------------------------------------------
+# Offset-aware chunking
+# --------------------------------------------------
+# Same window as the SentenceSplitter it replaces (1000 tokens, 200 of
+# overlap, cut at sentence ends where possible), measured with the same
+# cl100k tokenizer (tiktoken). Only about one window is tokenized per
+# chunk and every cut point is found with str.rfind/str.find inside it, so
+# the cost is linear in the text.
+# Without tiktoken (or its encoding file: set TIKTOKEN_CACHE_DIR offline)
+# sizes fall back to CHARS_PER_TOKEN characters per token, which
+# context.estimate_tokens also assumes.
+
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))  # tokens
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))  # tokens
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4"))
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "cl100k_base")
+
+# Best cut first: paragraph, line, sentence, clause, word
+_PARAGRAPH = ("\n\n",)
+_SENTENCE = (". ", "? ", "! ", ".\n", "?\n", "!\n")
+_CLAUSE = ("; ", ": ", ", ")
+# Single newlines in PDF text are mostly layout wraps, not sentence ends
+_WORD = (" ", "\n", "\t")
+_SEPARATORS = (_PARAGRAPH, _SENTENCE, _CLAUSE, _WORD)
+
+# A cut may not leave a chunk shorter than this fraction of the window
+_MIN_FILL = 0.5
+
+
+def _last_break(text: str, lo: int, hi: int) -> int:
+    """
+    Position just after the best separator in text[lo:hi], or -1.
+    """
+    for group in _SEPARATORS:
+        best = -1
+        for sep in group:
+            i = text.rfind(sep, lo, hi)
+            if i != -1:
+                best = max(best, i + len(sep))
+        if best != -1:
+            return best
+    return -1
+
+
+def _first_break(text: str, lo: int, hi: int) -> int:
+    """
+    Position just after the first sentence (else word) end in text[lo:hi], or -1.
+    """
+    for group in (_SENTENCE, _WORD):
+        best = -1
+        for sep in group:
+            i = text.find(sep, lo, hi)
+            if i != -1 and (best == -1 or i + len(sep) < best):
+                best = i + len(sep)
+        if best != -1:
+            return best
+    return -1
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(CHUNK_TOKENIZER)
+    except Exception as e:
+        print(f"⚠️ Tokenizer {CHUNK_TOKENIZER} unavailable, sizing chunks at {CHARS_PER_TOKEN:g} chars/token: {e}")
+        return None
+
+
+def _tokenize(text: str):
+    """
+    The tokens of `text`; only their count and _prefix_chars matter.
+    """
+    encoding = _encoding()
+    if encoding is None:
+        return range(math.ceil(len(text) / CHARS_PER_TOKEN))
+    return encoding.encode(text, disallowed_special=())
+
+
+def _prefix_chars(tokens, k: int) -> int:
+    """
+    Characters taken by the first k tokens (a character split across
+    tokens k-1 and k is not counted).
+    """
+    encoding = _encoding()
+    if encoding is None:
+        return int(k * CHARS_PER_TOKEN)
+    # Lone surrogates were encoded as U+FFFD, one for one
+    return len(encoding.decode_bytes(tokens[:k]).decode("utf-8", "ignore"))
+
+
+class _PageIndex:
+    """
+    Maps absolute offsets in the joined text back to (page, offset in page).
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.pages = []
+
+    def add(self, start: int, page: int):
+        self.starts.append(start)
+        self.pages.append(page)
+
+    def locate(self, pos: int) -> tuple[int, int]:
+        i = max(bisect.bisect_right(self.starts, pos) - 1, 0)
+        return self.pages[i], max(pos - self.starts[i], 0)
+
+    def forget_before(self, pos: int):
+        # Keep the page that contains pos
+        i = max(bisect.bisect_right(self.starts, pos) - 1, 0)
+        if i:
+            del self.starts[:i]
+            del self.pages[:i]
+
+
+def chunk_pages(
+    pages: Iterable[str],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+) -> Iterator[dict]:
+    """
+    Streams page texts into overlapping chunks. Yields
+    {"text", "page", "char_offset"}: the 1-based page the chunk starts on
+    and where in that page's text it starts. Only about one window of text
+    is held at a time.
+    """
+    size = max(chunk_size, 1)
+    overlap = min(chunk_overlap, size // 2)
+    chars_per_token = CHARS_PER_TOKEN  # refined from each window
+
+    index = _PageIndex()
+    buffer = ""
+    base = 0  # absolute offset of buffer[0]
+    start = 0  # next chunk start, relative to buffer
+
+    def window():
+        # Tokens of a slice from `start` holding more than `size` of them,
+        # or of the whole rest of the buffer
+        nonlocal chars_per_token
+        span = int(size * chars_per_token * 1.25) + 64
+        while True:
+            hi = min(start + span, len(buffer))
+            tokens = _tokenize(buffer[start:hi])
+            if len(tokens) > size or hi == len(buffer):
+                if len(tokens) > size:
+                    chars_per_token = max((hi - start) / len(tokens), 0.25)
+                return tokens
+            span *= 2
+
+    def cut(final: bool):
+        nonlocal buffer, base, start
+        while len(buffer) > start:
+            tokens = window()
+            if len(tokens) <= size:
+                if not final:
+                    break
+                end = len(buffer)
+            else:
+                end = start + _prefix_chars(tokens, size)
+                brk = _last_break(buffer, start + _prefix_chars(tokens, int(size * _MIN_FILL)), end)
+                end = brk if brk != -1 else end
+
+            raw = buffer[start:end]
+            text = raw.strip()
+            if text:
+                page, offset = index.locate(base + start + (len(raw) - len(raw.lstrip())))
+                yield {"text": text, "page": page, "char_offset": offset}
+            if end >= len(buffer):
+                start = end
+                break
+
+            # Overlap: restart at the first sentence (or word) boundary in
+            # the chunk's last `overlap` tokens, always moving forward
+            nxt = end
+            if overlap:
+                # Tokens that fit in the chunk
+                taken = bisect.bisect_right(range(size + 1), end - start, key=lambda k: _prefix_chars(tokens, k)) - 1
+                lo = start + _prefix_chars(tokens, max(taken - overlap, taken // 2))
+                brk = _first_break(buffer, lo, end)
+                nxt = brk if brk != -1 else lo
+            start = max(nxt, start + 1)
+
+        # Drop what no later chunk can reach
+        if start:
+            buffer = buffer[start:]
+            base += start
+            start = 0
+            index.forget_before(base)
+
+    for number, page_text in enumerate(pages, start=1):
+        if buffer:
+            # Pages are joined with a space, as before
+            buffer += " "
+        index.add(base + len(buffer), number)
+        buffer += page_text
+        yield from cut(final=False)
+
+    yield from cut(final=True)
@@ -0,0 +1,77 @@
+import importlib
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --------------------------------------------------
+# Shared clients, built on first use
+# --------------------------------------------------
+# google-genai, qdrant_client, supabase and pypdf together cost a few seconds
+# of imports, which every autoscaled worker used to pay before serving its
+# first request. Modules now take their clients from here: one instance per
+# process, shared across modules, created the first time it is needed.
+
+_instances = {}
+# Re-entrant: a factory may itself ask for another shared client
+_lock = threading.RLock()
+
+
+def shared(name: str, factory):
+    """
+    The process-wide instance called `name`, created with factory() on first use.
+    """
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _instances[name] = factory()
+    return instance
+
+
+def gemini():
+    """
+    The Gemini client used for both embeddings and generation.
+    """
+
+    def make():
+        from google import genai
+        return genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+    return shared("gemini", make)
+
+
+def supabase():
+    def make():
+        from supabase import create_client
+        # Use Service Role for backend
+        return create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_SERVICE_ROLE_KEY"))
+
+    return shared("supabase", make)
+
+
+def override(name: str, instance):
+    """
+    Replaces a shared client, e.g. with a fake in the benchmarks.
+    """
+    with _lock:
+        _instances[name] = instance
+
+
+class LazyModule:
+    """
+    Stands in for a module and imports it on first attribute access, so
+    `models = LazyModule("qdrant_client.models")` costs nothing until
+    `models.Filter` is actually used.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
@@ -0,0 +1,146 @@
+import math
+import os
+import numpy as np
+from dotenv import load_dotenv
+from custom_types import DocumentSource, RAGSearchResult
+from chunker import CHUNK_SIZE, CHUNK_OVERLAP, CHARS_PER_TOKEN
+
+load_dotenv()
+
+# --------------------------------------------------
+# Context selection: MMR + token-budget packing
+# --------------------------------------------------
+# Retrieval over-fetches candidates with their vectors. Maximal marginal
+# relevance picks chunks that are relevant but unlike the ones already
+# picked, overlap carried between neighbouring chunks is trimmed, and the
+# result is packed up to a token budget.
+
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "20"))
+# Room for a few whole chunks (CHUNK_SIZE is in tokens)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", str(4 * CHUNK_SIZE)))
+# 1.0 ranks by relevance only; lower values favour diversity
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Most chunks one PDF may contribute when a question spans several PDFs;
+# retrieval is grouped by PDF to match. 0 turns grouping off.
+CONTEXT_PER_DOCUMENT = int(os.getenv("CONTEXT_PER_DOCUMENT", "3"))
+# Chunks this similar to an already packed one add nothing
+DUPLICATE_SIMILARITY = float(os.getenv("DUPLICATE_SIMILARITY", "0.95"))
+
+# The chunker overlaps neighbours by up to CHUNK_OVERLAP tokens (capped at
+# half a chunk); shorter matches are coincidence
+MIN_OVERLAP_CHARS = 40
+MAX_OVERLAP_CHARS = min(int(CHUNK_OVERLAP * CHARS_PER_TOKEN), int(CHUNK_SIZE * CHARS_PER_TOKEN) // 2)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English prose
+    return math.ceil(len(text) / 4)
+
+
+def _overlap(left: str, right: str) -> int:
+    """
+    Length of the longest suffix of `left` that is also a prefix of `right`.
+    """
+    limit = min(len(left), len(right), MAX_OVERLAP_CHARS)
+    for k in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:k]):
+            return k
+    return 0
+
+
+def _trim(text: str, packed: list[str]) -> str:
+    """
+    Removes text already present in packed chunks: a chunk contained in
+    one of them becomes empty, and overlap at either end is cut off.
+    """
+    for other in packed:
+        if text in other:
+            return ""
+        head = _overlap(other, text)
+        if head:
+            text = text[head:].lstrip()
+        tail = _overlap(text, other)
+        if tail:
+            text = text[:-tail].rstrip()
+    return text
+
+
+def _unit(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def select_context(
+    query_vector,
+    candidates: list[dict],
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    lambda_mult: float = MMR_LAMBDA,
+    baseline_k: int = 5,
+    per_document: int | None = None,
+) -> RAGSearchResult:
+    """
+    Picks and packs contexts from `candidates` ({"text", "source", "vector"},
+    optionally "pdf_id" and "page"; best first). `tokens_saved` compares the
+    packed prompt with sending the first `baseline_k` candidates as they are.
+    With `per_document`, no PDF contributes more than that many contexts.
+    """
+    baseline = sum(estimate_tokens(c["text"]) for c in candidates[:baseline_k])
+    if not candidates:
+        return RAGSearchResult(contexts=[], sources=[])
+
+    vectors = _unit(np.asarray([c["vector"] for c in candidates], dtype=np.float32))
+    query = _unit(np.asarray(query_vector, dtype=np.float32))
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+
+    n = len(candidates)
+    considered = np.zeros(n, dtype=bool)
+    # Highest similarity to anything packed so far
+    redundancy = np.full(n, -1.0, dtype=np.float32)
+
+    contexts, sources, used = [], [], 0
+    documents = {}
+    for _ in range(n):
+        penalty = np.where(redundancy > -1.0, redundancy, 0.0)
+        score = lambda_mult * relevance - (1 - lambda_mult) * penalty
+        score[considered] = -np.inf
+        i = int(np.argmax(score))
+        considered[i] = True
+
+        if redundancy[i] >= DUPLICATE_SIMILARITY:
+            continue
+        key = candidates[i].get("pdf_id") or candidates[i].get("source")
+        doc = documents.get(key)
+        if per_document and doc is not None and doc.chunks >= per_document:
+            continue
+        text = _trim(candidates[i]["text"], contexts)
+        cost = estimate_tokens(text)
+        if not text or used + cost > budget:
+            continue
+
+        contexts.append(text)
+        used += cost
+        redundancy = np.maximum(redundancy, similarity[i])
+        source = candidates[i].get("source")
+        if source and source not in sources:
+            sources.append(source)
+
+        if doc is None:
+            doc = documents[key] = DocumentSource(pdf_id=candidates[i].get("pdf_id"), source=source)
+        doc.chunks += 1
+        doc.tokens += cost
+        page = candidates[i].get("page")
+        if page is not None and page not in doc.pages:
+            doc.pages.append(page)
+
+    for doc in documents.values():
+        doc.pages.sort()
+
+    return RAGSearchResult(
+        contexts=contexts,
+        sources=sources,
+        context_tokens=used,
+        tokens_saved=baseline - used,
+        documents=list(documents.values()),
+    )
@@ -0,0 +1,72 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
+from models import Conversation, Message
+import pagination
+
+
+def first_user_messages(db: Session, conversation_ids: list[str]) -> dict[str, str]:
+    """
+    First user message per conversation, in one windowed query.
+    """
+    if not conversation_ids:
+        return {}
+
+    ranked = (
+        db.query(
+            Message.conversation_id.label("conversation_id"),
+            Message.content.label("content"),
+            func.row_number().over(
+                partition_by=Message.conversation_id,
+                order_by=(Message.created_at, Message.id),
+            ).label("rn"),
+        )
+        .filter(
+            Message.conversation_id.in_(conversation_ids),
+            Message.role == "user",
+        )
+        .subquery()
+    )
+
+    rows = db.query(ranked.c.conversation_id, ranked.c.content).filter(ranked.c.rn == 1).all()
+    return {conversation_id: content for conversation_id, content in rows}
+
+
+def list_conversations(db: Session, user_id: str, limit: int = 50, before: str | None = None) -> list[dict]:
+    """
+    A page of the user's conversations, newest first, with title and PDFs.
+
+    Always three queries no matter how many conversations are on the page:
+    the page itself, its PDFs (selectin), and the titles (window function).
+    """
+    query = (
+        db.query(Conversation)
+        .options(selectinload(Conversation.pdfs))
+        .filter(Conversation.user_id == user_id)
+    )
+    if before:
+        query = query.filter(pagination.before(Conversation.created_at, Conversation.id, before))
+
+    conversations = (
+        query.order_by(Conversation.created_at.desc(), Conversation.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+    titles = first_user_messages(db, [c.id for c in conversations])
+
+    result = []
+    for c in conversations:
+        # Determine title from the first user message
+        first_message = titles.get(c.id)
+        title = first_message[:40] + "..." if first_message else "New Chat"
+
+        result.append({
+            "id": c.id,
+            "title": title,
+            # 🔹 Group all PDFs linked to this specific conversation
+            "pdfs": [{"id": p.id, "filename": p.filename} for p in c.pdfs],
+            "created_at": c.created_at,
+            "cursor": pagination.encode_cursor(c.created_at, c.id),
+        })
+
+    return result
@@ -1,15 +1,34 @@
 import pydantic
 
-class RAGChunkAndSrc(pydantic.BaseModel):
-    chunks: list[str]
-    source_id: str = None
+class ArtifactRef(pydantic.BaseModel):
+    # sha256 of the uncompressed content; see artifacts.py
+    key: str
+    items: int
+    size: int
+    stored_size: int
 
 class RAGUpsertResult(pydantic.BaseModel):
     ingested: int
+    # Points that were already in Qdrant from an earlier attempt
+    skipped: int = 0
+
+class DocumentSource(pydantic.BaseModel):
+    # What one PDF contributed to an answer's context
+    pdf_id: str | None = None
+    source: str | None = None
+    chunks: int = 0
+    tokens: int = 0
+    pages: list[int] = []
 
 class RAGSearchResult(pydantic.BaseModel):
     contexts: list[str]
     sources: list[str]
+    # Estimated prompt tokens of the packed contexts, and how many fewer that
+    # is than sending the top-k chunks unprocessed
+    context_tokens: int = 0
+    tokens_saved: int = 0
+    # Per-PDF breakdown of the contexts, in order of first appearance
+    documents: list[DocumentSource] = []
 
 class RAGQueryResult(pydantic.BaseModel):
     answer: str
@@ -1,62 +1,121 @@
 import os
-from langchain_community.document_loaders import PyPDFLoader 
-from llama_index.core.node_parser import SentenceSplitter
-from google import genai
+from typing import Iterable, Iterator
 from dotenv import load_dotenv
+from embed_cache import get_cache, cache_key
+from embedder import EmbeddingEngine
+from chunker import chunk_pages
+import clients
+import ratelimit
 
 load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 EMBED_MODEL = "gemini-embedding-001"
+NATIVE_DIM = 3072
+# 768 or 1536 trade a little recall for a much smaller index; must match the
+# collection's vector size (see StorageProfile in vector_db.py)
+EMBED_DIM = int(os.getenv("EMBED_DIM", str(NATIVE_DIM)))
 
-# SentenceSplitter ensures we don't cut off sentences mid-thought
-splitter = SentenceSplitter(chunk_size=1000, chunk_overlap=200)
+# Truncated vectors are different vectors, so they get their own cache keys
+CACHE_MODEL = EMBED_MODEL if EMBED_DIM == NATIVE_DIM else f"{EMBED_MODEL}@{EMBED_DIM}"
 
-def load_and_chunk_pdf(pdf_path: str) -> list[str]:
+# Your Gemini quota for the embedding model (see ratelimit.py); 0 = no limit
+EMBED_RPM = int(os.getenv("EMBED_RPM", "3000"))
+EMBED_TPM = int(os.getenv("EMBED_TPM", "1000000"))
+ratelimit.configure(EMBED_MODEL, rpm=EMBED_RPM, tpm=EMBED_TPM)
+
+def get_engine() -> EmbeddingEngine:
     """
-    Standard PDF extraction and chunking.
+    Process-wide embedding engine on the shared Gemini client.
     """
-    try:
-        # 1. Load the PDF
-        loader = PyPDFLoader(pdf_path)
-        pages = loader.load()
-        
-        # 2. Combine page content
-        full_text = " ".join([p.page_content for p in pages])
-        
-        # 3. Guard clause for empty/scanned PDFs
-        if not full_text.strip():
-            print(f"⚠️ Warning: No text extracted from {pdf_path}. Document might be scanned.")
-            return []
-
-        # 4. Use semantic splitting for RAG chunks
-        chunks = splitter.split_text(full_text)
-        return chunks
+    return clients.shared(
+        "embedding_engine",
+        lambda: EmbeddingEngine(clients.gemini(), EMBED_MODEL, output_dim=EMBED_DIM if EMBED_DIM != NATIVE_DIM else None),
+    )
+
+class PdfParseError(Exception):
+    """
+    The file could not be read as a PDF.
+    """
+
 
+def iter_pages(pdf_path: str) -> Iterator[str]:
+    """
+    Yields page texts one at a time instead of loading the whole document.
+    Raises PdfParseError when pypdf can't read the file or one of its pages.
+    """
+    from pypdf import PdfReader
+    try:
+        pages = PdfReader(pdf_path).pages
+        count = len(pages)
     except Exception as e:
-        print(f"❌ Error loading PDF: {e}")
+        raise PdfParseError(f"{os.path.basename(pdf_path)}: {e}") from e
+
+    for i in range(count):
+        try:
+            text = pages[i].extract_text() or ""
+        except Exception as e:
+            raise PdfParseError(f"{os.path.basename(pdf_path)}, page {i + 1}: {e}") from e
+        yield text
+
+def iter_chunks(pages: Iterable[str]) -> Iterator[dict]:
+    """
+    Streams pages into {"text", "page", "char_offset"} chunks; see chunker.py.
+    """
+    return chunk_pages(pages)
+
+def _split_cached(texts: list[str]):
+    """
+    Returns the cache keys for texts, the vectors already cached, and the
+    distinct texts that still need embedding (keyed by cache key).
+    """
+    cache = get_cache()
+    keys = [cache_key(CACHE_MODEL, t) for t in texts]
+    cached = cache.get_many(keys)
+
+    # Embed each distinct missing text once, even if it repeats in the input
+    missing = {}
+    for k, t in zip(keys, texts):
+        if k not in cached and k not in missing:
+            missing[k] = t
+
+    return keys, cached, missing
+
+
+def _store_fresh(cached: dict, missing: dict, vectors: list[list[float]]):
+    fresh = dict(zip(missing, vectors))
+    get_cache().put_many(fresh)
+    cached.update(fresh)
+
+
+def embed_text(texts: list[str], priority: str = ratelimit.INGEST, user: str | None = None) -> list[list[float]]:
+    """
+    Embeds text using Gemini with concurrent batching for high performance.
+    Vectors are looked up in the embedding cache first; only misses hit the API.
+    Raises once the engine has exhausted its retries, so the calling Inngest
+    step fails and is retried instead of silently storing nothing.
+    `priority` and `user` pick the rate-limit buckets (ratelimit.py).
+    """
+    if not texts:
         return []
 
-def embed_text(texts: list[str]) -> list[list[float]]:
+    keys, cached, missing = _split_cached(texts)
+    if missing:
+        vectors = get_engine().embed_sync(list(missing.values()), priority, user)
+        _store_fresh(cached, missing, vectors)
+
+    return [cached[k] for k in keys]
+
+
+async def aembed_text(texts: list[str], priority: str = ratelimit.INGEST, user: str | None = None) -> list[list[float]]:
     """
-    Embeds text using Gemini with Batching for high performance.
+    Async twin of embed_text for code already running on the event loop.
     """
     if not texts:
         return []
 
-    try:
-        # We process in batches of 50 to keep API requests stable
-        all_embeddings = []
-        for i in range(0, len(texts), 50):
-            batch = texts[i:i + 50]
-            result = client.models.embed_content(
-                model=EMBED_MODEL,
-                contents=batch,
-            )
-            all_embeddings.extend([e.values for e in result.embeddings])
-            
-        return all_embeddings
+    keys, cached, missing = _split_cached(texts)
+    if missing:
+        vectors = await get_engine().embed(list(missing.values()), priority, user)
+        _store_fresh(cached, missing, vectors)
 
-    except Exception as e:
-        print(f"❌ Batch embedding failed: {e}")
-        return []
\ No newline at end of file
+    return [cached[k] for k in keys]
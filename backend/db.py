@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
@@ -6,9 +8,48 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Pool settings, shared by the sync and async engines (each gets its own pool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds
+
+
+def _pool_kwargs(url) -> dict:
+    # SQLite uses its own single-file pool that rejects these options
+    if url.get_backend_name() == "sqlite":
+        return {}
+    return dict(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+
+
+def async_url(url: str):
+    """
+    Maps DATABASE_URL onto its async driver: asyncpg for Postgres,
+    aiosqlite for SQLite. libpq's sslmode becomes asyncpg's ssl.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+
+    if backend == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+        sslmode = url.query.get("sslmode")
+        if sslmode:
+            url = url.difference_update_query(["sslmode"]).update_query_dict({"ssl": sslmode})
+    elif backend == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+
+    return url
+
+
 engine = create_engine(
     DATABASE_URL,
     pool_pre_ping=True,
+    **_pool_kwargs(make_url(DATABASE_URL)),
 )
 
 SessionLocal = sessionmaker(
@@ -17,6 +58,23 @@ SessionLocal = sessionmaker(
     bind=engine,
 )
 
+ASYNC_DATABASE_URL = async_url(os.getenv("ASYNC_DATABASE_URL") or DATABASE_URL)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    **_pool_kwargs(ASYNC_DATABASE_URL),
+)
+
+# expire_on_commit=False: attributes stay readable after commit without an
+# implicit (and, under asyncio, illegal) lazy refresh
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -24,3 +82,6 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
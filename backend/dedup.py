@@ -0,0 +1,139 @@
+from datetime import datetime
+from sqlalchemy import exists, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import PDFContent, UploadedPDF
+
+# --------------------------------------------------
+# Content-hash deduplication of uploaded PDFs
+# --------------------------------------------------
+# Vectors belong to a PDFContent (sha256 of the file). Uploads of the same
+# bytes share them, and they are purged only when the last UploadedPDF that
+# points at the content is deleted.
+
+
+def _insert_ignore(dialect: str, rows: list[dict]):
+    """
+    INSERT ... ON CONFLICT DO NOTHING, or None on dialects without it.
+    """
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(PDFContent).values(rows).on_conflict_do_nothing(index_elements=["content_hash"])
+
+
+async def ensure_contents(db: AsyncSession, content_hashes) -> None:
+    """
+    Creates the PDFContent rows that don't exist yet. Safe against a
+    concurrent upload of the same file.
+    """
+    rows = [{"content_hash": h, "created_at": datetime.utcnow()} for h in set(content_hashes)]
+    if not rows:
+        return
+
+    statement = _insert_ignore(db.bind.dialect.name, rows)
+    if statement is not None:
+        await db.execute(statement)
+        return
+
+    # Portable fallback: insert the missing rows one savepoint at a time, so
+    # losing a race to a concurrent upload only rolls back that row
+    existing = set(await db.scalars(
+        select(PDFContent.content_hash).filter(PDFContent.content_hash.in_([r["content_hash"] for r in rows]))
+    ))
+    for row in rows:
+        if row["content_hash"] in existing:
+            continue
+        try:
+            async with db.begin_nested():
+                await db.execute(insert(PDFContent).values(**row))
+        except IntegrityError:
+            pass
+
+
+async def ingested_chunk_count(db: AsyncSession, content_hash: str) -> int | None:
+    """
+    Chunk count of a fully ingested content, or None if it still needs ingesting.
+    """
+    content = await db.get(PDFContent, content_hash)
+    if content is None or content.ingested_at is None:
+        return None
+    return content.chunk_count
+
+
+async def mark_ingested(db: AsyncSession, content_hash: str, chunk_count: int) -> None:
+    await db.execute(
+        update(PDFContent)
+        .where(PDFContent.content_hash == content_hash)
+        .values(chunk_count=chunk_count, ingested_at=datetime.utcnow())
+    )
+
+
+def _referenced_hashes(db: Session, content_hashes) -> set[str]:
+    if not content_hashes:
+        return set()
+    return set(db.scalars(
+        select(UploadedPDF.content_hash).filter(UploadedPDF.content_hash.in_(set(content_hashes))).distinct()
+    ))
+
+
+def unreferenced_hashes(db: Session, content_hashes) -> list[str]:
+    """
+    The hashes no UploadedPDF points at. Checked again by the background
+    delete, in case the same file was uploaded after the purge was decided.
+    """
+    return sorted(set(content_hashes or []) - _referenced_hashes(db, content_hashes))
+
+
+def orphan_points(db: Session, points) -> list:
+    """
+    Given (point_id, pdf_id, content_hash) tuples, returns the ids of points
+    neither their PDF nor any PDF sharing their content still owns.
+    """
+    pdf_ids = {pdf_id for _, pdf_id, _ in points if pdf_id}
+    live_pdfs = set(db.scalars(select(UploadedPDF.id).filter(UploadedPDF.id.in_(pdf_ids)))) if pdf_ids else set()
+    live_hashes = _referenced_hashes(db, {h for _, _, h in points if h})
+
+    return [
+        point_id
+        for point_id, pdf_id, content_hash in points
+        if pdf_id not in live_pdfs and content_hash not in live_hashes
+    ]
+
+
+def vectors_to_purge(db: Session, pdfs: list[UploadedPDF]) -> tuple[list[str], list[str]]:
+    """
+    Given PDFs about to be deleted, returns (pdf_ids, content_hashes) whose
+    vectors can go: legacy PDFs by id, and contents no other PDF still uses.
+    """
+    doomed = {p.id for p in pdfs}
+    legacy_ids = sorted(p.id for p in pdfs if not p.content_hash)
+    hashes = {p.content_hash for p in pdfs if p.content_hash}
+    if not hashes:
+        return legacy_ids, []
+
+    still_used = set(db.scalars(
+        select(UploadedPDF.content_hash).filter(
+            UploadedPDF.content_hash.in_(hashes),
+            UploadedPDF.id.not_in(doomed),
+        )
+    ))
+    return legacy_ids, sorted(hashes - still_used)
+
+
+def drop_unused_contents(db: Session, content_hashes: list[str]) -> None:
+    """
+    Deletes PDFContent rows that no UploadedPDF references any more. Call
+    after the PDFs themselves have been deleted (flushed) in this session.
+    """
+    if not content_hashes:
+        return
+
+    db.query(PDFContent).filter(
+        PDFContent.content_hash.in_(content_hashes),
+        ~exists().where(UploadedPDF.content_hash == PDFContent.content_hash),
+    ).delete(synchronize_session=False)
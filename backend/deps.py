@@ -1,23 +1,147 @@
-from fastapi import Depends, HTTPException, Header
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from fastapi import Depends, HTTPException, Request
 from jose import jwt
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from auth import SECRET_KEY, ALGORITHM
 from db import get_db
 from models import User
+from schemas import CurrentUser
+
+# How long a verified token is trusted without looking the user up again
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+# Bearer token for the internal routes (/metrics, /embed-cache/stats) that
+# Prometheus and ops tooling call; unset, those routes answer 404
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+
+
+class _AuthCache:
+    """
+    token -> CurrentUser, bounded by size (LRU) and by time: entries expire
+    after AUTH_CACHE_TTL seconds or when the token itself does, whichever
+    comes first.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # token -> (user, expires_at)
+        self._tokens_by_user = {}  # user_id -> set of tokens
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.time():
+                self._drop(token)
+                return None
+            self._entries.move_to_end(token)
+            return user
+
+    def put(self, token, user, token_exp=None):
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+
+        with self._lock:
+            self._drop(token)
+            self._entries[token] = (user, expires_at)
+            self._tokens_by_user.setdefault(user.id, set()).add(token)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_token(self, token):
+        with self._lock:
+            self._drop(token)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._drop(token)
+
+    def _drop(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry[0].id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[0].id]
+
+
+_cache = _AuthCache(AUTH_CACHE_TTL, AUTH_CACHE_SIZE)
+
+
+def _token_from_request(request: Request) -> str | None:
+    token = request.cookies.get("token")
+    if token:
+        return token
+
+    # Non-browser clients can send the same JWT as a bearer token
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    return None
+
 
 def get_current_user(
-    authorization: str = Header(...),
-    db: Session = Depends(get_db)
-):
+    request: Request,
+    db: Session = Depends(get_db),
+) -> CurrentUser:
+    token = _token_from_request(request)
+
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    user = _cache.get(token)
+    if user is not None:
+        return user
+
     try:
-        token = authorization.split(" ")[1]
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-    except:
-        raise HTTPException(401, "Invalid token")
+        user_id = payload["sub"]
+    except Exception as e:
+        print("JWT ERROR:", e)
+        raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(401, "User not found")
+    row = db.query(User.id, User.email).filter(User.id == user_id).first()
+    if not row:
+        raise HTTPException(status_code=401, detail="User not found")
 
+    user = CurrentUser(id=row.id, email=row.email)
+    _cache.put(token, user, payload.get("exp"))
     return user
+
+
+def require_internal_token(request: Request):
+    if not INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=404)
+
+    # Only the bearer header: a user's cookie never opens these routes
+    authorization = request.headers.get("authorization", "")
+    token = authorization[7:] if authorization.lower().startswith("bearer ") else ""
+    if not hmac.compare_digest(token.encode(), INTERNAL_API_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+
+def invalidate_token(token: str | None):
+    if token:
+        _cache.invalidate_token(token)
+
+
+def invalidate_user(user_id: str):
+    _cache.invalidate_user(user_id)
+
+
+@event.listens_for(User, "after_delete")
+def _forget_deleted_user(mapper, connection, target):
+    invalidate_user(target.id)
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_DIR = os.getenv("EMBED_CACHE_DIR", ".cache")
+CACHE_MEMORY_ITEMS = int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", "4096"))
+CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # 1 GB
+
+
+def cache_key(model: str, text: str) -> str:
+    """
+    Content address of an embedding: same model + same text -> same vector.
+    """
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-memory LRU in front of a size-bounded
+    SQLite file. Vectors are stored on disk as packed float32.
+    """
+
+    def __init__(self, path=None, memory_items=CACHE_MEMORY_ITEMS, max_bytes=CACHE_MAX_BYTES):
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "embeddings.sqlite3")
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed_at ON embeddings (accessed_at)")
+        self._db.commit()
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        missing = []
+
+        with self._lock:
+            for k in keys:
+                if k in self._memory:
+                    self._memory.move_to_end(k)
+                    found[k] = self._memory[k]
+                else:
+                    missing.append(k)
+
+            if missing:
+                now = time.time()
+                for i in range(0, len(missing), 500):
+                    batch = missing[i:i + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                    for k, blob in rows:
+                        vector = array("f", blob).tolist()
+                        found[k] = vector
+                        self._remember(k, vector)
+                    if rows:
+                        self._db.executemany(
+                            "UPDATE embeddings SET accessed_at = ? WHERE key = ?",
+                            [(now, k) for k, _ in rows],
+                        )
+                self._db.commit()
+
+            hits = sum(1 for k in keys if k in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        return found
+
+    def put_many(self, items: dict[str, list[float]]):
+        if not items:
+            return
+
+        now = time.time()
+        rows = []
+        for k, vector in items.items():
+            blob = array("f", vector).tobytes()
+            rows.append((k, blob, len(blob), now))
+
+        with self._lock:
+            for k, vector in items.items():
+                self._remember(k, vector)
+
+            cur = self._db.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, size, accessed_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            if cur.rowcount > 0:
+                # rowcount is the number of rows actually inserted; approximate
+                # their size with the average of this batch.
+                self._disk_bytes += cur.rowcount * (sum(r[2] for r in rows) // len(rows))
+            self._db.commit()
+
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """
+        Drop least recently used rows until the file is back under 90% of
+        its budget, so we don't evict again on the very next insert.
+        """
+        target = int(self.max_bytes * 0.9)
+        while self._disk_bytes > target:
+            rows = self._db.execute(
+                "SELECT key, size FROM embeddings ORDER BY accessed_at LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+
+            to_delete = []
+            for k, size in rows:
+                to_delete.append((k,))
+                self._disk_bytes -= size
+                if self._disk_bytes <= target:
+                    break
+
+            self._db.executemany("DELETE FROM embeddings WHERE key = ?", to_delete)
+        self._db.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> EmbeddingCache:
+    """
+    Process-wide cache, opened on first use.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
+
+
+def cache_stats() -> dict:
+    return get_cache().stats()
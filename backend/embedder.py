@@ -0,0 +1,171 @@
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from metrics import EMBED_BATCH_TEXTS, external
+from clients import LazyModule
+import ratelimit
+
+load_dotenv()
+
+types = LazyModule("google.genai.types")
+
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "100"))  # Gemini's per-request limit
+EMBED_MAX_BATCH_CHARS = int(os.getenv("EMBED_MAX_BATCH_CHARS", "60000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "4"))
+EMBED_BACKOFF_SECONDS = float(os.getenv("EMBED_BACKOFF_SECONDS", "0.5"))
+
+
+def _normalize(v: list[float]) -> list[float]:
+    norm = sum(x * x for x in v) ** 0.5
+    return [x / norm for x in v] if norm else list(v)
+
+
+class EmbeddingEngine:
+    """
+    Runs Gemini embedding batches concurrently.
+
+    Batches are packed by item count and total characters, so a few huge
+    chunks don't produce an oversized request while many tiny ones still
+    share a round trip. Failed batches are retried with exponential backoff
+    and results are always returned in input order.
+
+    With `output_dim` set the model returns truncated vectors; only the full
+    3072-dim output comes back normalized, so those are rescaled to unit length.
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str,
+        concurrency: int = EMBED_CONCURRENCY,
+        max_batch: int = EMBED_MAX_BATCH,
+        max_batch_chars: int = EMBED_MAX_BATCH_CHARS,
+        max_retries: int = EMBED_MAX_RETRIES,
+        backoff: float = EMBED_BACKOFF_SECONDS,
+        output_dim: int | None = None,
+    ):
+        self.client = client
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.max_batch = max_batch
+        self.max_batch_chars = max_batch_chars
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.output_dim = output_dim
+        self.config = types.EmbedContentConfig(output_dimensionality=output_dim) if output_dim else None
+
+    def make_batches(self, texts: list[str]) -> list[tuple[int, int]]:
+        """
+        Split texts into [start, end) ranges that respect both the item and
+        character budgets. A single text larger than the char budget gets a
+        batch of its own.
+        """
+        batches = []
+        start = 0
+        chars = 0
+        for i, t in enumerate(texts):
+            size = len(t)
+            if i > start and (i - start >= self.max_batch or chars + size > self.max_batch_chars):
+                batches.append((start, i))
+                start = i
+                chars = 0
+            chars += size
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    def _values(self, result) -> list[list[float]]:
+        vectors = [e.values for e in result.embeddings]
+        if not self.output_dim:
+            return vectors
+        return [_normalize(v) for v in vectors]
+
+    def _delay(self, attempt: int) -> float:
+        # Full jitter so concurrent batches don't retry in lockstep
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    # ---------------- async ----------------
+
+    async def _embed_batch_async(self, batch: list[str], priority: str, user: str | None) -> list[list[float]]:
+        EMBED_BATCH_TEXTS.observe(len(batch))
+        tokens = ratelimit.estimate_tokens(batch)
+        for attempt in range(self.max_retries + 1):
+            try:
+                await ratelimit.aacquire(self.model, tokens, priority=priority, user=user)
+                with external("gemini", "embed"):
+                    result = await self.client.aio.models.embed_content(
+                        model=self.model,
+                        contents=batch,
+                        config=self.config,
+                    )
+                return self._values(result)
+            except ratelimit.RateLimited:
+                # Already waited RATE_LIMIT_MAX_WAIT; let the step retry later
+                raise
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"⚠️ Embedding batch failed (attempt {attempt + 1}), retrying: {e}")
+                await asyncio.sleep(self._delay(attempt))
+
+    async def embed(
+        self, texts: list[str], priority: str = ratelimit.INGEST, user: str | None = None
+    ) -> list[list[float]]:
+        if not texts:
+            return []
+
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def run(start, end):
+            async with sem:
+                return await self._embed_batch_async(texts[start:end], priority, user)
+
+        ranges = self.make_batches(texts)
+        results = await asyncio.gather(*(run(s, e) for s, e in ranges))
+        return [v for batch in results for v in batch]
+
+    # ---------------- sync ----------------
+
+    def _embed_batch_sync(self, batch: list[str], priority: str, user: str | None) -> list[list[float]]:
+        EMBED_BATCH_TEXTS.observe(len(batch))
+        tokens = ratelimit.estimate_tokens(batch)
+        for attempt in range(self.max_retries + 1):
+            try:
+                ratelimit.acquire(self.model, tokens, priority=priority, user=user)
+                with external("gemini", "embed"):
+                    result = self.client.models.embed_content(
+                        model=self.model,
+                        contents=batch,
+                        config=self.config,
+                    )
+                return self._values(result)
+            except ratelimit.RateLimited:
+                # Already waited RATE_LIMIT_MAX_WAIT; let the step retry later
+                raise
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"⚠️ Embedding batch failed (attempt {attempt + 1}), retrying: {e}")
+                time.sleep(self._delay(attempt))
+
+    def embed_sync(
+        self, texts: list[str], priority: str = ratelimit.INGEST, user: str | None = None
+    ) -> list[list[float]]:
+        """
+        Blocking entry point, safe to call from inside a running event loop
+        (e.g. an Inngest step). Batches run on a thread pool.
+        """
+        if not texts:
+            return []
+
+        ranges = self.make_batches(texts)
+        if len(ranges) == 1:
+            return self._embed_batch_sync(texts, priority, user)
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(ranges))) as pool:
+            results = pool.map(lambda r: self._embed_batch_sync(texts[r[0]:r[1]], priority, user), ranges)
+            return [v for batch in results for v in batch]
@@ -0,0 +1,104 @@
+import os
+from typing import AsyncIterator
+from dotenv import load_dotenv
+from metrics import external, record_usage
+import clients
+import ratelimit
+
+load_dotenv()
+
+ANSWER_MODEL = "gemini-2.5-flash"
+# Your Gemini quota for the answer model (see ratelimit.py); 0 = no limit
+ANSWER_RPM = int(os.getenv("ANSWER_RPM", "1000"))
+ANSWER_TPM = int(os.getenv("ANSWER_TPM", "1000000"))
+ratelimit.configure(ANSWER_MODEL, rpm=ANSWER_RPM, tpm=ANSWER_TPM)
+# Output tokens counted against ANSWER_TPM up front, before the real count is known
+ANSWER_OUTPUT_TOKENS = int(os.getenv("ANSWER_OUTPUT_TOKENS", "500"))
+
+def build_prompt(contexts: list[str], question: str) -> str:
+    context_block = "\n\n".join(contexts)
+
+    prompt = f"""
+You are CortexAI, a highly intelligent research assistant. 
+
+INSTRUCTIONS:
+1. If the "Document Context" provided below contains information relevant to the question, prioritize it. 
+2. Combine the information from the documents with your own extensive knowledge to provide a comprehensive and insightful answer.
+3. If the "Document Context" is missing, irrelevant, or insufficient, use your general knowledge to help the user. 
+4. If you are relying ONLY on general knowledge because the documents are silent on the topic, start your response with: "I couldn't find specific details in your documents, but based on general knowledge..."
+5. Be concise and give short answers with proper explanations.
+6. If you truly do not know the answer even with your general knowledge, say: "I'm sorry, I don't have the answer to that question."
+
+FORMAT RULES (VERY IMPORTANT):
+- Always return valid Markdown.
+- Use "-" for bullet points (NOT •).
+- Use **bold** with exactly two asterisks.
+- Never mix * and ** incorrectly.
+- Do NOT output broken markdown.
+
+
+Context:
+{context_block}
+
+Question:
+{question}
+"""
+
+    return prompt
+
+def _tokens(prompt: str) -> int:
+    return ratelimit.estimate_tokens([prompt]) + ANSWER_OUTPUT_TOKENS
+
+def generate_answer(contexts: list[str], question: str, user: str | None = None) -> str:
+    prompt = build_prompt(contexts, question)
+    ratelimit.acquire(ANSWER_MODEL, _tokens(prompt), priority=ratelimit.QUERY, user=user)
+    with external("gemini", "generate"):
+        response = clients.gemini().models.generate_content(
+            model=ANSWER_MODEL,
+            contents=prompt,
+        )
+    record_usage(response)
+
+    return response.text.strip()
+
+async def agenerate_answer(contexts: list[str], question: str, user: str | None = None) -> str:
+    """
+    generate_answer for code on the event loop: waiting for rate-limit
+    capacity and the Gemini call don't block other requests.
+    """
+    prompt = build_prompt(contexts, question)
+    await ratelimit.aacquire(ANSWER_MODEL, _tokens(prompt), priority=ratelimit.QUERY, user=user)
+    with external("gemini", "generate"):
+        response = await clients.gemini().aio.models.generate_content(
+            model=ANSWER_MODEL,
+            contents=prompt,
+        )
+    record_usage(response)
+
+    return response.text.strip()
+
+async def generate_answer_stream(
+    contexts: list[str], question: str, user: str | None = None
+) -> AsyncIterator[str]:
+    """
+    Yields the answer text piece by piece as Gemini produces it.
+    """
+    prompt = build_prompt(contexts, question)
+    await ratelimit.aacquire(ANSWER_MODEL, _tokens(prompt), priority=ratelimit.QUERY, user=user)
+    with external("gemini", "generate_first_token"):
+        stream = await clients.gemini().aio.models.generate_content_stream(
+            model=ANSWER_MODEL,
+            contents=prompt,
+        )
+        first = await anext(stream, None)
+
+    last = first
+    with external("gemini", "generate_stream_rest"):
+        if first is not None and first.text:
+            yield first.text
+        async for chunk in stream:
+            last = chunk
+            if chunk.text:
+                yield chunk.text
+    # Usage metadata arrives with the final chunk
+    record_usage(last)
@@ -1,44 +1,76 @@
+import asyncio
+import hashlib
+import json
 import logging
 import os
 import uuid
 from datetime import datetime
 from fastapi import UploadFile, File, Form
-from jose import jwt
-from pathlib import Path
-from fastapi import FastAPI, Depends, HTTPException, Response, Request
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Response, Request, Query
 import inngest
 import inngest.fast_api
 from dotenv import load_dotenv
-from google import genai
-from sqlalchemy.orm import Session
-from data_loader import load_and_chunk_pdf, embed_text
-from vector_db import QdrantStorage
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from data_loader import PdfParseError, iter_pages, iter_chunks, aembed_text
+from embed_cache import cache_stats
+from generation import agenerate_answer, generate_answer_stream
+from vector_db import get_storage, get_async_storage, get_summary_storage
+from context import select_context, CONTEXT_CANDIDATES, CONTEXT_PER_DOCUMENT
+from pipeline import ingest_stream
+from storage import iter_upload, hashing, upload_stream
+from dedup import (
+    ensure_contents, ingested_chunk_count, mark_ingested, vectors_to_purge, drop_unused_contents,
+    unreferenced_hashes, orphan_points,
+)
 from custom_types import (
+    ArtifactRef,
     RAGSearchResult,
     RAGUpsertResult,
-    RAGChunkAndSrc,
 )
-from db import get_db
-from models import User, Conversation, Message, UploadedPDF
+import artifacts
+from db import get_db, get_async_db, SessionLocal, AsyncSessionLocal
+from deps import get_current_user, invalidate_token, require_internal_token
+from notifier import notifier
+import pagination
+from conversations import list_conversations
+from models import User, Conversation, Message, UploadedPDF, conversation_pdfs
 from auth import hash_password, verify_password, create_access_token
 from schemas import RegisterSchema, LoginSchema, QueryPdfSchema
 from fastapi.middleware.cors import CORSMiddleware
-from qdrant_client import models
-from supabase import create_client, Client
+from fastapi.responses import StreamingResponse
+import metrics
+import tracing
+import ratelimit
+import clients
+import routing
 # --------------------------------------------------
 # Setup
 # --------------------------------------------------
 
 load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
-url = os.environ.get("SUPABASE_URL")
-key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") # Use Service Role for backend
-supabase: Client = create_client(url, key)
+# Files streamed to Supabase at the same time per /upload-pdf request
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+# Chunks sent per question before context packing; now only the baseline
+# that tokens_saved is measured against
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "5"))
+# Orphaned-vector sweep: schedule, points per page, pages per step, and
+# steps per run before the sweep continues in a fresh run (Inngest caps
+# the steps of one run at about 1000)
+VECTOR_GC_CRON = os.getenv("VECTOR_GC_CRON", "0 3 * * *")
+VECTOR_GC_PAGE_SIZE = int(os.getenv("VECTOR_GC_PAGE_SIZE", "1000"))
+VECTOR_GC_PAGES_PER_STEP = int(os.getenv("VECTOR_GC_PAGES_PER_STEP", "10"))
+VECTOR_GC_STEPS_PER_RUN = int(os.getenv("VECTOR_GC_STEPS_PER_RUN", "200"))
+# Runs of each function one user can have going at once
+INGEST_CONCURRENCY_PER_USER = int(os.getenv("INGEST_CONCURRENCY_PER_USER", "2"))
+QUERY_CONCURRENCY_PER_USER = int(os.getenv("QUERY_CONCURRENCY_PER_USER", "4"))
+# Gemini, Supabase and Qdrant clients are built on first use (clients.py),
+# so a fresh worker can answer its first request sooner
 
 app = FastAPI()
+app.add_middleware(metrics.MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000","https://cortex-ai-pi.vercel.app"],
@@ -55,36 +87,6 @@ inngest_client = inngest.Inngest(
     serializer=inngest.PydanticSerializer(),
 )
 
-# --------------------------------------------------
-# 🔐 AUTH HELPERS (NEW)
-# --------------------------------------------------
-
-def get_current_user(
-    request: Request,
-    db: Session = Depends(get_db),
-):
-    token = request.cookies.get("token")
-
-    if not token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-
-    try:
-        payload = jwt.decode(
-            token,
-            os.getenv("JWT_SECRET"),
-            algorithms=["HS256"],
-        )
-        user_id = payload["sub"]
-    except Exception as e:
-        print("JWT ERROR:", e)
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-
-    return user
-
 from typing import List
 from fastapi import UploadFile, File
 
@@ -93,47 +95,71 @@ async def upload_pdf(
     files: List[UploadFile] = File(...),   # ✅ multiple PDFs
     conversation_id: str | None = Form(None),
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     # 1️⃣ Get or create conversation
     if conversation_id:
-        conv = db.query(Conversation).filter(
-            Conversation.id == conversation_id,
-            Conversation.user_id == user.id
-        ).first()
+        conv = await db.scalar(
+            select(Conversation)
+            .options(selectinload(Conversation.pdfs))
+            .filter(
+                Conversation.id == conversation_id,
+                Conversation.user_id == user.id
+            )
+        )
         if not conv:
             raise HTTPException(status_code=404, detail="Conversation not found")
     else:
-        conv = Conversation(id=str(uuid.uuid4()), user_id=user.id)
+        # Committed together with the PDFs below
+        conv = Conversation(id=str(uuid.uuid4()), user_id=user.id, pdfs=[])
         db.add(conv)
-        db.commit()
-        db.refresh(conv)
 
-    uploaded_pdfs = []
+    # 2️⃣ Stream every PDF to Supabase, up to UPLOAD_CONCURRENCY at a time
+    sem = asyncio.Semaphore(UPLOAD_CONCURRENCY)
 
-    # 2️⃣ Process each PDF
-    for file in files:
+    async def _store(file: UploadFile):
         pdf_id = str(uuid.uuid4())
-        file_content = await file.read()
         storage_path = f"{user.id}/{pdf_id}.pdf"
-
-        # Upload to Supabase
-        try:
-            supabase.storage.from_("pdfs").upload(
-                path=storage_path,
-                file=file_content,
-                file_options={"content-type": "application/pdf"},
+        # Fingerprint the bytes on the way through for deduplication
+        hasher = hashlib.sha256()
+        async with sem:
+            await upload_stream(
+                "pdfs",
+                storage_path,
+                hashing(iter_upload(file), hasher),
+                content_type="application/pdf",
+                size=file.size,
             )
-        except Exception as e:
+        return pdf_id, storage_path, file.filename, hasher.hexdigest()
+
+    results = await asyncio.gather(*(_store(f) for f in files), return_exceptions=True)
+
+    failed = [r for r in results if isinstance(r, BaseException)]
+    if failed:
+        for e in failed:
             print("SUPABASE ERROR:", e)
-            raise HTTPException(status_code=500, detail="Cloud upload failed")
+        # Don't leave the files that did make it orphaned in the bucket
+        stored = [r[1] for r in results if not isinstance(r, BaseException)]
+        if stored:
+            try:
+                await asyncio.to_thread(clients.supabase().storage.from_("pdfs").remove, stored)
+            except Exception as e:
+                print(f"⚠️ Supabase cleanup after failed upload skipped: {e}")
+        raise HTTPException(status_code=500, detail="Cloud upload failed")
 
+    uploaded_pdfs = []
+    events = []
+
+    await ensure_contents(db, [r[3] for r in results])
+
+    for pdf_id, storage_path, filename, content_hash in results:
         # Save metadata in DB
         pdf = UploadedPDF(
             id=pdf_id,
             user_id=user.id,
-            filename=file.filename,
+            filename=filename,
             file_path=storage_path,
+            content_hash=content_hash,
         )
 
         db.add(pdf)
@@ -144,30 +170,34 @@ async def upload_pdf(
             Message(
                 conversation_id=conv.id,
                 role="user",
-                content=f"Uploaded: {file.filename}",
+                content=f"Uploaded: {filename}",
             )
         )
 
         uploaded_pdfs.append({
             "id": pdf_id,
-            "filename": file.filename,
+            "filename": filename,
         })
 
-        # 3️⃣ Trigger async ingestion
-        await inngest_client.send(
+        events.append(
             inngest.Event(
                 name="rag/ingest_pdf",
                 data={
                     "storage_path": storage_path,
                     "pdf_id": pdf_id,
-                    "source_id": file.filename,
+                    "content_hash": content_hash,
+                    "source_id": filename,
                     "conversation_id": conv.id,
+                    # Rate-limit share and per-user concurrency key
+                    "user_id": user.id,
                 },
             )
         )
 
-    db.commit()
-    db.refresh(conv)
+    await db.commit()
+
+    # 3️⃣ Trigger async ingestion for every file in one request
+    await inngest_client.send(events)
 
     # 4️⃣ ✅ Return updated conversation immediately (UI FIX)
     return {
@@ -233,157 +263,193 @@ def protected(request: Request):
     return {"ok": True}
 
 
+# Operational routes, for Prometheus and ops tooling only (bearer
+# INTERNAL_API_TOKEN, see deps.require_internal_token)
+internal = APIRouter(dependencies=[Depends(require_internal_token)])
+
+
+@internal.get("/metrics")
+def metrics_endpoint():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+
+@internal.get("/embed-cache/stats")
+def embed_cache_stats():
+    return cache_stats()
+
+
+app.include_router(internal)
+
+
 @app.post("/logout")
-def logout(response: Response):
+def logout(request: Request, response: Response):
+    invalidate_token(request.cookies.get("token"))
     response.delete_cookie("token")
     return {"message": "Logged out"}
 
 @app.get("/messages/{conversation_id}")
-def get_messages(
+async def get_messages(
     conversation_id: str,
+    limit: int = Query(100, ge=1, le=500),
+    before: str | None = None,
+    since: str | None = None,
+    wait: float = Query(0, ge=0, le=30),
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    messages = (
-        db.query(Message)
-        .join(Conversation)
-        .filter(
-            Conversation.id == conversation_id,
-            Conversation.user_id == user.id,
+    """
+    Keyset-paginated messages, oldest first within the page.
+
+    - default: the latest `limit` messages
+    - `before=<cursor>`: the page of older messages preceding that cursor
+    - `since=<cursor>`: only messages newer than that cursor; with `wait`,
+      hold the request up to that many seconds until one arrives
+
+    Every message carries its own `cursor`, so the client passes the last
+    one it has as `since` on the next poll.
+    """
+    async def _fetch():
+        query = (
+            select(Message)
+            .join(Conversation)
+            .filter(
+                Conversation.id == conversation_id,
+                Conversation.user_id == user.id,
+            )
         )
-        .order_by(Message.created_at)
-        .all()
-    )
+
+        if since:
+            query = query.filter(pagination.after(Message.created_at, Message.id, since))
+            return list(await db.scalars(query.order_by(Message.created_at, Message.id).limit(limit)))
+
+        if before:
+            query = query.filter(pagination.before(Message.created_at, Message.id, before))
+        rows = list(await db.scalars(query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit)))
+        rows.reverse()
+        return rows
+
+    if since and wait:
+        # Subscribe before the first read so nothing committed in between is missed
+        with notifier.subscribe(conversation_id) as waiter:
+            messages = await _fetch()
+            if not messages:
+                # Don't hold a pooled connection while waiting
+                await db.close()
+                if await waiter.wait(wait):
+                    messages = await _fetch()
+    else:
+        messages = await _fetch()
 
     return [
         {
+            "id": m.id,
             "role": m.role,
             "content": m.content,
             "type": "pdf" if m.content.lower().endswith(".pdf") else "text",
             "created_at": m.created_at,
+            "cursor": pagination.encode_cursor(m.created_at, m.id),
         }
         for m in messages
     ]
 
 # --------------------------------------------------
-# Gemini Answer Generator (UNCHANGED)
+# Ingest PDF Function: dedup -> chunk artifact -> embed + upsert
 # --------------------------------------------------
+async def ingest_pdf(ctx: inngest.Context):
+    ctx = metrics.instrument(ctx, "ingest_pdf")
+    # Missing for events sent before uploads were fingerprinted
+    content_hash = ctx.event.data.get("content_hash")
+
+    async def _find_duplicate():
+        # Chunk count if the same bytes were already fully ingested
+        if not content_hash:
+            return None
+        async with AsyncSessionLocal() as db:
+            return await ingested_chunk_count(db, content_hash)
+
+    def _load_and_chunk() -> ArtifactRef:
+        storage_path = ctx.event.data["storage_path"]
+        pdf_id = ctx.event.data.get("pdf_id")
 
-def generate_answer(contexts: list[str], question: str) -> str:
-    context_block = "\n\n".join(contexts)
-
-    prompt = f"""
-You are CortexAI, a highly intelligent research assistant. 
-
-INSTRUCTIONS:
-1. If the "Document Context" provided below contains information relevant to the question, prioritize it. 
-2. Combine the information from the documents with your own extensive knowledge to provide a comprehensive and insightful answer.
-3. If the "Document Context" is missing, irrelevant, or insufficient, use your general knowledge to help the user. 
-4. If you are relying ONLY on general knowledge because the documents are silent on the topic, start your response with: "I couldn't find specific details in your documents, but based on general knowledge..."
-5. Be concise and give short answers with proper explanations.
-6. If you truly do not know the answer even with your general knowledge, say: "I'm sorry, I don't have the answer to that question."
-
-FORMAT RULES (VERY IMPORTANT):
-- Always return valid Markdown.
-- Use "-" for bullet points (NOT •).
-- Use **bold** with exactly two asterisks.
-- Never mix * and ** incorrectly.
-- Do NOT output broken markdown.
-
-
-Context:
-{context_block}
-
-Question:
-{question}
-"""
-
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-    )
+        # 1. Download file from Supabase
+        with metrics.external("supabase", "download"):
+            response = clients.supabase().storage.from_("pdfs").download(storage_path)
 
-    return response.text.strip()
+        # 2. Write to a temporary file locally so the loaders can read it
+        temp_filename = f"temp_{pdf_id}.pdf"
+        with open(temp_filename, "wb") as f:
+            f.write(response)
+        del response
 
-# --------------------------------------------------
-# Ingest PDF Function (UNCHANGED)
-# --------------------------------------------------
-@inngest_client.create_function(
-    fn_id="RAG: Ingest PDF",
-    trigger=inngest.TriggerEvent(event="rag/ingest_pdf"),
-)
-async def rag_ingest_pdf(ctx: inngest.Context):
-
-    def _load() -> RAGChunkAndSrc:
-            storage_path = ctx.event.data["storage_path"]
-            source_id = ctx.event.data.get("source_id")
-            
-            # 1. Download file from Supabase
-            response = supabase.storage.from_("pdfs").download(storage_path)
-            
-            # 2. Write to a temporary file locally so the loaders can read it
-            temp_filename = f"temp_{ctx.event.data['pdf_id']}.pdf"
-            with open(temp_filename, "wb") as f:
-                f.write(response)
-                
-            try:
-                # 3. Process the file (This calls your OCR/Standard fallback logic)
-                chunks = load_and_chunk_pdf(temp_filename)
-            finally:
-                # 4. Clean up: Delete temp file after chunks are loaded into memory
-                if os.path.exists(temp_filename):
-                    os.remove(temp_filename)
-                    
-            return RAGChunkAndSrc(chunks=chunks, source_id=source_id)
-
-    def _upsert(chunks_and_src: RAGChunkAndSrc) -> RAGUpsertResult:
-        chunks = chunks_and_src.chunks
-        source_id = chunks_and_src.source_id
-        
+        try:
+            # 3. Stream pages -> chunks into a compressed artifact. Only its
+            # reference goes into the step result, so the run state stays the
+            # same size however long the PDF is, and a retried embed step
+            # doesn't download and parse the file again.
+            return artifacts.write_lines(artifacts.get_store(), iter_chunks(iter_pages(temp_filename)))
+        except PdfParseError as e:
+            # Retrying won't make the file readable; ingest_pdf_failed tells the user
+            print(f"❌ Error loading PDF: {e}")
+            raise inngest.NonRetriableError(f"Could not read {ctx.event.data.get('source_id')} as a PDF") from e
+        finally:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+
+    def _embed_and_upsert() -> RAGUpsertResult:
         # 🔹 CRITICAL: Get the pdf_id from the event data
         # This ID must match what you store in your SQL database
-        pdf_id = ctx.event.data.get("pdf_id") 
-
-        vectors = embed_text(chunks)
-        
-        # 🔹 Use pdf_id in the UUID generation to ensure uniqueness per document
-        ids = [
-            str(uuid.uuid5(uuid.NAMESPACE_URL, f"{pdf_id}:{i}"))
-            for i in range(len(chunks))
-        ]
-        
-        # 🔹 Add pdf_id to the payload so the search filter works!
-        payloads = [
-            {
-                "source": source_id, 
-                "text": chunks[i], 
-                "pdf_id": pdf_id
-            }
-            for i in range(len(chunks))
-        ]
+        pdf_id = ctx.event.data.get("pdf_id")
+        source_id = ctx.event.data.get("source_id")
 
-        QdrantStorage().upsert(
-            ids=ids,
-            vectors=vectors,
-            payloads=payloads,
+        # 4. Stream chunks -> embeddings -> Qdrant, batch by batch. Batches
+        # already in Qdrant from a failed attempt are skipped.
+        return ingest_stream(
+            artifacts.read_lines(artifacts.get_store(), chunks_ref),
+            pdf_id=pdf_id,
+            source_id=source_id,
+            store=get_storage(),
+            content_hash=content_hash,
+            user_id=ctx.event.data.get("user_id"),
+            summaries=get_summary_storage(),
         )
 
-        return RAGUpsertResult(ingested=len(chunks))
+    async def _record_content():
+        async with AsyncSessionLocal() as db:
+            await mark_ingested(db, content_hash, ingested.ingested + ingested.skipped)
+            await db.commit()
+        return True
 
-    chunks_and_src = await ctx.step.run(
-        "load-and-chunk",
-        _load,
-        output_type=RAGChunkAndSrc,
-    )
+    duplicate_chunks = await ctx.step.run("find-duplicate", _find_duplicate)
 
-    ingested = await ctx.step.run(
-        "embed-and-upsert",
-        lambda: _upsert(chunks_and_src),
-        output_type=RAGUpsertResult,
-    )
+    if duplicate_chunks is not None:
+        # 🔹 Same file already ingested: its vectors are shared, nothing to do
+        ingested = RAGUpsertResult(ingested=0, skipped=duplicate_chunks)
+    else:
+        # Both steps run on a thread: the download, parse and artifact write
+        # and the embed pipeline (including rate-limit waits) block, and
+        # steps run on the event loop that serves the HTTP routes.
+        # Tradeoff of the artifact split: embedding starts once the whole
+        # PDF is chunked, so a document is only searchable after its last
+        # page is parsed, in exchange for retries that don't re-download
+        # and re-parse it.
+        chunks_ref = await ctx.step.run(
+            "load-and-chunk",
+            lambda: asyncio.to_thread(_load_and_chunk),
+            output_type=ArtifactRef,
+        )
+        ingested = await ctx.step.run(
+            "embed-and-upsert",
+            lambda: asyncio.to_thread(_embed_and_upsert),
+            output_type=RAGUpsertResult,
+        )
+        if content_hash:
+            await ctx.step.run("record-content", _record_content)
+        metrics.CHUNKS_INGESTED.labels("ingested").inc(ingested.ingested)
+        metrics.CHUNKS_INGESTED.labels("skipped").inc(ingested.skipped)
 
     # ✅ NEW STEP: Add a system message to stop the frontend polling
-    def _mark_complete():
+    async def _mark_complete():
         pdf_id = ctx.event.data.get("pdf_id")
         source_id = ctx.event.data.get("source_id")
         
@@ -391,46 +457,231 @@ async def rag_ingest_pdf(ctx: inngest.Context):
         # If not already there, update your upload_pdf route to send it
         conversation_id = ctx.event.data.get("conversation_id")
         if conversation_id:
-            db = next(get_db())
-            # Add a hidden or status message
+            async with AsyncSessionLocal() as db:
+                # Add a hidden or status message
+                db.add(Message(
+                    conversation_id=conversation_id,
+                    role="assistant",
+                    content=f"I have finished analyzing **{source_id}**. You can now ask questions about it!",
+                    # Optionally add a custom type to handle this specially in UI
+                ))
+                await db.commit()
+        return True
+
+    await ctx.step.run("mark-ingestion-complete", _mark_complete)
+
+    return ingested.model_dump()
+
+async def ingest_pdf_failed(ctx: inngest.Context):
+    """
+    on_failure handler of rag_ingest_pdf: an unreadable file, or retries
+    run out. Posts an assistant message so the frontend, which polls until
+    one arrives, stops waiting.
+    """
+    # The failure event wraps the original rag/ingest_pdf event
+    data = ctx.event.data.get("event", {}).get("data", {})
+    conversation_id = data.get("conversation_id")
+
+    async def _mark_failed():
+        if not conversation_id:
+            return False
+        async with AsyncSessionLocal() as db:
             db.add(Message(
                 conversation_id=conversation_id,
                 role="assistant",
-                content=f"I have finished analyzing **{source_id}**. You can now ask questions about it!",
-                # Optionally add a custom type to handle this specially in UI
+                content=(
+                    f"I couldn't analyze **{data.get('source_id')}**. The file may be damaged "
+                    "or not a PDF; please try uploading it again."
+                ),
             ))
-            db.commit()
+            await db.commit()
         return True
 
-    await ctx.step.run("mark-ingestion-complete", _mark_complete)
+    return await ctx.step.run("mark-ingestion-failed", _mark_failed)
 
-    return ingested.model_dump()
+# Registered without the decorator so ingest_pdf stays a plain handler the
+# offline benchmark (benchmarks/bench_e2e.py) can drive with its own ctx
+rag_ingest_pdf = inngest_client.create_function(
+    fn_id="RAG: Ingest PDF",
+    trigger=inngest.TriggerEvent(event="rag/ingest_pdf"),
+    on_failure=ingest_pdf_failed,
+    # One user's bulk upload queues behind itself instead of everyone else
+    concurrency=[inngest.Concurrency(limit=INGEST_CONCURRENCY_PER_USER, key="event.data.user_id")],
+)(ingest_pdf)
 
 # --------------------------------------------------
-# Query PDF Function + 💾 STORAGE (UPDATED)
+# 🗑️ Background cleanup of deleted PDFs
 # --------------------------------------------------
+def _schedule_cleanup(storage_paths, pdf_ids, content_hashes):
+    """
+    Hands file and vector removal to rag_delete_vectors. The rows are
+    already gone, so if the event is lost the nightly sweep still purges
+    the vectors.
+    """
+    if not (storage_paths or pdf_ids or content_hashes):
+        return
+    try:
+        inngest_client.send_sync(
+            inngest.Event(
+                name="rag/delete_vectors",
+                data={
+                    "storage_paths": storage_paths,
+                    "pdf_ids": pdf_ids,
+                    "content_hashes": content_hashes,
+                },
+            )
+        )
+    except Exception as e:
+        print(f"⚠️ Failed to schedule cleanup: {e}")
+
+
 @inngest_client.create_function(
-    fn_id="RAG: Query PDF",
-    trigger=inngest.TriggerEvent(event="rag/query_pdf_ai"),
+    fn_id="RAG: Delete Vectors",
+    trigger=inngest.TriggerEvent(event="rag/delete_vectors"),
+    retries=5,
 )
-async def rag_query_pdf_ai(ctx: inngest.Context):
-    def _search() -> RAGSearchResult:
+async def rag_delete_vectors(ctx: inngest.Context):
+    ctx = metrics.instrument(ctx, "delete_vectors")
+    # Both steps are idempotent: removing a missing file or filtering out
+    # points that are already gone is a no-op, so retries are safe
+    storage_paths = ctx.event.data.get("storage_paths", [])
+    pdf_ids = ctx.event.data.get("pdf_ids", [])
+
+    def _remove_files():
+        if storage_paths:
+            with metrics.external("supabase", "remove"):
+                clients.supabase().storage.from_("pdfs").remove(storage_paths)
+        return len(storage_paths)
+
+    def _delete_vectors():
+        # A new upload of the same file may have claimed a hash since
+        db = SessionLocal()
+        try:
+            content_hashes = unreferenced_hashes(db, ctx.event.data.get("content_hashes", []))
+        finally:
+            db.close()
+
+        # One filtered delete covers every PDF and content hash
+        get_storage().delete(pdf_ids=pdf_ids, content_hashes=content_hashes)
+        get_summary_storage().delete(pdf_ids=pdf_ids, content_hashes=content_hashes)
+        return {"pdf_ids": len(pdf_ids), "content_hashes": len(content_hashes)}
+
+    # Sync Supabase, database and vector store calls: keep them off the event loop
+    removed = await ctx.step.run("remove-files", lambda: asyncio.to_thread(_remove_files))
+    deleted = await ctx.step.run("delete-vectors", lambda: asyncio.to_thread(_delete_vectors))
+    return {"files": removed, **deleted}
+
+
+@inngest_client.create_function(
+    fn_id="RAG: Reconcile Vectors",
+    # The event carries on a sweep that ran out of steps in its last run
+    trigger=[inngest.TriggerCron(cron=VECTOR_GC_CRON), inngest.TriggerEvent(event="rag/reconcile_vectors")],
+    concurrency=[inngest.Concurrency(limit=1)],
+)
+async def rag_reconcile_vectors(ctx: inngest.Context):
+    """
+    Walks the collection and purges points whose PDF (and every PDF sharing
+    their content) no longer exists: leftovers of failed or lost deletes.
+    """
+    ctx = metrics.instrument(ctx, "reconcile_vectors")
+    # Chunks, then the per-document summary vectors used for routing
+    stores = (("sweep", get_storage), ("sweep-summaries", get_summary_storage))
+
+    def _sweep(get_store, offset):
+        store = get_store()
+        scanned, purged = 0, 0
+        for _ in range(VECTOR_GC_PAGES_PER_STEP):
+            owners, offset = store.scan_owners(offset=offset, limit=VECTOR_GC_PAGE_SIZE)
+            db = SessionLocal()
+            try:
+                orphans = orphan_points(db, owners)
+            finally:
+                db.close()
+            store.delete_ids(orphans)
+            scanned += len(owners)
+            purged += len(orphans)
+            if offset is None:
+                break
+        return {"next": offset, "scanned": scanned, "purged": purged}
+
+    # Where the previous run of this sweep stopped, if it was cut short
+    start = ctx.event.data.get("store", 0) if ctx.event.name == "rag/reconcile_vectors" else 0
+    offset = ctx.event.data.get("offset") if ctx.event.name == "rag/reconcile_vectors" else None
+    scanned, purged, steps = 0, 0, 0
+    for index in range(start, len(stores)):
+        name, get_store = stores[index]
+        page = 0
+        while True:
+            if steps == VECTOR_GC_STEPS_PER_RUN:
+                await ctx.step.send_event(
+                    "continue-sweep",
+                    inngest.Event(name="rag/reconcile_vectors", data={"store": index, "offset": offset}),
+                )
+                print(f"🧹 Vector sweep: {purged} orphaned of {scanned} points purged, continuing in a new run")
+                return {"scanned": scanned, "purged": purged, "continued": True}
+
+            # Several pages per step keeps the run's step count down; a retry
+            # resumes at the step's first page. The sync DB and store calls
+            # run on a thread, off the event loop.
+            result = await ctx.step.run(f"{name}-{page}", lambda: asyncio.to_thread(_sweep, get_store, offset))
+            scanned += result["scanned"]
+            purged += result["purged"]
+            offset = result["next"]
+            page += 1
+            steps += 1
+            if offset is None:
+                break
+
+    # Chunk artifacts are only needed while their ingest run is in flight
+    swept = await ctx.step.run(
+        "sweep-artifacts",
+        lambda: asyncio.to_thread(lambda: artifacts.get_store().sweep(artifacts.ARTIFACT_TTL_HOURS * 3600)),
+    )
+
+    print(f"🧹 Vector sweep: {purged} orphaned of {scanned} points purged, {swept} old artifacts removed")
+    return {"scanned": scanned, "purged": purged, "artifacts": swept}
+
+# --------------------------------------------------
+# Query PDF Function + 💾 STORAGE (UPDATED)
+# --------------------------------------------------
+async def query_pdf_ai(ctx: inngest.Context):
+    ctx = metrics.instrument(ctx, "query_pdf_ai")
+
+    # Async all the way down: Inngest runs step handlers on the event loop
+    # this app serves requests from, and embedding and generation may wait
+    # for rate-limit capacity
+    async def _search() -> RAGSearchResult:
         question = ctx.event.data["question"]
         allowed_pdf_ids = ctx.event.data.get("allowed_pdf_ids", [])
-        
-        vectors = embed_text([question])
+        allowed_content_hashes = ctx.event.data.get("allowed_content_hashes", [])
+        if not allowed_pdf_ids:
+            # No PDFs in the conversation: nothing of this user's to search
+            return RAGSearchResult(contexts=[], sources=[])
+
+        vectors = await aembed_text([question], priority=ratelimit.QUERY, user=ctx.event.data.get("user_id"))
         if not vectors:
             return RAGSearchResult(contexts=[], sources=[])
         
         query_vec = vectors[0]
-        store = QdrantStorage()
-        found = store.search(query_vec, top_k=5, allowed_pdf_ids=allowed_pdf_ids)
-        
-        return RAGSearchResult(
-            contexts=found.get("contexts", []),
-            sources=found.get("sources", []),
+        # Only the documents whose summaries match the question best
+        pdf_ids, content_hashes = await asyncio.to_thread(
+            routing.route, query_vec, allowed_pdf_ids, allowed_content_hashes
+        )
+        store = await get_async_storage()
+        candidates = await store.search_candidates(
+            query_vec,
+            limit=CONTEXT_CANDIDATES,
+            allowed_pdf_ids=pdf_ids,
+            allowed_content_hashes=content_hashes,
+            query_text=question,
+            per_document=_per_document(allowed_pdf_ids),
         )
 
+        candidates = _attribute(candidates, ctx.event.data.get("documents"))
+        found = select_context(query_vec, candidates, baseline_k=RAG_TOP_K, per_document=_per_document(allowed_pdf_ids))
+        _record_context(found)
+        return found
+
     # 1. Search Vector DB
     found = await ctx.step.run(
         "embed-and-search",
@@ -442,29 +693,15 @@ async def rag_query_pdf_ai(ctx: inngest.Context):
     question = ctx.event.data["question"]
     answer = await ctx.step.run(
         "generate-answer",
-        lambda: generate_answer(found.contexts, question),
+        lambda: agenerate_answer(found.contexts, question, user=ctx.event.data.get("user_id")),
     )
 
     # 3. Atomic Database Commit
     conversation_id = ctx.event.data["conversation_id"]
 
-    def _save_to_db():
-        db = next(get_db())
-        try:
-            # 🔹 We save BOTH here so the frontend polling 
-            # sees the complete state in one go.
-            db.add(
-                Message(
-                    conversation_id=conversation_id,
-                    role="assistant",
-                    content=answer,
-                )
-            )
-            db.commit()
-            return True
-        except Exception as e:
-            db.rollback()
-            raise e
+    async def _save_to_db():
+        await _save_assistant_message(conversation_id, answer)
+        return True
 
     await ctx.step.run("save-to-db", _save_to_db)
 
@@ -473,28 +710,44 @@ async def rag_query_pdf_ai(ctx: inngest.Context):
         "num_contexts": len(found.contexts),
     }
 
-@app.post("/query-pdf")
-async def query_pdf(
-    data: QueryPdfSchema,
-    user=Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
+rag_query_pdf_ai = inngest_client.create_function(
+    fn_id="RAG: Query PDF",
+    trigger=inngest.TriggerEvent(event="rag/query_pdf_ai"),
+    concurrency=[inngest.Concurrency(limit=QUERY_CONCURRENCY_PER_USER, key="event.data.user_id")],
+)(query_pdf_ai)
+
+async def _start_query(data: QueryPdfSchema, user, db: AsyncSession):
+    """
+    Resolves (or creates) the conversation and stores the user's question.
+    Returns the conversation id, the PDF ids and content hashes the search
+    may look at, and the conversation's PDFs ({"pdf_id", "source",
+    "content_hash"}) that hits are attributed to.
+    """
     if not data.conversation_id:
         conv = Conversation(id=str(uuid.uuid4()), user_id=user.id)
         db.add(conv)
-        db.commit()
-        db.refresh(conv)
         active_id = conv.id
         allowed_pdf_ids = []
+        allowed_content_hashes = []
+        documents = []
     else:
-        conv = db.query(Conversation).filter(
-            Conversation.id == data.conversation_id,
-            Conversation.user_id == user.id
-        ).first()
+        conv = await db.scalar(
+            select(Conversation).filter(
+                Conversation.id == data.conversation_id,
+                Conversation.user_id == user.id
+            )
+        )
         if not conv:
             raise HTTPException(status_code=404)
         active_id = conv.id
-        allowed_pdf_ids = [p.id for p in conv.pdfs]
+        rows = (await db.execute(
+            select(UploadedPDF.id, UploadedPDF.content_hash, UploadedPDF.filename)
+            .join(conversation_pdfs, conversation_pdfs.c.pdf_id == UploadedPDF.id)
+            .filter(conversation_pdfs.c.conversation_id == active_id)
+        )).all()
+        allowed_pdf_ids = [r.id for r in rows]
+        allowed_content_hashes = sorted({r.content_hash for r in rows if r.content_hash})
+        documents = [{"pdf_id": r.id, "source": r.filename, "content_hash": r.content_hash} for r in rows]
 
     # ✅ SAVE USER MESSAGE IMMEDIATELY
     db.add(
@@ -504,7 +757,19 @@ async def query_pdf(
             content=data.question,
         )
     )
-    db.commit()
+    await db.commit()
+
+    return active_id, allowed_pdf_ids, allowed_content_hashes, documents
+
+
+@app.post("/query-pdf")
+async def query_pdf(
+    data: QueryPdfSchema,
+    request: Request,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    active_id, allowed_pdf_ids, allowed_content_hashes, documents = await _start_query(data, user, db)
 
     # 🔹 Trigger AI processing
     await inngest_client.send(
@@ -514,6 +779,11 @@ async def query_pdf(
                 "question": data.question,
                 "conversation_id": active_id,
                 "allowed_pdf_ids": allowed_pdf_ids,
+                "allowed_content_hashes": allowed_content_hashes,
+                "documents": documents,
+                "user_id": user.id,
+                # W3C trace context, so the steps' spans join this request's trace
+                "trace": tracing.inject(request.headers.get("traceparent")),
             }
         )
     )
@@ -521,6 +791,135 @@ async def query_pdf(
     return {"status": "processing", "conversation_id": active_id}
 
 
+def _attribute(candidates: list[dict], documents: list[dict] | None) -> list[dict]:
+    """
+    Credits each hit to the asking conversation's own PDF. Identical uploads
+    share vectors, whose payload names whoever ingested them first, possibly
+    another user, so pdf_id and source never come from the payload.
+    """
+    if documents is None:
+        # Events queued before attribution moved here; nothing reaches the user
+        return candidates
+
+    by_pdf = {d["pdf_id"]: d for d in documents}
+    by_hash = {}
+    for d in documents:
+        if d.get("content_hash"):
+            by_hash.setdefault(d["content_hash"], d)
+
+    for c in candidates:
+        own = by_hash.get(c.get("content_hash")) or by_pdf.get(c.get("pdf_id"))
+        c["pdf_id"] = own["pdf_id"] if own else None
+        c["source"] = own["source"] if own else None
+    return candidates
+
+
+def _per_document(allowed_pdf_ids) -> int | None:
+    # Only worth grouping when the conversation has several PDFs
+    if CONTEXT_PER_DOCUMENT and len(set(allowed_pdf_ids or [])) > 1:
+        return CONTEXT_PER_DOCUMENT
+    return None
+
+
+def _record_context(found: RAGSearchResult):
+    metrics.CONTEXT_TOKENS.observe(found.context_tokens)
+    if found.tokens_saved > 0:
+        metrics.CONTEXT_TOKENS_SAVED.inc(found.tokens_saved)
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _save_assistant_message(conversation_id: str, content: str):
+    async with AsyncSessionLocal() as db:
+        db.add(
+            Message(
+                conversation_id=conversation_id,
+                role="assistant",
+                content=content,
+            )
+        )
+        await db.commit()
+
+
+@app.post("/query-pdf/stream")
+async def query_pdf_stream(
+    data: QueryPdfSchema,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Same as /query-pdf, but answers inline as server-sent events instead of
+    going through Inngest + polling:
+
+        event: conversation  {"conversation_id": ...}
+        event: sources       {"sources": [...]}
+        event: token         {"text": ...}      (repeated)
+        event: done          {"status": "stored"}
+        event: error         {"detail": ...}
+
+    The assistant message is written to the database once, after the last token.
+    """
+    active_id, allowed_pdf_ids, allowed_content_hashes, documents = await _start_query(data, user, db)
+    # Release the connection before the (long) stream starts
+    await db.close()
+
+    async def events():
+        yield _sse("conversation", {"conversation_id": active_id})
+
+        try:
+            if allowed_pdf_ids:
+                vectors = await aembed_text([data.question], priority=ratelimit.QUERY, user=user.id)
+                pdf_ids, content_hashes = await asyncio.to_thread(
+                    routing.route, vectors[0], allowed_pdf_ids, allowed_content_hashes
+                )
+                store = await get_async_storage()
+                candidates = await store.search_candidates(
+                    vectors[0],
+                    limit=CONTEXT_CANDIDATES,
+                    allowed_pdf_ids=pdf_ids,
+                    allowed_content_hashes=content_hashes,
+                    query_text=data.question,
+                    per_document=_per_document(allowed_pdf_ids),
+                )
+                found = select_context(
+                    vectors[0], _attribute(candidates, documents), baseline_k=RAG_TOP_K,
+                    per_document=_per_document(allowed_pdf_ids),
+                )
+                _record_context(found)
+            else:
+                # No PDFs in the conversation: nothing of this user's to search
+                found = RAGSearchResult(contexts=[], sources=[])
+            yield _sse("sources", {
+                "sources": found.sources,
+                "documents": [d.model_dump() for d in found.documents],
+            })
+
+            parts = []
+            async for text in generate_answer_stream(found.contexts, data.question, user=user.id):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+
+            answer = "".join(parts).strip()
+            await _save_assistant_message(active_id, answer)
+            yield _sse("done", {"status": "stored"})
+
+        except Exception as e:
+            print(f"❌ Streaming query failed: {e}")
+            yield _sse("error", {"detail": "Failed to generate answer"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx-style proxies from buffering the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 @app.get("/pdfs")
 def list_pdfs(
     user=Depends(get_current_user),
@@ -556,69 +955,35 @@ def delete_pdf(
     if not pdf:
         raise HTTPException(status_code=404, detail="PDF not found")
 
-    # 1. Delete from Supabase Storage
-    try:
-        supabase.storage.from_("pdfs").remove([pdf.file_path])
-    except Exception as e:
-        print(f"Failed to delete from Supabase: {e}")
+    # 1. Vectors go unless another upload of the same file still shares them
+    storage_paths = [pdf.file_path]
+    purge_ids, purge_hashes = vectors_to_purge(db, [pdf])
 
-    # 2. Delete from Qdrant Vector DB
-    try:
-        from vector_db import QdrantStorage
-        QdrantStorage().client.delete(
-            collection_name="cortex_chunks",
-            points_selector=models.Filter(
-                must=[models.FieldCondition(key="pdf_id", match=models.MatchValue(value=pdf_id))]
-            ),
-        )
-    except Exception as e:
-        print(f"Failed to delete from Qdrant: {e}")
-
-    # 3. Delete from SQL Database
+    # 2. Delete from SQL Database
     db.delete(pdf)
+    db.flush()
+    drop_unused_contents(db, purge_hashes)
     db.commit()
 
+    # 3. Storage and Qdrant cleanup runs in the background
+    _schedule_cleanup(storage_paths, purge_ids, purge_hashes)
+
     return {"message": "PDF and associated vectors deleted"}
 # --------------------------------------------------
 # 📜 FETCH CONVERSATIONS (NEW)
 # --------------------------------------------------
 @app.get("/conversations")
 def get_conversations(
+    limit: int = Query(50, ge=1, le=200),
+    before: str | None = None,
     user=Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    # Fetch conversations for the current user
-    conversations = (
-        db.query(Conversation)
-        .filter(Conversation.user_id == user.id)
-        .order_by(Conversation.created_at.desc())
-        .all()
-    )
-
-    result = []
-    for c in conversations:
-        # Determine title from the first user message
-        first_message = db.query(Message).filter(
-            Message.conversation_id == c.id, 
-            Message.role == "user"
-        ).order_by(Message.created_at).first()
-
-        title = first_message.content[:40] + "..." if first_message else "New Chat"
-
-        # 🔹 Group all PDFs linked to this specific conversation
-        pdf_list = [
-            {"id": p.id, "filename": p.filename} 
-            for p in c.pdfs
-        ]
-
-        result.append({
-            "id": c.id,
-            "title": title,
-            "pdfs": pdf_list, 
-            "created_at": c.created_at,
-        })
-
-    return result
+    """
+    Keyset-paginated, newest first. Pass the last item's `cursor` as
+    `before` to get the next page.
+    """
+    return list_conversations(db, user.id, limit=limit, before=before)
 
 @app.delete("/conversations/{conversation_id}")
 def delete_conversation(
@@ -637,48 +1002,30 @@ def delete_conversation(
 
     # 2. Collect metadata for external cleanups
     storage_paths = [pdf.file_path for pdf in conv.pdfs]
-    pdf_ids = [pdf.id for pdf in conv.pdfs]
+    # Vectors shared with PDFs outside this conversation are kept
+    purge_ids, purge_hashes = vectors_to_purge(db, conv.pdfs)
 
     try:
-        # 3. Distributed Cleanup: Supabase Storage
-        if storage_paths:
-            try:
-                # remove() expects a list of paths
-                supabase.storage.from_("pdfs").remove(storage_paths)
-            except Exception as e:
-                print(f"⚠️ Supabase storage cleanup failed/skipped: {e}")
-
-        store = QdrantStorage()
-        # 🚨 FIX: Use your actual collection name from vector_db setup
-        collection_name = "doc" 
-
-        for p_id in pdf_ids:
-            try:
-                store.client.delete(
-                    collection_name=collection_name,
-                    points_selector=models.Filter(
-                        must=[models.FieldCondition(key="pdf_id", match=models.MatchValue(value=p_id))]
-                    ),
-                )
-            except Exception as e:
-                # Log but don't crash if Qdrant collection is missing
-                print(f"⚠️ Qdrant cleanup skipped for PDF {p_id}: {e}")
-
-        # 5. Database Cleanup: SQL
+        # 3. Database Cleanup: SQL
         # In a Many-to-Many setup, we manually delete the PDFs linked to this chat
         for pdf in conv.pdfs:
             db.delete(pdf)
 
         # Delete the conversation (Cascade handles the messages)
         db.delete(conv)
+        db.flush()
+        drop_unused_contents(db, purge_hashes)
         db.commit()
 
-        return {"message": "Conversation and all associated data deleted successfully"}
-
     except Exception as e:
         db.rollback()
         print(f"❌ Critical Cleanup Error: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete conversation data")
+
+    # 4. Storage and Qdrant cleanup for every PDF runs as one background job
+    _schedule_cleanup(storage_paths, purge_ids, purge_hashes)
+
+    return {"message": "Conversation and all associated data deleted successfully"}
 # --------------------------------------------------
 # Serve Inngest (UNCHANGED)
 # --------------------------------------------------
@@ -686,5 +1033,5 @@ def delete_conversation(
 inngest.fast_api.serve(
     app,
     inngest_client,
-    [rag_ingest_pdf, rag_query_pdf_ai],
+    [rag_ingest_pdf, rag_query_pdf_ai, rag_delete_vectors, rag_reconcile_vectors],
 )
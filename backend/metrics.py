@@ -0,0 +1,208 @@
+import functools
+import inspect
+import os
+import re
+import time
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+import tracing
+
+# --------------------------------------------------
+# Prometheus metrics
+# --------------------------------------------------
+# Everything is recorded in-process (a perf_counter pair and a histogram
+# observe per call) and scraped from /metrics. Under several worker
+# processes set PROMETHEUS_MULTIPROC_DIR so the scrape sums all of them.
+
+# 5 ms (a DB write) up to 2 min (a long ingest step)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+HTTP_SECONDS = Histogram(
+    "cortex_http_request_seconds", "FastAPI request latency by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+STEP_SECONDS = Histogram(
+    "cortex_step_seconds", "Inngest step execution time (replays of memoized steps excluded)",
+    ["function", "step", "outcome"], buckets=LATENCY_BUCKETS,
+)
+EXTERNAL_SECONDS = Histogram(
+    "cortex_external_seconds", "Latency of calls to Gemini, Qdrant and Supabase",
+    ["service", "operation", "outcome"], buckets=LATENCY_BUCKETS,
+)
+EMBED_BATCH_TEXTS = Histogram(
+    "cortex_embed_batch_texts", "Texts per Gemini embedding request",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250),
+)
+CHUNKS_INGESTED = Counter(
+    "cortex_chunks_ingested_total", "Chunks stored by ingestion; skipped = already stored",
+    ["outcome"],
+)
+CONTEXT_TOKENS = Histogram(
+    "cortex_context_tokens", "Estimated context tokens sent to generation per query",
+    buckets=(0, 250, 500, 1000, 1500, 2000, 3000, 5000, 8000),
+)
+CONTEXT_TOKENS_SAVED = Counter(
+    "cortex_context_tokens_saved_total", "Context tokens saved by context packing vs. raw top-k",
+)
+GENERATION_TOKENS = Counter(
+    "cortex_generation_tokens_total", "Tokens reported by Gemini usage metadata",
+    ["kind"],
+)
+ROUTED_DOCUMENTS = Histogram(
+    "cortex_routed_documents", "Summarized documents a routed query searched",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "cortex_rate_limit_wait_seconds", "Time Gemini calls waited for rate-limit capacity",
+    ["model", "priority"], buckets=(0, 0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+_STEP_SUFFIX = re.compile(r"-\d+$")
+
+
+@contextmanager
+def external(service: str, operation: str):
+    """
+    Times a call to an external service.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_SECONDS.labels(service, operation, outcome).observe(time.perf_counter() - start)
+
+
+def observed(service: str, operation: str):
+    """
+    Decorator form of `external` for sync and async functions.
+    """
+
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with external(service, operation):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with external(service, operation):
+                    return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def record_usage(response) -> None:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    if getattr(usage, "prompt_token_count", None):
+        GENERATION_TOKENS.labels("prompt").inc(usage.prompt_token_count)
+    if getattr(usage, "candidates_token_count", None):
+        GENERATION_TOKENS.labels("output").inc(usage.candidates_token_count)
+
+
+# ---------------- Inngest steps ----------------
+
+def _timed_handler(handler, function, step, carrier):
+    # Only runs when the step actually executes, not when Inngest replays
+    # its memoized result, so replays don't pollute the histogram
+    step = _STEP_SUFFIX.sub("", step)
+    trace_id = tracing.trace_id(carrier)
+    exemplar = {"trace_id": trace_id} if trace_id else None
+
+    def observe(start, outcome):
+        STEP_SECONDS.labels(function, step, outcome).observe(time.perf_counter() - start, exemplar=exemplar)
+
+    # Always async: the SDK awaits whatever a handler returns, and a sync
+    # handler may hand back an awaitable (e.g. asyncio.to_thread(...)) that
+    # has to finish inside the timer and the span
+    @functools.wraps(handler)
+    async def run(*args):
+        start = time.perf_counter()
+        with tracing.span(f"{function}.{step}", carrier):
+            try:
+                result = handler(*args)
+                if inspect.isawaitable(result):
+                    result = await result
+            except BaseException:
+                observe(start, "error")
+                raise
+        observe(start, "ok")
+        return result
+    return run
+
+
+class _TimedStep:
+    def __init__(self, step, function, carrier):
+        self._step = step
+        self._function = function
+        self._carrier = carrier
+
+    async def run(self, step_id, handler, *args, **kwargs):
+        timed = _timed_handler(handler, self._function, step_id, self._carrier)
+        return await self._step.run(step_id, timed, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._step, name)
+
+
+class _InstrumentedContext:
+    def __init__(self, ctx, function):
+        self._ctx = ctx
+        self.step = _TimedStep(ctx.step, function, ctx.event.data.get("trace"))
+
+    def __getattr__(self, name):
+        return getattr(self._ctx, name)
+
+
+def instrument(ctx, function: str):
+    """
+    Wraps an Inngest context so every `ctx.step.run` is timed (and traced,
+    under the event's `trace` carrier).
+    """
+    return _InstrumentedContext(ctx, function)
+
+
+# ---------------- HTTP ----------------
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no per-request task or body buffering, so SSE is
+    unaffected). Labels by route template to keep cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router records the matched route in the shared scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
+
+
+def render() -> tuple[bytes, str]:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Table
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Table, Index, Integer
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 import uuid
@@ -33,12 +33,26 @@ class Conversation(Base):
     # 🔹 New: Access all PDFs in this conversation
     pdfs = relationship("UploadedPDF", secondary=conversation_pdfs, back_populates="conversations")
 
+class PDFContent(Base):
+    """
+    One row per distinct PDF (sha256 of its bytes). The chunk vectors in
+    Qdrant belong to the content, and every UploadedPDF with the same hash
+    shares them.
+    """
+    __tablename__ = "pdf_contents"
+    content_hash = Column(String, primary_key=True)
+    chunk_count = Column(Integer, nullable=True)
+    ingested_at = Column(DateTime, nullable=True)  # set once all vectors are stored
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class UploadedPDF(Base):
     __tablename__ = "uploaded_pdfs"
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     filename = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
+    # 🔹 Null for PDFs uploaded before content hashing; their vectors are keyed by pdf_id
+    content_hash = Column(String, ForeignKey("pdf_contents.content_hash"), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User", backref="pdfs")
@@ -52,4 +66,9 @@ class Message(Base):
     role = Column(String) # user / assistant
     content = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
-    conversation = relationship("Conversation", back_populates="messages")
\ No newline at end of file
+    conversation = relationship("Conversation", back_populates="messages")
+
+    # 🔹 Serves keyset pagination over (created_at, id) within a conversation
+    __table_args__ = (
+        Index("ix_messages_conversation_created_id", "conversation_id", "created_at", "id"),
+    )
\ No newline at end of file
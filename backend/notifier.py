@@ -0,0 +1,173 @@
+import asyncio
+import os
+import select
+import threading
+from collections import defaultdict
+from dotenv import load_dotenv
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from models import Message
+
+load_dotenv()
+
+# "local" wakes waiters in this process only; "postgres" fans out through
+# LISTEN/NOTIFY so a message written by any worker wakes every worker.
+MESSAGE_NOTIFIER = os.getenv("MESSAGE_NOTIFIER", "local")
+CHANNEL = "new_message"
+
+
+class _Waiter:
+    def __init__(self, notifier, key):
+        self._notifier = notifier
+        self._key = key
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    def _wake(self):
+        self._loop.call_soon_threadsafe(self._event.set)
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._notifier._remove(self._key, self)
+
+
+class LocalNotifier:
+    """
+    In-process "a new message landed in conversation X" signal.
+
+    Subscribe before querying, then wait only if the query came back empty,
+    so a message committed in between isn't missed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = defaultdict(set)
+
+    def subscribe(self, key: str) -> _Waiter:
+        waiter = _Waiter(self, key)
+        with self._lock:
+            self._waiters[key].add(waiter)
+        return waiter
+
+    def _remove(self, key, waiter):
+        with self._lock:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[key]
+
+    def wake(self, key: str):
+        with self._lock:
+            waiters = list(self._waiters.get(key, ()))
+        for w in waiters:
+            w._wake()
+
+    def publish(self, key: str):
+        self.wake(key)
+
+    def notify_in_transaction(self, connection, key: str) -> bool:
+        """
+        Queues the signal inside the inserting transaction if the backend
+        can; False means publish() after commit instead.
+        """
+        return False
+
+
+class PostgresNotifier(LocalNotifier):
+    """
+    Publishes with pg_notify inside the transaction that inserts the
+    message (Postgres delivers it on commit, drops it on rollback), and runs
+    one LISTEN thread per process that wakes the local waiters.
+    """
+
+    def __init__(self, dsn: str):
+        super().__init__()
+        self._dsn = dsn
+        self._listener = None
+
+    def _connect(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self._dsn)
+        conn.autocommit = True
+        return conn
+
+    def subscribe(self, key: str) -> _Waiter:
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name="message-listener", daemon=True)
+                    self._listener.start()
+        return super().subscribe(key)
+
+    def notify_in_transaction(self, connection, key: str) -> bool:
+        if connection.dialect.name != "postgresql":
+            return False
+        # Runs on the session's own connection, so an AsyncSession commit
+        # never blocks the event loop on a second, sync connection
+        connection.execute(text("SELECT pg_notify(:channel, :key)"), {"channel": CHANNEL, "key": key})
+        return True
+
+    def _listen(self):
+        while True:
+            try:
+                conn = self._connect()
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                while True:
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.wake(conn.notifies.pop(0).payload)
+            except Exception as e:
+                print(f"⚠️ Message listener reconnecting: {e}")
+                threading.Event().wait(1)
+
+
+def _make_notifier():
+    if MESSAGE_NOTIFIER == "postgres":
+        # psycopg2 wants a plain libpq URL, without the SQLAlchemy driver suffix
+        dsn = os.getenv("DATABASE_URL", "").replace("postgresql+psycopg2://", "postgresql://")
+        return PostgresNotifier(dsn)
+    return LocalNotifier()
+
+
+notifier = _make_notifier()
+
+
+# --------------------------------------------------
+# Publish on commit
+# --------------------------------------------------
+# Every Message insert, from routes or Inngest steps, signals its
+# conversation once the commit succeeds: through pg_notify in the same
+# transaction, or else recorded on the session and published after commit.
+
+@event.listens_for(Message, "after_insert")
+def _track_new_message(mapper, connection, target):
+    if notifier.notify_in_transaction(connection, target.conversation_id):
+        return
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("new_message_conversations", set()).add(target.conversation_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_new_messages(session):
+    for conversation_id in session.info.pop("new_message_conversations", ()):
+        notifier.publish(conversation_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_new_messages(session):
+    session.info.pop("new_message_conversations", None)
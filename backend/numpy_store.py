@@ -0,0 +1,525 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+from dataclasses import dataclass
+import numpy as np
+from dotenv import load_dotenv
+from metrics import observed
+from vector_db import PROFILE, _as_list, _format_results
+
+load_dotenv()
+
+# --------------------------------------------------
+# Embedded vector store (no Qdrant server)
+# --------------------------------------------------
+# Vectors live in append-only segments: each upsert writes one .npy matrix
+# of unit-length rows plus a JSON file of ids and payloads, and segments are
+# opened memory-mapped. Deletes only set tombstones. Segments are merged
+# size-tiered: once NUMPY_MERGE_FACTOR segments of similar size pile up they
+# are rewritten as one, so each row is copied O(log n) times over the life
+# of the store instead of on every full rewrite. Merges keep owners grouped,
+# so a PDF occupies one contiguous row range per segment, and copy rows from
+# the memory maps a block at a time rather than loading them all.
+
+NUMPY_STORE_DIR = os.getenv("NUMPY_STORE_DIR", ".cache/vectors")
+NUMPY_SUMMARY_DIR = os.getenv("NUMPY_SUMMARY_DIR", f"{NUMPY_STORE_DIR}-docs")
+NUMPY_STORE_DTYPE = os.getenv("NUMPY_STORE_DTYPE", "float32")  # or float16, half the size
+# Merge this many segments of one size tier; tiers grow by the same factor
+# from NUMPY_MERGE_MIN_ROWS live rows
+NUMPY_MERGE_FACTOR = int(os.getenv("NUMPY_MERGE_FACTOR", "8"))
+NUMPY_MERGE_MIN_ROWS = int(os.getenv("NUMPY_MERGE_MIN_ROWS", "1024"))
+# Rewrite a segment on its own once this share of its rows is dead
+NUMPY_MAX_DEAD_RATIO = float(os.getenv("NUMPY_MAX_DEAD_RATIO", "0.3"))
+# Rows copied per block while merging; bounds the memory a merge needs
+NUMPY_MERGE_BLOCK_ROWS = int(os.getenv("NUMPY_MERGE_BLOCK_ROWS", "4096"))
+
+MANIFEST = "manifest.json"
+
+
+def _write_atomic(path, write):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _owner_keys(payload):
+    keys = []
+    if payload.get("pdf_id"):
+        keys.append(("pdf_id", payload["pdf_id"]))
+    if payload.get("content_hash"):
+        keys.append(("content_hash", payload["content_hash"]))
+    return keys
+
+
+@dataclass
+class _Segment:
+    name: str
+    vectors: np.ndarray  # (rows, dim), memory-mapped
+    ids: list[str]
+    payloads: list[dict]
+    deleted: np.ndarray  # (rows,) bool tombstones
+    ranges: dict  # (field, value) -> [(start, end), ...]
+
+    @property
+    def live(self) -> int:
+        return len(self.ids) - int(self.deleted.sum())
+
+
+def _ranges(payloads) -> dict:
+    """
+    Contiguous row runs per owner. Ingestion writes a PDF's chunks
+    back to back, so a segment usually holds one run per PDF.
+    """
+    ranges = {}
+    for row, payload in enumerate(payloads):
+        for key in _owner_keys(payload):
+            runs = ranges.setdefault(key, [])
+            if runs and runs[-1][1] == row:
+                runs[-1] = (runs[-1][0], row + 1)
+            else:
+                runs.append((row, row + 1))
+    return ranges
+
+
+class NumpyStorage:
+    """
+    Drop-in for QdrantStorage backed by memory-mapped NumPy segments, for
+    tests, single-node deployments and offline benchmarks. Search is exact
+    cosine top-k; `query_text` is accepted for interface parity but there is
+    no lexical side.
+    """
+
+    def __init__(self, path=NUMPY_STORE_DIR, dim=None, dtype=NUMPY_STORE_DTYPE, profile=None):
+        self.path = path
+        self.profile = profile or PROFILE
+        self.dim = dim or self.profile.dim
+        self.dtype = np.dtype(dtype)
+        self.hybrid = False
+
+        self._lock = threading.RLock()
+        self._segments: list[_Segment] = []
+        self._locations = {}  # point id -> (segment name, row)
+        self._next = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._open()
+
+    # ---------------- persistence ----------------
+
+    def _file(self, name, suffix):
+        return os.path.join(self.path, f"{name}{suffix}")
+
+    def _open(self):
+        manifest = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(manifest):
+            return
+
+        with open(manifest) as f:
+            state = json.load(f)
+        if state["dim"] != self.dim:
+            raise RuntimeError(f"Vector store at '{self.path}' holds {state['dim']}-dim vectors, expected {self.dim}")
+
+        self._next = state["next"]
+        for name in state["segments"]:
+            self._segments.append(self._load_segment(name))
+
+        # Later segments win, matching upsert semantics
+        for seg in self._segments:
+            for row, point_id in enumerate(seg.ids):
+                if not seg.deleted[row]:
+                    self._locations[point_id] = (seg.name, row)
+
+    def _load_segment(self, name) -> _Segment:
+        with open(self._file(name, ".json")) as f:
+            meta = json.load(f)
+        deleted_path = self._file(name, ".deleted.npy")
+        deleted = np.load(deleted_path) if os.path.exists(deleted_path) else np.zeros(len(meta["ids"]), dtype=bool)
+        return _Segment(
+            name=name,
+            vectors=np.load(self._file(name, ".npy"), mmap_mode="r"),
+            ids=meta["ids"],
+            payloads=meta["payloads"],
+            deleted=deleted,
+            ranges=_ranges(meta["payloads"]),
+        )
+
+    def _new_name(self) -> str:
+        name = f"seg-{self._next:06d}"
+        self._next += 1
+        return name
+
+    def _write_meta(self, name, ids, payloads):
+        _write_atomic(
+            self._file(name, ".json"),
+            lambda f: f.write(json.dumps({"ids": ids, "payloads": payloads}).encode("utf-8")),
+        )
+
+    def _write_segment(self, ids, matrix, payloads) -> _Segment:
+        name = self._new_name()
+        _write_atomic(self._file(name, ".npy"), lambda f: np.save(f, matrix))
+        self._write_meta(name, ids, payloads)
+        return self._load_segment(name)
+
+    def _copy_segment(self, rows) -> _Segment:
+        """
+        Writes (segment, row) pairs, in order, as a new segment. Vectors go
+        from the source memory maps into a memory-mapped .npy block by block.
+        """
+        name = self._new_name()
+        path = self._file(name, ".npy")
+        tmp = f"{path}.tmp"
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=self.dtype, shape=(len(rows), self.dim))
+        for start in range(0, len(rows), NUMPY_MERGE_BLOCK_ROWS):
+            by_segment = {}
+            for i, (seg, row) in enumerate(rows[start:start + NUMPY_MERGE_BLOCK_ROWS], start):
+                _, positions, source = by_segment.setdefault(seg.name, (seg, [], []))
+                positions.append(i)
+                source.append(row)
+            for seg, positions, source in by_segment.values():
+                out[positions] = seg.vectors[source]
+        out.flush()
+        del out
+        os.replace(tmp, path)
+
+        self._write_meta(name, [seg.ids[row] for seg, row in rows], [seg.payloads[row] for seg, row in rows])
+        return self._load_segment(name)
+
+    def _save_manifest(self):
+        state = {"dim": self.dim, "next": self._next, "segments": [s.name for s in self._segments]}
+        _write_atomic(os.path.join(self.path, MANIFEST), lambda f: f.write(json.dumps(state).encode("utf-8")))
+
+    def _save_tombstones(self, seg: _Segment):
+        _write_atomic(self._file(seg.name, ".deleted.npy"), lambda f: np.save(f, seg.deleted))
+
+    def _remove_files(self, name):
+        for suffix in (".npy", ".json", ".deleted.npy"):
+            try:
+                os.remove(self._file(name, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _normalize(self, vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (matrix / norms).astype(self.dtype)
+
+    # ---------------- interface ----------------
+
+    @observed("numpy", "upsert")
+    def upsert(self, ids, vectors, payloads):
+        if not ids:
+            return
+
+        ids = [str(i) for i in ids]
+        matrix = self._normalize(vectors)
+        with self._lock:
+            seg = self._write_segment(ids, matrix, list(payloads))
+            self._tombstone([self._locations[i] for i in ids if i in self._locations])
+            self._segments.append(seg)
+            self._save_manifest()
+            for row, point_id in enumerate(ids):
+                self._locations[point_id] = (seg.name, row)
+            self._maybe_compact()
+
+    @observed("numpy", "existing_ids")
+    def existing_ids(self, ids) -> set[str]:
+        with self._lock:
+            return {str(i) for i in ids if str(i) in self._locations}
+
+    @observed("numpy", "fetch_vectors")
+    def fetch_vectors(self, ids) -> list:
+        with self._lock:
+            by_name = {seg.name: seg for seg in self._segments}
+            locations = [self._locations[str(i)] for i in ids if str(i) in self._locations]
+            return [by_name[name].vectors[row].astype(np.float32).tolist() for name, row in locations]
+
+    def _top_k(self, query_vector, top_k, allowed_pdf_ids, allowed_content_hashes):
+        """
+        Best `top_k` live rows as (segment, row), best first.
+        """
+        keys = self._filter_keys(allowed_pdf_ids, allowed_content_hashes)
+        if keys is None:
+            # No owners: nothing to search, never every user's rows
+            return []
+        query = self._normalize([query_vector])[0].astype(np.float32)
+        with self._lock:
+            segments = list(self._segments)
+
+        best_scores, best_rows = [], []
+        for seg in segments:
+            rows = self._rows(seg, keys)
+            if rows.size == 0:
+                continue
+
+            scores = seg.vectors[rows].astype(np.float32) @ query
+            if scores.size > top_k:
+                top = np.argpartition(-scores, top_k)[:top_k]
+            else:
+                top = np.arange(scores.size)
+            best_scores.extend(scores[top].tolist())
+            best_rows.extend((seg, int(rows[i])) for i in top)
+
+        order = np.argsort(-np.asarray(best_scores))[:top_k] if best_scores else []
+        return [best_rows[i] for i in order]
+
+    @observed("numpy", "search")
+    def search(self, query_vector, top_k=5, allowed_pdf_ids=None, allowed_content_hashes=None, query_text=None):
+        hits = self._top_k(query_vector, top_k, allowed_pdf_ids, allowed_content_hashes)
+        return _format_results(seg.payloads[row] for seg, row in hits)
+
+    def _top_grouped(self, query_vector, per_document, groups, allowed_pdf_ids, allowed_content_hashes):
+        """
+        The best `per_document` rows of each of the `groups` PDFs with the
+        best hits, as (segment, row), best first. Same result as Qdrant's
+        group-by on pdf_id.
+        """
+        keys = self._filter_keys(allowed_pdf_ids, allowed_content_hashes)
+        if keys is None:
+            # No owners: nothing to search, never every user's rows
+            return []
+        query = self._normalize([query_vector])[0].astype(np.float32)
+        with self._lock:
+            segments = list(self._segments)
+
+        scores, hits = [], []
+        for seg in segments:
+            rows = self._rows(seg, keys)
+            if rows.size == 0:
+                continue
+            scores.append(seg.vectors[rows].astype(np.float32) @ query)
+            hits.extend((seg, int(r)) for r in rows)
+        if not hits:
+            return []
+
+        taken, picked = {}, []
+        for i in np.argsort(-np.concatenate(scores)):
+            seg, row = hits[i]
+            pdf_id = seg.payloads[row].get("pdf_id")
+            count = taken.get(pdf_id)
+            if count is None:
+                if len(taken) == groups:
+                    continue
+                count = 0
+            if count == per_document:
+                continue
+            taken[pdf_id] = count + 1
+            picked.append((seg, row))
+            if len(picked) == groups * per_document:
+                break
+        return picked
+
+    @observed("numpy", "search_candidates")
+    def search_candidates(
+        self, query_vector, limit=20, allowed_pdf_ids=None, allowed_content_hashes=None, query_text=None,
+        per_document=None,
+    ):
+        if per_document:
+            hits = self._top_grouped(
+                query_vector, per_document, max(1, limit // per_document), allowed_pdf_ids, allowed_content_hashes
+            )
+        else:
+            hits = self._top_k(query_vector, limit, allowed_pdf_ids, allowed_content_hashes)
+        return [
+            {
+                "text": seg.payloads[row]["text"],
+                "source": seg.payloads[row].get("source"),
+                "pdf_id": seg.payloads[row].get("pdf_id"),
+                "content_hash": seg.payloads[row].get("content_hash"),
+                "page": seg.payloads[row].get("page"),
+                "vector": seg.vectors[row].astype(np.float32).tolist(),
+            }
+            for seg, row in hits
+            if seg.payloads[row].get("text")
+        ]
+
+    @observed("numpy", "search_owners")
+    def search_owners(self, query_vector, limit=100, allowed_pdf_ids=None, allowed_content_hashes=None):
+        query = self._normalize([query_vector])[0].astype(np.float32)
+        hits = self._top_k(query_vector, limit, allowed_pdf_ids, allowed_content_hashes)
+        return [
+            (
+                float(seg.vectors[row].astype(np.float32) @ query),
+                seg.payloads[row].get("pdf_id"),
+                seg.payloads[row].get("content_hash"),
+            )
+            for seg, row in hits
+        ]
+
+    @observed("numpy", "delete")
+    def delete(self, pdf_ids=None, content_hashes=None):
+        keys = self._filter_keys(pdf_ids, content_hashes)
+        if keys is None:
+            return
+
+        with self._lock:
+            doomed = []
+            for seg in self._segments:
+                rows = self._rows(seg, keys)
+                doomed.extend((seg.name, int(r)) for r in rows)
+            self._tombstone(doomed)
+            self._maybe_compact()
+
+    @observed("numpy", "scan_owners")
+    def scan_owners(self, offset=None, limit=1000):
+        """
+        One page of (point_id, pdf_id, content_hash) in id order, plus the
+        offset of the next page (None at the end).
+        """
+        with self._lock:
+            ids = sorted(self._locations)
+            start = bisect.bisect_left(ids, offset) if offset is not None else 0
+            page = ids[start:start + limit]
+            by_name = {seg.name: seg for seg in self._segments}
+            owners = []
+            for point_id in page:
+                name, row = self._locations[point_id]
+                payload = by_name[name].payloads[row]
+                owners.append((point_id, payload.get("pdf_id"), payload.get("content_hash")))
+        next_offset = ids[start + limit] if start + limit < len(ids) else None
+        return owners, next_offset
+
+    @observed("numpy", "delete_ids")
+    def delete_ids(self, ids):
+        with self._lock:
+            self._tombstone([self._locations[str(i)] for i in ids if str(i) in self._locations])
+            self._maybe_compact()
+
+    def compact(self):
+        """
+        Rewrites every live row into one segment, grouped by owner, and drops
+        the old segments.
+        """
+        with self._lock:
+            if self._segments:
+                self._merge(list(self._segments))
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = sum(len(s.ids) for s in self._segments)
+            live = sum(s.live for s in self._segments)
+        return {"segments": len(self._segments), "rows": rows, "live": live}
+
+    # ---------------- internals ----------------
+
+    @staticmethod
+    def _filter_keys(pdf_ids, content_hashes):
+        keys = [("pdf_id", v) for v in _as_list(pdf_ids)]
+        keys += [("content_hash", v) for v in _as_list(content_hashes)]
+        return keys or None
+
+    @staticmethod
+    def _rows(seg: _Segment, keys) -> np.ndarray:
+        """
+        Live rows of a segment owned by any of the keys.
+        """
+        runs = [run for key in keys for run in seg.ranges.get(key, ())]
+        if not runs:
+            return np.empty(0, dtype=np.int64)
+        rows = np.unique(np.concatenate([np.arange(start, end) for start, end in runs]))
+        return rows[~seg.deleted[rows]]
+
+    def _tombstone(self, locations):
+        by_name = {seg.name: seg for seg in self._segments}
+        touched = set()
+        for name, row in locations:
+            seg = by_name[name]
+            if not seg.deleted[row]:
+                seg.deleted[row] = True
+                touched.add(name)
+                point_id = seg.ids[row]
+                if self._locations.get(point_id) == (name, row):
+                    del self._locations[point_id]
+        for name in touched:
+            self._save_tombstones(by_name[name])
+
+    def _merge(self, segments):
+        """
+        Replaces `segments` by one segment of their live rows, grouped by
+        owner (none if no row is live).
+        """
+        live = [(seg, int(row)) for seg in segments for row in np.flatnonzero(~seg.deleted)]
+        live.sort(key=lambda item: (
+            item[0].payloads[item[1]].get("content_hash") or "",
+            item[0].payloads[item[1]].get("pdf_id") or "",
+        ))
+
+        old = {seg.name for seg in segments}
+        kept = [seg for seg in self._segments if seg.name not in old]
+        if live:
+            merged = self._copy_segment(live)
+            self._segments = kept + [merged]
+            for row, (seg, source) in enumerate(live):
+                self._locations[seg.ids[source]] = (merged.name, row)
+        else:
+            self._segments = kept
+
+        self._save_manifest()
+        for name in old:
+            self._remove_files(name)
+
+    @staticmethod
+    def _tier(rows: int) -> int:
+        tier = 0
+        size = NUMPY_MERGE_MIN_ROWS
+        while rows >= size:
+            tier += 1
+            size *= NUMPY_MERGE_FACTOR
+        return tier
+
+    def _maybe_compact(self):
+        # Mostly dead segments are rewritten alone: the cost is that
+        # segment's size, not the store's
+        for seg in list(self._segments):
+            if seg.live == 0 or (len(seg.ids) - seg.live) / len(seg.ids) > NUMPY_MAX_DEAD_RATIO:
+                self._merge([seg])
+
+        # Then merge any size tier holding NUMPY_MERGE_FACTOR segments; the
+        # result may fill the next tier up
+        while True:
+            tiers = {}
+            for seg in self._segments:
+                tiers.setdefault(self._tier(seg.live), []).append(seg)
+            full = [group for _, group in sorted(tiers.items()) if len(group) >= NUMPY_MERGE_FACTOR]
+            if not full:
+                return
+            self._merge(full[0])
+
+
+class AsyncNumpyStorage:
+    """
+    NumpyStorage behind the AsyncQdrantStorage interface. Work runs on a
+    thread so large scans don't block the event loop.
+    """
+
+    def __init__(self, storage: NumpyStorage):
+        self.storage = storage
+        self.profile = storage.profile
+        self.dim = storage.dim
+        self.hybrid = False
+
+    async def upsert(self, ids, vectors, payloads):
+        await asyncio.to_thread(self.storage.upsert, ids, vectors, payloads)
+
+    async def existing_ids(self, ids) -> set[str]:
+        return self.storage.existing_ids(ids)
+
+    async def search(self, query_vector, top_k=5, allowed_pdf_ids=None, allowed_content_hashes=None, query_text=None):
+        return await asyncio.to_thread(
+            self.storage.search, query_vector, top_k, allowed_pdf_ids, allowed_content_hashes, query_text
+        )
+
+    async def search_candidates(
+        self, query_vector, limit=20, allowed_pdf_ids=None, allowed_content_hashes=None, query_text=None,
+        per_document=None,
+    ):
+        return await asyncio.to_thread(
+            self.storage.search_candidates, query_vector, limit, allowed_pdf_ids, allowed_content_hashes, query_text,
+            per_document,
+        )
+
+    async def delete(self, pdf_ids=None, content_hashes=None):
+        await asyncio.to_thread(self.storage.delete, pdf_ids, content_hashes)
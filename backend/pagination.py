@@ -0,0 +1,46 @@
+import base64
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+# --------------------------------------------------
+# Keyset cursors over (created_at, id)
+# --------------------------------------------------
+# Rows are ordered by created_at with id as a tie-breaker, so a cursor is
+# just the pair of the last row seen, base64-encoded to keep it opaque.
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), row_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after(created_col, id_col, cursor: str):
+    """
+    Filter for rows strictly after the cursor in (created_at, id) order.
+    """
+    created_at, row_id = decode_cursor(cursor)
+    return or_(
+        created_col > created_at,
+        and_(created_col == created_at, id_col > row_id),
+    )
+
+
+def before(created_col, id_col, cursor: str):
+    """
+    Filter for rows strictly before the cursor in (created_at, id) order.
+    """
+    created_at, row_id = decode_cursor(cursor)
+    return or_(
+        created_col < created_at,
+        and_(created_col == created_at, id_col < row_id),
+    )
@@ -0,0 +1,175 @@
+import os
+import queue
+import threading
+import uuid
+from typing import Iterable
+from dotenv import load_dotenv
+from custom_types import RAGUpsertResult
+from data_loader import embed_text
+from routing import SummaryBuilder, save_summary
+
+load_dotenv()
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "100"))
+# Batches allowed to wait between two stages; bounds memory held in flight
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "2"))
+
+_DONE = object()
+
+
+def point_id(key: str, i: int) -> str:
+    """
+    Deterministic ID of chunk i. `key` is the content hash, or the pdf_id
+    for documents ingested before content hashing.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{key}:{i}"))
+
+
+class _Stage(threading.Thread):
+    """
+    Pulls items from `inbox`, hands them to `work`, pushes results to
+    `outbox`. Any exception is kept so the consumer can re-raise it.
+    """
+
+    def __init__(self, name, work, inbox, outbox, stop):
+        super().__init__(name=name, daemon=True)
+        self.work = work
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop = stop
+        self.error = None
+
+    def _put(self, item):
+        # Don't block forever on a full queue if the consumer has gone away
+        while not self.stop.is_set():
+            try:
+                self.outbox.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def run(self):
+        try:
+            for item in self.work(self.inbox):
+                if self.stop.is_set():
+                    return
+                self._put(item)
+        except BaseException as e:
+            self.error = e
+            self.stop.set()
+        finally:
+            self._put(_DONE)
+
+
+def _drain(inbox: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            item = inbox.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def ingest_stream(
+    chunks: Iterable[dict],
+    pdf_id: str,
+    source_id: str,
+    store,
+    content_hash: str | None = None,
+    user_id: str | None = None,
+    summaries=None,
+    batch_size: int = INGEST_BATCH_SIZE,
+    queue_size: int = INGEST_QUEUE_SIZE,
+) -> RAGUpsertResult:
+    """
+    load -> chunk -> embed -> upsert as a three-stage pipeline.
+
+    Chunking and embedding run on their own threads with bounded queues
+    between them, and each batch is upserted as soon as it is embedded, so
+    peak memory is a few batches regardless of document size and the first
+    vectors are searchable while later chunks are still being read.
+
+    Point IDs are deterministic (uuid5(content_hash:i)), and each batch
+    skips IDs already in the store, so re-running after a failure only
+    redoes the batches that never landed.
+
+    `chunks` are chunker records ({"text", "page", "char_offset"}); page
+    and offset are stored in the payload for citations. Embedding runs at
+    ingest priority in `user_id`'s rate-limit share.
+
+    With a `summaries` store, the document's summary vectors (routing.py)
+    are built from the same embeddings and saved once every batch has
+    landed; on a resumed run the skipped batches' vectors are read back.
+    """
+    key = content_hash or pdf_id
+    extra = {"content_hash": content_hash} if content_hash else {}
+    stop = threading.Event()
+    batches = queue.Queue(maxsize=queue_size)
+    embedded = queue.Queue(maxsize=queue_size)
+    summary = SummaryBuilder()
+
+    def batch_chunks(_):
+        batch = []
+        start = 0
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) == batch_size:
+                yield start, batch
+                start += len(batch)
+                batch = []
+        if batch:
+            yield start, batch
+
+    def embed_batches(inbox):
+        for start, records in _drain(inbox, stop):
+            ids = [point_id(key, start + j) for j in range(len(records))]
+            existing = store.existing_ids(ids)
+            todo = [j for j, pid in enumerate(ids) if pid not in existing]
+            vectors = embed_text([records[j]["text"] for j in todo], user=user_id) if todo else []
+            if summaries is not None:
+                summary.add(vectors)
+                if existing:
+                    summary.add(store.fetch_vectors(list(existing)))
+            yield (
+                [ids[j] for j in todo],
+                vectors,
+                [
+                    {
+                        "source": source_id,
+                        "text": records[j]["text"],
+                        "page": records[j].get("page"),
+                        "char_offset": records[j].get("char_offset"),
+                        "pdf_id": pdf_id,
+                        **extra,
+                    }
+                    for j in todo
+                ],
+                len(existing),
+            )
+
+    chunker = _Stage("ingest-chunk", batch_chunks, None, batches, stop)
+    embedder = _Stage("ingest-embed", embed_batches, batches, embedded, stop)
+    chunker.start()
+    embedder.start()
+
+    result = RAGUpsertResult(ingested=0)
+    try:
+        for ids, vectors, payloads, skipped in _drain(embedded, stop):
+            if ids:
+                store.upsert(ids=ids, vectors=vectors, payloads=payloads)
+            result.ingested += len(ids)
+            result.skipped += skipped
+    finally:
+        stop.set()
+        chunker.join()
+        embedder.join()
+
+    for stage in (chunker, embedder):
+        if stage.error is not None:
+            raise stage.error
+
+    if summaries is not None:
+        save_summary(summaries, summary, pdf_id, source_id, content_hash)
+    return result
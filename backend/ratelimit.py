@@ -0,0 +1,242 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from dotenv import load_dotenv
+import clients
+from metrics import RATE_LIMIT_WAIT_SECONDS
+
+load_dotenv()
+
+# --------------------------------------------------
+# Token-bucket rate limits for Gemini
+# --------------------------------------------------
+# Every embed and generate call takes one request and its estimated tokens
+# from the model's requests/min and tokens/min buckets before it is sent,
+# and waits while either is empty, so bursts queue here instead of coming
+# back as 429s. Two rules keep the waiting fair:
+#   - ingestion may not take the last RATE_LIMIT_QUERY_RESERVE of a bucket,
+#     global or per user, which is kept for queries
+#   - each user also has their own buckets at RATE_LIMIT_USER_SHARE of the
+#     model's, so one bulk upload can't take everything
+# The buckets live in this process by default. With RATE_LIMIT_BACKEND=redis
+# they live in a Redis-compatible server and all workers share them.
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # or "redis"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_QUERY_RESERVE = float(os.getenv("RATE_LIMIT_QUERY_RESERVE", "0.2"))
+RATE_LIMIT_USER_SHARE = float(os.getenv("RATE_LIMIT_USER_SHARE", "0.5"))
+# Longest a call waits for capacity before giving up (the step then retries)
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "120"))
+
+QUERY = "query"
+INGEST = "ingest"
+
+
+class RateLimited(Exception):
+    """
+    Raised when capacity didn't free up within RATE_LIMIT_MAX_WAIT.
+    """
+
+
+@dataclass(frozen=True)
+class Limit:
+    rpm: int
+    tpm: int
+
+
+@dataclass(frozen=True)
+class _Take:
+    key: str
+    amount: float
+    capacity: float
+    # tokens refilled per second
+    rate: float
+    # level the bucket must stay at or above after this take
+    floor: float
+
+
+_limits: dict[str, Limit] = {}
+
+
+def configure(model: str, rpm: int, tpm: int):
+    """
+    Sets a model's limits; 0 disables that bucket. Unconfigured models
+    are not limited.
+    """
+    _limits[model] = Limit(rpm=rpm, tpm=tpm)
+
+
+def _takes(model: str, tokens: int, priority: str, user: str | None) -> list[_Take]:
+    limit = _limits.get(model)
+    if limit is None:
+        return []
+
+    reserve = RATE_LIMIT_QUERY_RESERVE if priority == INGEST else 0.0
+    takes = []
+    for kind, capacity, amount in (("rpm", limit.rpm, 1), ("tpm", limit.tpm, tokens)):
+        if capacity <= 0:
+            continue
+        floor = capacity * reserve
+        # A request bigger than the usable bucket would wait forever
+        amount = min(amount, capacity - floor)
+        takes.append(_Take(f"ratelimit:{model}:{kind}", amount, capacity, capacity / 60, floor))
+        if user:
+            share = max(capacity * RATE_LIMIT_USER_SHARE, 1)
+            # The user's own ingestion leaves them the same reserve for queries
+            user_floor = share * reserve
+            takes.append(_Take(
+                f"ratelimit:{model}:{kind}:{user}", min(amount, share - user_floor), share, share / 60, user_floor,
+            ))
+    return takes
+
+
+# ---------------- backends ----------------
+
+class MemoryBackend:
+    """
+    Buckets in this process. Each worker process then has the full limit
+    to itself, so divide the limits by the worker count, or use Redis.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (level, updated)
+
+    def take(self, takes: list[_Take]) -> float:
+        """
+        Takes from every bucket or from none. Returns 0 on success, else
+        the seconds until all of them could have enough.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for t in takes:
+                level, updated = self._buckets.get(t.key, (t.capacity, now))
+                level = min(t.capacity, level + (now - updated) * t.rate)
+                levels.append(level)
+                short = t.amount + t.floor - level
+                if short > 0:
+                    wait = max(wait, short / t.rate)
+            if wait:
+                return wait
+            for t, level in zip(takes, levels):
+                self._buckets[t.key] = (level - t.amount, now)
+            return 0.0
+
+
+# Same algorithm as MemoryBackend.take, atomic on the server and on the
+# server's clock. Returns a string so the wait isn't truncated to an integer.
+_TAKE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local levels = {}
+local wait = 0
+for i = 1, #KEYS do
+    local amount, capacity, rate, floor = tonumber(ARGV[4*i-3]), tonumber(ARGV[4*i-2]), tonumber(ARGV[4*i-1]), tonumber(ARGV[4*i])
+    local stored = redis.call('HMGET', KEYS[i], 'level', 'updated')
+    local level = tonumber(stored[1]) or capacity
+    local updated = tonumber(stored[2]) or now
+    level = math.min(capacity, level + math.max(0, now - updated) * rate)
+    levels[i] = level
+    local short = amount + floor - level
+    if short > 0 then wait = math.max(wait, short / rate) end
+end
+if wait > 0 then return tostring(wait) end
+for i = 1, #KEYS do
+    local amount, capacity, rate = tonumber(ARGV[4*i-3]), tonumber(ARGV[4*i-2]), tonumber(ARGV[4*i-1])
+    redis.call('HSET', KEYS[i], 'level', tostring(levels[i] - amount), 'updated', tostring(now))
+    -- A full bucket is the same as no bucket
+    redis.call('PEXPIRE', KEYS[i], math.ceil(capacity / rate * 1000) + 1000)
+end
+return '0'
+"""
+
+
+class RedisBackend:
+    """
+    Buckets in Redis (or Valkey, KeyDB, ...) so every worker shares them.
+    Needs the optional `redis` package.
+    """
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis needs the redis package (pip install redis)") from e
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(_TAKE_SCRIPT)
+
+    def take(self, takes: list[_Take]) -> float:
+        args = []
+        for t in takes:
+            args += [t.amount, t.capacity, t.rate, t.floor]
+        return float(self._script(keys=[t.key for t in takes], args=args))
+
+
+def get_backend():
+    def make():
+        if RATE_LIMIT_BACKEND == "redis":
+            return RedisBackend()
+        return MemoryBackend()
+
+    return clients.shared("ratelimit", make)
+
+
+# ---------------- acquiring ----------------
+
+def _check_wait(waited: float, wait: float, model: str):
+    if waited + wait > RATE_LIMIT_MAX_WAIT:
+        raise RateLimited(f"{model}: no capacity within {RATE_LIMIT_MAX_WAIT:.0f}s")
+
+
+def acquire(model: str, tokens: int, *, priority: str, user: str | None = None):
+    """
+    Blocks until `model` has room for one request of `tokens` tokens.
+    Sleeps the calling thread, so never call it on the event loop (Inngest
+    runs sync step handlers there too); use aacquire() instead.
+    """
+    takes = _takes(model, tokens, priority, user)
+    if not takes:
+        return
+    backend = get_backend()
+    start = time.perf_counter()
+    while True:
+        wait = backend.take(takes)
+        waited = time.perf_counter() - start
+        if not wait:
+            RATE_LIMIT_WAIT_SECONDS.labels(model, priority).observe(waited)
+            return
+        _check_wait(waited, wait, model)
+        time.sleep(wait)
+
+
+async def aacquire(model: str, tokens: int, *, priority: str, user: str | None = None):
+    """
+    acquire() for the event loop.
+    """
+    takes = _takes(model, tokens, priority, user)
+    if not takes:
+        return
+    backend = get_backend()
+    start = time.perf_counter()
+    while True:
+        if isinstance(backend, MemoryBackend):
+            wait = backend.take(takes)
+        else:
+            # A Redis round trip would otherwise block the loop
+            wait = await asyncio.to_thread(backend.take, takes)
+        waited = time.perf_counter() - start
+        if not wait:
+            RATE_LIMIT_WAIT_SECONDS.labels(model, priority).observe(waited)
+            return
+        _check_wait(waited, wait, model)
+        await asyncio.sleep(wait)
+
+
+def estimate_tokens(texts) -> int:
+    # ~4 characters per token, as in context.estimate_tokens
+    return math.ceil(sum(len(t) for t in texts) / 4)
@@ -0,0 +1,190 @@
+import os
+import uuid
+import numpy as np
+from dotenv import load_dotenv
+from metrics import ROUTED_DOCUMENTS
+from vector_db import _as_list, get_summary_storage
+
+load_dotenv()
+
+# --------------------------------------------------
+# Document routing with summary vectors
+# --------------------------------------------------
+# Ingestion stores a few vectors per document: the centroid of its chunk
+# embeddings plus the centroids of a small k-means over them, so a document
+# covering several topics is still found by a question about any one of
+# them. (Cluster means rather than medoids: a medoid is one real chunk and
+# carries its noise; bench_doc_routing measures the difference.)
+# When a conversation has more than DOC_ROUTING_TOP_N documents, a question
+# first ranks the documents by their best summary match and the chunk
+# search is filtered to the winners.
+
+# Cluster centroids stored per document next to the overall centroid
+DOC_SUMMARY_CLUSTERS = int(os.getenv("DOC_SUMMARY_CLUSTERS", "4"))
+# Chunk vectors kept (reservoir sample) for clustering a long document
+DOC_SUMMARY_SAMPLE = int(os.getenv("DOC_SUMMARY_SAMPLE", "1024"))
+DOC_SUMMARY_ITERATIONS = 10
+# Documents whose chunks are searched per question; 0 turns routing off.
+# Should stay well above CONTEXT_CANDIDATES // CONTEXT_PER_DOCUMENT, the
+# documents an unrouted search can return.
+DOC_ROUTING_TOP_N = int(os.getenv("DOC_ROUTING_TOP_N", "12"))
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+class SummaryBuilder:
+    """
+    Collects a document's chunk vectors batch by batch: an exact running
+    sum for the centroid and a fixed-size uniform sample for clustering,
+    so memory stays flat however long the document is.
+    """
+
+    def __init__(self, sample: int = DOC_SUMMARY_SAMPLE, seed: int = 0):
+        self.sample = sample
+        self.rng = np.random.default_rng(seed)
+        self.total = None
+        self.rows = []
+        self.seen = 0
+
+    def add(self, vectors):
+        if not len(vectors):
+            return
+        x = _normalize(np.asarray(vectors, dtype=np.float32))
+        batch = x.sum(axis=0, dtype=np.float64)
+        self.total = batch if self.total is None else self.total + batch
+        for row in x:
+            self.seen += 1
+            if len(self.rows) < self.sample:
+                self.rows.append(row)
+            else:
+                j = self.rng.integers(self.seen)
+                if j < self.sample:
+                    self.rows[j] = row
+
+    def vectors(self, clusters: int = DOC_SUMMARY_CLUSTERS) -> np.ndarray:
+        """
+        (1 + k, dim): the centroid, then up to `clusters` cluster centroids.
+        """
+        if self.total is None:
+            return np.empty((0, 0), dtype=np.float32)
+        centroid = _normalize(self.total.astype(np.float32))
+        return np.vstack([centroid, _clusters(np.stack(self.rows), clusters)])
+
+
+def _clusters(x: np.ndarray, k: int) -> np.ndarray:
+    """
+    Centroids of a spherical k-means on unit rows (k-means++ seeding with a
+    fixed seed, so re-ingesting gives the same summary).
+    """
+    # One row is its own centroid already
+    k = min(k, len(x) - 1)
+    if k <= 0:
+        return np.empty((0, x.shape[1]), dtype=np.float32)
+
+    rng = np.random.default_rng(0)
+    centers = [x[rng.integers(len(x))]]
+    for _ in range(1, k):
+        distance = np.clip(1.0 - (x @ np.stack(centers).T).max(axis=1), 0.0, None)
+        if distance.sum() == 0:
+            break
+        centers.append(x[rng.choice(len(x), p=distance / distance.sum())])
+    centers = np.stack(centers)
+
+    for _ in range(DOC_SUMMARY_ITERATIONS):
+        labels = (x @ centers.T).argmax(axis=1)
+        moved = np.stack([
+            _normalize(x[labels == c].sum(axis=0)) if np.any(labels == c) else centers[c]
+            for c in range(len(centers))
+        ])
+        if np.allclose(moved, centers):
+            break
+        centers = moved
+    return centers
+
+
+def _summary_id(key: str, i: int) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{key}:summary:{i}"))
+
+
+def save_summary(
+    store,
+    builder: SummaryBuilder,
+    pdf_id: str,
+    source_id: str,
+    content_hash: str | None = None,
+    clusters: int = DOC_SUMMARY_CLUSTERS,
+) -> int:
+    """
+    Replaces the document's summary vectors. Returns how many were stored.
+    """
+    vectors = builder.vectors(clusters)
+    if not len(vectors):
+        return 0
+
+    key = content_hash or pdf_id
+    if content_hash:
+        store.delete(content_hashes=[content_hash])
+    else:
+        store.delete(pdf_ids=[pdf_id])
+
+    extra = {"content_hash": content_hash} if content_hash else {}
+    store.upsert(
+        ids=[_summary_id(key, i) for i in range(len(vectors))],
+        vectors=vectors.tolist(),
+        payloads=[
+            {
+                "pdf_id": pdf_id,
+                "source": source_id,
+                "kind": "centroid" if i == 0 else "cluster",
+                "chunks": builder.seen,
+                **extra,
+            }
+            for i in range(len(vectors))
+        ],
+    )
+    return len(vectors)
+
+
+def route(query_vector, allowed_pdf_ids, allowed_content_hashes=None, store=None, top_n=DOC_ROUTING_TOP_N):
+    """
+    Narrows (allowed_pdf_ids, allowed_content_hashes) to the `top_n`
+    documents whose best summary vector is closest to the query. Documents
+    without a summary (ingested before summaries existed) are always kept,
+    and on any error the filter comes back unchanged.
+    """
+    allowed_pdf_ids = _as_list(allowed_pdf_ids)
+    allowed_content_hashes = _as_list(allowed_content_hashes)
+    if not top_n or len(set(allowed_pdf_ids)) <= top_n:
+        return allowed_pdf_ids, allowed_content_hashes
+
+    try:
+        store = store or get_summary_storage()
+        hits = store.search_owners(
+            query_vector,
+            limit=len(set(allowed_pdf_ids)) * (1 + DOC_SUMMARY_CLUSTERS),
+            allowed_pdf_ids=allowed_pdf_ids,
+            allowed_content_hashes=allowed_content_hashes,
+        )
+    except Exception as e:
+        print(f"⚠️ Document routing skipped: {e}")
+        return allowed_pdf_ids, allowed_content_hashes
+
+    covered_pdf_ids, covered_hashes = set(), set()
+    ranked = {}  # document -> (pdf_id, content_hash), best first
+    for _, pdf_id, content_hash in hits:
+        covered_pdf_ids.add(pdf_id)
+        covered_hashes.add(content_hash)
+        ranked.setdefault(content_hash or pdf_id, (pdf_id, content_hash))
+
+    top = list(ranked.values())[:top_n]
+    top_pdf_ids = {pdf_id for pdf_id, _ in top}
+    top_hashes = {content_hash for _, content_hash in top}
+    pdf_ids = [p for p in allowed_pdf_ids if p not in covered_pdf_ids or p in top_pdf_ids]
+    content_hashes = [h for h in allowed_content_hashes if h not in covered_hashes or h in top_hashes]
+
+    ROUTED_DOCUMENTS.observe(len(top))
+    return pdf_ids, content_hashes
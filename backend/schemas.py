@@ -9,6 +9,14 @@ class LoginSchema(BaseModel):
     email: str
     password: str
 
+class CurrentUser(BaseModel):
+    """
+    The authenticated user as seen by route handlers. Not bound to a DB
+    session, so it can be cached across requests.
+    """
+    id: str
+    email: str
+
 class MessageSchema(BaseModel):
     role: str
     content: str
@@ -0,0 +1,87 @@
+import os
+import re
+import zlib
+from collections import Counter
+from dotenv import load_dotenv
+from chunker import CHUNK_SIZE, CHARS_PER_TOKEN
+
+load_dotenv()
+
+# --------------------------------------------------
+# BM25 sparse vectors for lexical matching
+# --------------------------------------------------
+# Documents carry the BM25 term-frequency part; the IDF part is applied by
+# Qdrant (Modifier.IDF on the sparse vector) from the collection's own
+# statistics, so it stays correct as documents come and go.
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# BM25's avgdl: typical terms per chunk. English prose gives about one
+# term per 8 characters once stopwords are dropped (~500 for a 1000-token chunk)
+BM25_AVG_DOC_LEN = float(os.getenv("BM25_AVG_DOC_LEN", str(CHUNK_SIZE * CHARS_PER_TOKEN / 8)))
+
+# Words joined by - _ . / : # stay together, so "ERR-4012", "4.2.1" and
+# "x86_64" survive as single terms
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./:#][a-z0-9]+)*")
+_SEPARATORS = re.compile(r"[-_./:#]")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i if in into is it its of on or
+so than that the their then there these they this to was were what when where which
+who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lower-cased terms. A compound token like "ERR-4012" is emitted as
+    itself, in joined form ("err4012") and as its parts, so queries match
+    however the user writes the identifier.
+    """
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        parts = _SEPARATORS.split(token)
+        if len(parts) == 1:
+            if token not in STOPWORDS and (len(token) > 1 or token.isdigit()):
+                tokens.append(token)
+            continue
+
+        tokens.append(token)
+        tokens.append("".join(parts))
+        tokens.extend(p for p in parts if p not in STOPWORDS and (len(p) > 1 or p.isdigit()))
+    return tokens
+
+
+def term_index(term: str) -> int:
+    # Hashed vocabulary: no shared term table to keep in sync between workers
+    return zlib.crc32(term.encode("utf-8")) & 0x7FFFFFFF
+
+
+def _vector(weights: dict[str, float]) -> tuple[list[int], list[float]]:
+    merged = {}
+    for term, weight in weights.items():
+        i = term_index(term)
+        merged[i] = merged.get(i, 0.0) + weight
+    indices = sorted(merged)
+    return indices, [merged[i] for i in indices]
+
+
+def encode_document(text: str) -> tuple[list[int], list[float]]:
+    """
+    (indices, values) with BM25 term-frequency saturation and length
+    normalization.
+    """
+    tf = Counter(tokenize(text))
+    if not tf:
+        return [], []
+
+    length = sum(tf.values())
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / BM25_AVG_DOC_LEN)
+    return _vector({t: n * (BM25_K1 + 1) / (n + norm) for t, n in tf.items()})
+
+
+def encode_query(text: str) -> tuple[list[int], list[float]]:
+    """
+    (indices, values) with weight 1 per distinct term; Qdrant supplies IDF.
+    """
+    return _vector({t: 1.0 for t in set(tokenize(text))})
@@ -0,0 +1,74 @@
+import os
+from typing import AsyncIterator
+import httpx
+from fastapi import UploadFile
+from dotenv import load_dotenv
+from metrics import observed
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))  # 1 MB
+
+_http = None
+
+
+def _client() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0))
+    return _http
+
+
+async def iter_upload(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    Reads an upload in fixed-size chunks. Starlette has already spooled it
+    to a temp file, so this never holds more than one chunk in memory.
+    """
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def hashing(chunks: AsyncIterator[bytes], hasher) -> AsyncIterator[bytes]:
+    """
+    Passes chunks through unchanged while feeding them to `hasher`.
+    """
+    async for chunk in chunks:
+        hasher.update(chunk)
+        yield chunk
+
+
+@observed("supabase", "upload")
+async def upload_stream(
+    bucket: str,
+    path: str,
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    size: int | None = None,
+):
+    """
+    Streams an object into Supabase Storage through its REST API.
+
+    supabase-py's storage client only takes bytes or a real file and
+    uploads with a blocking call, so this goes straight to the endpoint
+    with an async body instead.
+    """
+    headers = {
+        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+        "apikey": SUPABASE_SERVICE_ROLE_KEY,
+        "Content-Type": content_type,
+        "x-upsert": "false",
+    }
+    if size is not None:
+        headers["Content-Length"] = str(size)
+
+    response = await _client().post(
+        f"{SUPABASE_URL}/storage/v1/object/{bucket}/{path}",
+        content=chunks,
+        headers=headers,
+    )
+    response.raise_for_status()
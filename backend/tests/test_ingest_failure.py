@@ -0,0 +1,86 @@
+"""
+An upload that isn't a readable PDF must end its ingest run with an
+assistant message, or the frontend keeps polling for one forever.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import tempfile
+import types
+
+# main builds its database engines at import time
+_DB = os.path.join(tempfile.mkdtemp(prefix="cortex-test-"), "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+import inngest
+import pytest
+
+import clients
+import main
+from benchmarks.fakes import FakeContext
+from data_loader import PdfParseError, iter_pages
+from db import SessionLocal, engine
+from models import Base, Conversation, Message, User
+
+CORRUPT = b"%PDF-1.7\n1 0 obj << /Type /Catalog /Pages 2 0 R >>\nthis is not a pdf\n%%EOF"
+
+
+class _Bucket:
+    def __init__(self, data):
+        self.data = data
+
+    def download(self, path):
+        return self.data
+
+
+@pytest.fixture
+def conversation():
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    user = User(email=f"{os.urandom(4).hex()}@test", hashed_password="x")
+    db.add(user)
+    db.flush()
+    conv = Conversation(user_id=user.id)
+    db.add(conv)
+    db.commit()
+    yield conv.id
+    db.close()
+
+
+def test_iter_pages_rejects_corrupt_pdf(tmp_path):
+    path = tmp_path / "broken.pdf"
+    path.write_bytes(CORRUPT)
+    with pytest.raises(PdfParseError):
+        list(iter_pages(str(path)))
+
+
+def test_corrupt_pdf_fails_without_retry_and_posts_a_message(conversation, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    clients.override("supabase", types.SimpleNamespace(
+        storage=types.SimpleNamespace(from_=lambda bucket: _Bucket(CORRUPT))
+    ))
+    data = {
+        "storage_path": "u/broken.pdf",
+        "pdf_id": "broken",
+        "source_id": "broken.pdf",
+        "conversation_id": conversation,
+        "user_id": "u",
+    }
+
+    with pytest.raises(inngest.NonRetriableError):
+        asyncio.run(main.ingest_pdf(FakeContext(data)))
+    # The temporary download is cleaned up either way
+    assert not (tmp_path / "temp_broken.pdf").exists()
+
+    # Inngest then calls the on_failure handler with the original event
+    assert asyncio.run(main.ingest_pdf_failed(FakeContext({"event": {"data": data}})))
+
+    db = SessionLocal()
+    try:
+        messages = db.query(Message).filter(Message.conversation_id == conversation).all()
+    finally:
+        db.close()
+    assert [m.role for m in messages] == ["assistant"]
+    assert "broken.pdf" in messages[0].content
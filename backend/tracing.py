@@ -0,0 +1,60 @@
+import re
+import secrets
+from contextlib import contextmanager
+
+try:
+    # Optional: with an OpenTelemetry SDK configured, steps become real spans
+    from opentelemetry import context as otel_context, propagate, trace
+except ImportError:
+    otel_context = propagate = trace = None
+
+# --------------------------------------------------
+# W3C trace context carried through Inngest events
+# --------------------------------------------------
+# /query-pdf puts a `trace` carrier ({"traceparent": ...}) into the event, so
+# the steps that run later (in other requests) can be tied back to the HTTP
+# request that caused them.
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_tracer = trace.get_tracer("cortexai") if trace is not None else None
+
+
+def trace_id(carrier: dict | None) -> str | None:
+    match = _TRACEPARENT.match((carrier or {}).get("traceparent", ""))
+    return match.group(1) if match else None
+
+
+def inject(traceparent: str | None = None) -> dict:
+    """
+    A carrier for the current trace: the active OpenTelemetry span if there
+    is one, else the caller's traceparent header, else a fresh trace.
+    """
+    carrier = {}
+    if propagate is not None:
+        propagate.inject(carrier)
+    if "traceparent" not in carrier:
+        if traceparent and _TRACEPARENT.match(traceparent):
+            carrier["traceparent"] = traceparent
+        else:
+            carrier["traceparent"] = f"00-{secrets.token_hex(16)}-{secrets.token_hex(8)}-01"
+    return carrier
+
+
+@contextmanager
+def span(name: str, carrier: dict | None = None):
+    """
+    Runs the block in a span parented to `carrier`. A no-op without
+    OpenTelemetry, and close to one without an SDK.
+    """
+    if _tracer is None:
+        yield
+        return
+
+    token = otel_context.attach(propagate.extract(carrier)) if carrier else None
+    try:
+        with _tracer.start_as_current_span(name):
+            yield
+    finally:
+        if token is not None:
+            otel_context.detach(token)
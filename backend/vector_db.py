@@ -1,96 +1,675 @@
-from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct, Filter, FieldCondition, MatchAny, PayloadSchemaType
+from dataclasses import dataclass, replace
 from dotenv import load_dotenv
+import asyncio
 import os
+import threading
+import sparse
+from metrics import observed
+from clients import LazyModule
+
+# Imported on first use: the numpy backend never needs them, and the API
+# process doesn't pay for them until its first vector operation
+qdrant_client = LazyModule("qdrant_client")
+models = LazyModule("qdrant_client.models")
 
 load_dotenv()
 
 qdrant_url = os.getenv("QDRANT_URL")
 qdrant_api_key = os.getenv("QDRANT_API_KEY")
+# gRPC is noticeably faster for bulk upserts when the deployment exposes it
+qdrant_prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+# Keep-alive connections held open to Qdrant by the shared client
+qdrant_pool_size = int(os.getenv("QDRANT_POOL_SIZE", "16"))
+# "qdrant", or "numpy" for the embedded store in numpy_store.py (no server)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant").lower()
 
-class QdrantStorage:
-    def __init__(self, collection="doc", dim=3072):
-        self.client = QdrantClient(
-            url=qdrant_url,
-            api_key=qdrant_api_key,
-            timeout=30,
+COLLECTION = os.getenv("QDRANT_COLLECTION", "doc")
+# Per-document summary vectors used to route queries (see routing.py)
+SUMMARY_COLLECTION = os.getenv("QDRANT_SUMMARY_COLLECTION", f"{COLLECTION}_docs")
+DIM = 3072
+
+QUANTIZATIONS = ("none", "scalar", "binary")
+
+# Named sparse vector holding BM25 term weights next to the dense vector
+SPARSE_VECTOR = "bm25"
+# Each side of a hybrid query contributes top_k * this many candidates to fusion
+HYBRID_OVERFETCH = int(os.getenv("HYBRID_OVERFETCH", "4"))
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """
+    How vectors are laid out in Qdrant.
+
+    dim           vector size; 768/1536 need EMBED_DIM set to match
+    quantization  "scalar" keeps an int8 copy in RAM (4x smaller), "binary"
+                  a 1-bit copy (32x smaller); "none" searches the floats
+    on_disk       keep the full-precision vectors on disk (mmap) and only
+                  the quantized copy in RAM
+    rescore       re-rank the quantized candidates with the full vectors
+    oversampling  candidates fetched per result before rescoring
+    hybrid        also store BM25 sparse vectors and fuse lexical and
+                  dense results at query time
+    """
+
+    dim: int = DIM
+    quantization: str = "none"
+    on_disk: bool = False
+    rescore: bool = True
+    oversampling: float | None = None
+    hybrid: bool = True
+
+    def __post_init__(self):
+        if self.quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization must be one of {QUANTIZATIONS}, got '{self.quantization}'")
+
+    @classmethod
+    def from_env(cls):
+        oversampling = os.getenv("VECTOR_OVERSAMPLING")
+        return cls(
+            dim=int(os.getenv("EMBED_DIM", str(DIM))),
+            quantization=os.getenv("VECTOR_QUANTIZATION", "none").lower(),
+            on_disk=os.getenv("VECTOR_ON_DISK", "false").lower() == "true",
+            rescore=os.getenv("VECTOR_RESCORE", "true").lower() == "true",
+            oversampling=float(oversampling) if oversampling else None,
+            hybrid=os.getenv("VECTOR_HYBRID", "true").lower() == "true",
         )
-        self.collection = collection
 
-        if not self.client.collection_exists(self.collection):
-            self.client.create_collection(
-                collection_name=self.collection,
-                vectors_config=VectorParams(
-                    size=dim,
-                    distance=Distance.COSINE,
-                ),
-            )
+    def vectors_config(self):
+        return models.VectorParams(
+            size=self.dim,
+            distance=models.Distance.COSINE,
+            on_disk=self.on_disk or None,
+        )
 
-            self.client.create_payload_index(
-                collection_name=self.collection,
-                field_name="pdf_id",
-                field_schema=PayloadSchemaType.KEYWORD, # or .UUID if your IDs are clean UUIDs
-            )
-            print(f"Index created for 'pdf_id' in {self.collection}")
+    def sparse_vectors_config(self):
+        if not self.hybrid:
+            return None
+        # Qdrant computes IDF from the collection itself
+        return {SPARSE_VECTOR: models.SparseVectorParams(modifier=models.Modifier.IDF)}
 
-    def upsert(self, ids, vectors, payloads):
-        points = [
-            PointStruct(
-                id=ids[i],
-                vector=vectors[i],
-                payload=payloads[i],
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
             )
-            for i in range(len(ids))
-        ]
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def search_params(self):
+        if self.quantization == "none":
+            return None
+        # Binary codes are coarse; they need a wider candidate pool to rescore
+        oversampling = self.oversampling or (3.0 if self.quantization == "binary" else 1.5)
+        return models.SearchParams(
+            quantization=models.QuantizationSearchParams(rescore=self.rescore, oversampling=oversampling)
+        )
+
+    def ram_bytes_per_vector(self) -> int:
+        """
+        Vector bytes kept in RAM per point, excluding the HNSW graph.
+        """
+        quantized = {"none": 0, "scalar": self.dim, "binary": -(-self.dim // 8)}[self.quantization]
+        full = 0 if self.on_disk else self.dim * 4
+        return full + quantized
+
+
+PROFILE = StorageProfile.from_env()
+
+
+def _client_kwargs():
+    return dict(
+        url=qdrant_url,
+        api_key=qdrant_api_key,
+        timeout=30,
+        prefer_grpc=qdrant_prefer_grpc,
+        pool_size=qdrant_pool_size,
+    )
+
+
+def _profile(profile, dim):
+    profile = profile or PROFILE
+    return replace(profile, dim=dim) if dim is not None and dim != profile.dim else profile
+
+
+def _quantization_name(config):
+    if isinstance(config, models.ScalarQuantization):
+        return "scalar"
+    if isinstance(config, models.BinaryQuantization):
+        return "binary"
+    return "none" if config is None else type(config).__name__
+
+
+def _check_schema(collection, info, profile):
+    vectors = info.config.params.vectors
+    size = getattr(vectors, "size", None)
+    if size is not None and size != profile.dim:
+        raise RuntimeError(
+            f"Qdrant collection '{collection}' stores {size}-dim vectors, expected {profile.dim}"
+        )
+
+    # Quantization and on_disk don't change results, only cost, so a
+    # mismatch is worth a warning but not a refusal to start
+    quantization = _quantization_name(info.config.quantization_config)
+    on_disk = bool(getattr(vectors, "on_disk", False))
+    if quantization != profile.quantization or on_disk != profile.on_disk:
+        print(
+            f"⚠️ Qdrant collection '{collection}' uses quantization={quantization}, on_disk={on_disk}; "
+            f"profile asks for quantization={profile.quantization}, on_disk={profile.on_disk}. "
+            "Recreate the collection to apply it."
+        )
+
+
+def _supports_hybrid(collection, info, profile):
+    if not profile.hybrid:
+        return False
+    if info is None:
+        return True
+    if SPARSE_VECTOR in (info.config.params.sparse_vectors or {}):
+        return True
+    # Sparse vectors can't be added to an existing collection
+    print(
+        f"⚠️ Qdrant collection '{collection}' has no '{SPARSE_VECTOR}' sparse vector; "
+        "searching dense-only. Recreate the collection to enable hybrid search."
+    )
+    return False
+
+
+def _create_kwargs(collection, profile):
+    return dict(
+        collection_name=collection,
+        vectors_config=profile.vectors_config(),
+        sparse_vectors_config=profile.sparse_vectors_config(),
+        quantization_config=profile.quantization_config(),
+    )
+
 
+# Payload fields that filters run on
+INDEXED_FIELDS = ("pdf_id", "content_hash")
+
+
+def _as_list(values):
+    # Ensure ids are a list even if a single ID is passed
+    return [values] if isinstance(values, str) else list(values or [])
+
+
+def _pdf_filter(allowed_pdf_ids, allowed_content_hashes=None):
+    """
+    Matches points owned by any of the PDFs, either directly by pdf_id or,
+    for deduplicated uploads, through the content hash they share. None
+    when there are no owners: searches then return nothing rather than
+    running unfiltered over every user's points, and deletes are no-ops.
+    """
+    conditions = []
+    if allowed_pdf_ids:
+        conditions.append(models.FieldCondition(key="pdf_id", match=models.MatchAny(any=_as_list(allowed_pdf_ids))))
+    if allowed_content_hashes:
+        conditions.append(models.FieldCondition(key="content_hash", match=models.MatchAny(any=_as_list(allowed_content_hashes))))
+
+    if not conditions:
+        return None
+    return models.Filter(should=conditions)
+
+
+def _vector(dense, payload, hybrid):
+    if not hybrid:
+        return dense
+
+    indices, values = sparse.encode_document(payload.get("text") or "")
+    if not indices:
+        return {"": dense}
+    return {"": dense, SPARSE_VECTOR: models.SparseVector(indices=indices, values=values)}
+
+
+def _points(ids, vectors, payloads, hybrid=False):
+    return [
+        models.PointStruct(
+            id=ids[i],
+            vector=_vector(vectors[i], payloads[i], hybrid),
+            payload=payloads[i],
+        )
+        for i in range(len(ids))
+    ]
+
+
+def _query_kwargs(storage, query_vector, query_text, top_k, query_filter):
+    """
+    Arguments for query_points: plain dense search, or when the collection
+    is hybrid and there is query text, dense and BM25 candidates fused with
+    reciprocal rank fusion in the same request.
+    """
+    indices, values = sparse.encode_query(query_text) if storage.hybrid and query_text else ([], [])
+    if not indices:
+        return dict(
+            query=query_vector,
+            query_filter=query_filter,
+            search_params=storage.profile.search_params(),
+            limit=top_k,
+        )
+
+    candidates = top_k * HYBRID_OVERFETCH
+    return dict(
+        prefetch=[
+            models.Prefetch(
+                query=query_vector,
+                filter=query_filter,
+                params=storage.profile.search_params(),
+                limit=candidates,
+            ),
+            models.Prefetch(
+                query=models.SparseVector(indices=indices, values=values),
+                using=SPARSE_VECTOR,
+                filter=query_filter,
+                limit=candidates,
+            ),
+        ],
+        query=models.FusionQuery(fusion=models.Fusion.RRF),
+        query_filter=query_filter,
+        limit=top_k,
+    )
+
+
+def _format_results(payloads):
+    contexts = []
+    sources = set()
+
+    for payload in payloads:
+        payload = payload or {}
+        text = payload.get("text")
+        source = payload.get("source")
+
+        if text:
+            contexts.append(text)
+            if source:
+                sources.add(source)
+
+    return {
+        "contexts": contexts,
+        "sources": list(sources),
+    }
+
+
+def _candidates(points):
+    """
+    Search hits with their dense vectors, for context selection.
+    """
+    candidates = []
+    for p in points:
+        payload = p.payload or {}
+        if not payload.get("text"):
+            continue
+        vector = p.vector.get("") if isinstance(p.vector, dict) else p.vector
+        candidates.append({
+            "text": payload["text"],
+            "source": payload.get("source"),
+            "pdf_id": payload.get("pdf_id"),
+            "content_hash": payload.get("content_hash"),
+            "page": payload.get("page"),
+            "vector": vector,
+        })
+    return candidates
+
+
+def _group_kwargs(storage, query_vector, query_text, limit, per_document, query_filter):
+    """
+    Arguments for query_points_groups: the best `per_document` hits of each
+    of the top limit // per_document PDFs, so no single PDF fills the list.
+    """
+    kwargs = _query_kwargs(storage, query_vector, query_text, limit, query_filter)
+    kwargs.update(group_by="pdf_id", group_size=per_document, limit=max(1, limit // per_document))
+    return kwargs
+
+
+def _grouped_points(results):
+    # Groups come best first; merge their hits back into one ranking
+    return sorted((hit for group in results.groups for hit in group.hits), key=lambda p: p.score, reverse=True)
+
+
+class QdrantStorage:
+    def __init__(self, collection=COLLECTION, dim=None, client=None, profile=None):
+        self.client = client or qdrant_client.QdrantClient(**_client_kwargs())
+        self.collection = collection
+        self.profile = _profile(profile, dim)
+        self.dim = self.profile.dim
+        self.hybrid = False
+        self._ensure_collection()
+
+    def _ensure_collection(self):
+        if self.client.collection_exists(self.collection):
+            info = self.client.get_collection(self.collection)
+            _check_schema(self.collection, info, self.profile)
+        else:
+            self.client.create_collection(**_create_kwargs(self.collection, self.profile))
+            info = None
+
+        self.hybrid = _supports_hybrid(self.collection, info, self.profile)
+        indexed = set(info.payload_schema) if info is not None else set()
+        for field in INDEXED_FIELDS:
+            if field not in indexed:
+                self.client.create_payload_index(
+                    collection_name=self.collection,
+                    field_name=field,
+                    field_schema=models.PayloadSchemaType.KEYWORD, # or .UUID if your IDs are clean UUIDs
+                )
+                print(f"Index created for '{field}' in {self.collection}")
+
+    @observed("qdrant", "upsert")
+    def upsert(self, ids, vectors, payloads):
         self.client.upsert(
             collection_name=self.collection,
-            points=points,
+            points=_points(ids, vectors, payloads, self.hybrid),
         )
 
-    def search(self, query_vector, top_k=5, allowed_pdf_ids=None):
+    @observed("qdrant", "existing_ids")
+    def existing_ids(self, ids) -> set[str]:
+        """
+        Returns the subset of point IDs that are already stored.
+        """
+        if not ids:
+            return set()
+
+        points = self.client.retrieve(
+            collection_name=self.collection,
+            ids=ids,
+            with_payload=False,
+            with_vectors=False,
+        )
+        return {str(p.id) for p in points}
+
+    @observed("qdrant", "fetch_vectors")
+    def fetch_vectors(self, ids) -> list:
+        """
+        Dense vectors of the given points that are stored, in no particular order.
+        """
+        if not ids:
+            return []
+
+        points = self.client.retrieve(
+            collection_name=self.collection,
+            ids=ids,
+            with_payload=False,
+            with_vectors=True,
+        )
+        return [p.vector.get("") if isinstance(p.vector, dict) else p.vector for p in points]
+
+    @observed("qdrant", "search")
+    def search(self, query_vector, top_k=5, allowed_pdf_ids=None, allowed_content_hashes=None, query_text=None):
         """
         Search for context, restricted to specific PDF IDs to ensure data isolation.
+        Passing the question as `query_text` adds BM25 matching, which catches
+        exact identifiers (part numbers, error codes) that embeddings blur.
         """
-        query_filter = None
-        
-        # 🔹 Handle filtering logic
-        if allowed_pdf_ids:
-            # Ensure allowed_pdf_ids is a list even if a single ID is passed
-            ids_to_match = [allowed_pdf_ids] if isinstance(allowed_pdf_ids, str) else allowed_pdf_ids
-            
-            query_filter = Filter(
-                must=[
-                    FieldCondition(
-                        key="pdf_id", 
-                        match=MatchAny(any=ids_to_match)
-                    )
-                ]
-            )
+        query_filter = _pdf_filter(allowed_pdf_ids, allowed_content_hashes)
+        if query_filter is None:
+            return _format_results([])
 
         # Qdrant's modern query API
         results = self.client.query_points(
             collection_name=self.collection,
-            query=query_vector,
-            query_filter=query_filter, 
-            limit=top_k,
             with_payload=True,
+            **_query_kwargs(self, query_vector, query_text, top_k, query_filter),
+        )
+
+        return _format_results(p.payload for p in results.points)
+
+    @observed("qdrant", "search_candidates")
+    def search_candidates(
+        self, query_vector, limit=20, allowed_pdf_ids=None, allowed_content_hashes=None, query_text=None,
+        per_document=None,
+    ):
+        """
+        Like search, but returns the ranked hits with their vectors. With
+        `per_document`, at most that many hits per PDF (one grouped query).
+        """
+        query_filter = _pdf_filter(allowed_pdf_ids, allowed_content_hashes)
+        if query_filter is None:
+            return []
+        if per_document:
+            results = self.client.query_points_groups(
+                collection_name=self.collection,
+                with_payload=True,
+                with_vectors=True,
+                **_group_kwargs(self, query_vector, query_text, limit, per_document, query_filter),
+            )
+            return _candidates(_grouped_points(results))
+
+        results = self.client.query_points(
+            collection_name=self.collection,
+            with_payload=True,
+            with_vectors=True,
+            **_query_kwargs(self, query_vector, query_text, limit, query_filter),
         )
 
-        contexts = []
-        sources = set()
+        return _candidates(results.points)
+
+    @observed("qdrant", "search_owners")
+    def search_owners(self, query_vector, limit=100, allowed_pdf_ids=None, allowed_content_hashes=None):
+        """
+        Dense-only search returning (score, pdf_id, content_hash) per hit,
+        best first. Used on the summary collection to rank documents.
+        """
+        query_filter = _pdf_filter(allowed_pdf_ids, allowed_content_hashes)
+        if query_filter is None:
+            return []
+        results = self.client.query_points(
+            collection_name=self.collection,
+            with_payload=["pdf_id", "content_hash"],
+            **_query_kwargs(self, query_vector, None, limit, query_filter),
+        )
+        return [
+            (p.score, (p.payload or {}).get("pdf_id"), (p.payload or {}).get("content_hash"))
+            for p in results.points
+        ]
+
+    @observed("qdrant", "delete")
+    def delete(self, pdf_ids=None, content_hashes=None):
+        """
+        Removes every point owned by the given PDFs or content hashes.
+        """
+        query_filter = _pdf_filter(pdf_ids, content_hashes)
+        if query_filter is None:
+            return
+
+        self.client.delete(
+            collection_name=self.collection,
+            points_selector=query_filter,
+        )
+
+    @observed("qdrant", "scan_owners")
+    def scan_owners(self, offset=None, limit=1000):
+        """
+        One page of (point_id, pdf_id, content_hash) over the whole
+        collection, plus the offset of the next page (None at the end).
+        """
+        points, next_offset = self.client.scroll(
+            collection_name=self.collection,
+            offset=offset,
+            limit=limit,
+            with_payload=["pdf_id", "content_hash"],
+            with_vectors=False,
+        )
+        owners = [
+            (str(p.id), (p.payload or {}).get("pdf_id"), (p.payload or {}).get("content_hash"))
+            for p in points
+        ]
+        return owners, (str(next_offset) if next_offset is not None else None)
+
+    @observed("qdrant", "delete_ids")
+    def delete_ids(self, ids):
+        if not ids:
+            return
+
+        self.client.delete(
+            collection_name=self.collection,
+            points_selector=models.PointIdsList(points=list(ids)),
+        )
+
+
+class AsyncQdrantStorage:
+    """
+    Same interface as QdrantStorage on top of AsyncQdrantClient, for code
+    running on the event loop. Build it with `await get_async_storage()`.
+    """
+
+    def __init__(self, collection=COLLECTION, dim=None, client=None, profile=None):
+        self.client = client or qdrant_client.AsyncQdrantClient(**_client_kwargs())
+        self.collection = collection
+        self.profile = _profile(profile, dim)
+        self.dim = self.profile.dim
+        self.hybrid = False
+
+    async def _ensure_collection(self):
+        if await self.client.collection_exists(self.collection):
+            info = await self.client.get_collection(self.collection)
+            _check_schema(self.collection, info, self.profile)
+        else:
+            await self.client.create_collection(**_create_kwargs(self.collection, self.profile))
+            info = None
+
+        self.hybrid = _supports_hybrid(self.collection, info, self.profile)
+        indexed = set(info.payload_schema) if info is not None else set()
+        for field in INDEXED_FIELDS:
+            if field not in indexed:
+                await self.client.create_payload_index(
+                    collection_name=self.collection,
+                    field_name=field,
+                    field_schema=models.PayloadSchemaType.KEYWORD,
+                )
+                print(f"Index created for '{field}' in {self.collection}")
+
+    @observed("qdrant", "upsert")
+    async def upsert(self, ids, vectors, payloads):
+        await self.client.upsert(
+            collection_name=self.collection,
+            points=_points(ids, vectors, payloads, self.hybrid),
+        )
+
+    @observed("qdrant", "existing_ids")
+    async def existing_ids(self, ids) -> set[str]:
+        if not ids:
+            return set()
+
+        points = await self.client.retrieve(
+            collection_name=self.collection,
+            ids=ids,
+            with_payload=False,
+            with_vectors=False,
+        )
+        return {str(p.id) for p in points}
+
+    @observed("qdrant", "search")
+    async def search(self, query_vector, top_k=5, allowed_pdf_ids=None, allowed_content_hashes=None, query_text=None):
+        query_filter = _pdf_filter(allowed_pdf_ids, allowed_content_hashes)
+        if query_filter is None:
+            return _format_results([])
+
+        results = await self.client.query_points(
+            collection_name=self.collection,
+            with_payload=True,
+            **_query_kwargs(self, query_vector, query_text, top_k, query_filter),
+        )
+
+        return _format_results(p.payload for p in results.points)
+
+    @observed("qdrant", "search_candidates")
+    async def search_candidates(
+        self, query_vector, limit=20, allowed_pdf_ids=None, allowed_content_hashes=None, query_text=None,
+        per_document=None,
+    ):
+        query_filter = _pdf_filter(allowed_pdf_ids, allowed_content_hashes)
+        if query_filter is None:
+            return []
+        if per_document:
+            results = await self.client.query_points_groups(
+                collection_name=self.collection,
+                with_payload=True,
+                with_vectors=True,
+                **_group_kwargs(self, query_vector, query_text, limit, per_document, query_filter),
+            )
+            return _candidates(_grouped_points(results))
+
+        results = await self.client.query_points(
+            collection_name=self.collection,
+            with_payload=True,
+            with_vectors=True,
+            **_query_kwargs(self, query_vector, query_text, limit, query_filter),
+        )
+
+        return _candidates(results.points)
+
+    @observed("qdrant", "delete")
+    async def delete(self, pdf_ids=None, content_hashes=None):
+        query_filter = _pdf_filter(pdf_ids, content_hashes)
+        if query_filter is None:
+            return
+
+        await self.client.delete(
+            collection_name=self.collection,
+            points_selector=query_filter,
+        )
+
+
+# --------------------------------------------------
+# Process-wide instances
+# --------------------------------------------------
+# One client per process keeps its connection pool warm, and the collection
+# check runs once instead of on every request.
+
+_storage = None
+_storage_lock = threading.Lock()
+_async_storage = None
+_async_storage_lock = None
+_summary_storage = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if VECTOR_BACKEND == "numpy":
+                    from numpy_store import NumpyStorage
+                    _storage = NumpyStorage()
+                else:
+                    _storage = QdrantStorage()
+    return _storage
+
 
-        for r in results.points:
-            payload = r.payload or {}
-            text = payload.get("text")
-            source = payload.get("source")
+def get_summary_storage():
+    """
+    Store of per-document summary vectors: a small dense-only collection
+    next to the chunks, sharing their client.
+    """
+    global _summary_storage
+    if _summary_storage is None:
+        # Before taking the lock, which get_storage() also takes
+        chunks = get_storage()
+        with _storage_lock:
+            if _summary_storage is None:
+                # Summaries have no text, and there are few enough to search exactly
+                profile = replace(PROFILE, quantization="none", on_disk=False, hybrid=False)
+                if VECTOR_BACKEND == "numpy":
+                    from numpy_store import NumpyStorage, NUMPY_SUMMARY_DIR
+                    _summary_storage = NumpyStorage(path=NUMPY_SUMMARY_DIR, profile=profile)
+                else:
+                    _summary_storage = QdrantStorage(SUMMARY_COLLECTION, client=chunks.client, profile=profile)
+    return _summary_storage
 
-            if text:
-                contexts.append(text)
-                if source:
-                    sources.add(source)
 
-        return {
-            "contexts": contexts,
-            "sources": list(sources),
-        }
\ No newline at end of file
+async def get_async_storage():
+    global _async_storage, _async_storage_lock
+    if _async_storage is None:
+        if _async_storage_lock is None:
+            _async_storage_lock = asyncio.Lock()
+        async with _async_storage_lock:
+            if _async_storage is None:
+                if VECTOR_BACKEND == "numpy":
+                    from numpy_store import AsyncNumpyStorage
+                    # Shares the sync store so both see the same segments
+                    _async_storage = AsyncNumpyStorage(get_storage())
+                else:
+                    storage = AsyncQdrantStorage()
+                    await storage._ensure_collection()
+                    _async_storage = storage
+    return _async_storage